@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import NamedTuple
+
+from redis.asyncio import Redis
+
+from queues import get_queue, partition_name, QUEUE_PARTITIONS
+
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница лага партиции очереди: начиная с неё операции отклоняются с 429 (0 — без ограничения)
+QUEUE_HIGH_WATERMARK = int(os.getenv("QUEUE_HIGH_WATERMARK", "100000"))
+# Нижняя граница: после перегрузки операции снова принимаются, когда лаг опустится до неё
+QUEUE_LOW_WATERMARK = int(os.getenv("QUEUE_LOW_WATERMARK", "50000"))
+# Как часто процесс API перечитывает лаг очереди, с (между опросами используется последнее значение)
+QUEUE_SAMPLE_INTERVAL = float(os.getenv("QUEUE_SAMPLE_INTERVAL", "0.5"))
+# Значение Retry-After при перегрузке очереди, с
+QUEUE_RETRY_AFTER = int(os.getenv("QUEUE_RETRY_AFTER", "1"))
+# Ограничение операций одного кошелька: скорость пополнения корзины (операций в секунду, 0 — без
+# ограничения) и её ёмкость (допустимый всплеск)
+WALLET_RATE_LIMIT = float(os.getenv("WALLET_RATE_LIMIT", "0"))
+WALLET_RATE_BURST = int(os.getenv("WALLET_RATE_BURST", "100"))
+# То же для одного клиента
+CLIENT_RATE_LIMIT = float(os.getenv("CLIENT_RATE_LIMIT", "0"))
+CLIENT_RATE_BURST = int(os.getenv("CLIENT_RATE_BURST", "200"))
+# Заголовок, идентифицирующий клиента (например, X-Api-Key); пустое значение — адрес клиента
+RATE_LIMIT_CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER", "")
+
+# Корзины токенов: KEYS — ключи корзин, ARGV — пары (скорость, ёмкость) для каждого ключа.
+# Токен списывается из всех корзин, только если он есть в каждой; иначе возвращается номер
+# корзины с наибольшим ожиданием и само ожидание в секундах (строкой: Redis отбрасывает
+# дробную часть чисел, возвращаемых из Lua). Время берётся из Redis, поэтому часы процессов
+# API не обязаны совпадать.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local available = {}
+local rejected, retry_after = 0, 0
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+    available[i] = tokens
+    if tokens < 1 and (1 - tokens) / rate > retry_after then
+        rejected, retry_after = i, (1 - tokens) / rate
+    end
+end
+if rejected > 0 then
+    return {rejected, tostring(retry_after)}
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', available[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {0, '0'}
+"""
+
+
+class Rejection(NamedTuple):
+    """Причина отказа в приёме операции и через сколько секунд стоит повторить запрос."""
+    reason: str
+    retry_after: float
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class QueueMonitor:
+    """
+    Лаг партиций очереди операций с гистерезисом между QUEUE_HIGH_WATERMARK и QUEUE_LOW_WATERMARK.
+
+    Лаг читается не чаще раза в QUEUE_SAMPLE_INTERVAL секунд: запросы в это время используют
+    последнее значение, а одновременные запросы после истечения интервала ждут один общий опрос.
+    """
+
+    def __init__(self, redis_conn: Redis, high: int = QUEUE_HIGH_WATERMARK, low: int = QUEUE_LOW_WATERMARK,
+                 interval: float = QUEUE_SAMPLE_INTERVAL):
+        self.queues = [get_queue(redis_conn, partition_name(partition)) for partition in range(QUEUE_PARTITIONS)]
+        self.high = high
+        self.low = low
+        self.interval = interval
+        self.backlogs = [0] * QUEUE_PARTITIONS
+        self.overloaded = [False] * QUEUE_PARTITIONS
+        self.sampled_at = float("-inf")
+        self._sampling: asyncio.Future | None = None
+
+    async def sample(self) -> list[int]:
+        """Перечитывает лаг всех партиций и обновляет признаки перегрузки."""
+        backlogs = await asyncio.gather(*(queue.backlog() for queue in self.queues))
+        for partition, backlog in enumerate(backlogs):
+            if backlog >= self.high:
+                if not self.overloaded[partition]:
+                    logger.warning("Queue partition %d is overloaded: backlog %d", partition, backlog)
+                self.overloaded[partition] = True
+            elif backlog <= self.low:
+                self.overloaded[partition] = False
+        self.backlogs = list(backlogs)
+        self.sampled_at = time.monotonic()
+        return self.backlogs
+
+    async def is_overloaded(self, partition: int) -> bool:
+        if self.high <= 0:
+            return False
+        if time.monotonic() - self.sampled_at >= self.interval:
+            if self._sampling is None or self._sampling.done():
+                self._sampling = asyncio.ensure_future(self.sample())
+            try:
+                # shield: отмена одного запроса не должна отменять общий опрос
+                await asyncio.shield(self._sampling)
+            except Exception as e:
+                # Без свежего значения используем последнее: если Redis недоступен, постановка в очередь всё равно упадёт
+                logger.error("Failed to sample queue backlog: %s", e)
+        return self.overloaded[partition]
+
+
+class RateLimiter:
+    """Корзины токенов на кошелёк и на клиента в Redis: одна команда EVALSHA на запрос."""
+
+    def __init__(self, redis_conn: Redis, wallet_limit: tuple[float, int] = (WALLET_RATE_LIMIT, WALLET_RATE_BURST),
+                 client_limit: tuple[float, int] = (CLIENT_RATE_LIMIT, CLIENT_RATE_BURST)):
+        self.wallet_limit = wallet_limit
+        self.client_limit = client_limit
+        self._take = redis_conn.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, wallet_uuid: str, client_id: str) -> Rejection | None:
+        buckets = []
+        if self.wallet_limit[0] > 0:
+            buckets.append(("wallet_rate_limit", f"rate:wallet:{wallet_uuid}", self.wallet_limit))
+        if self.client_limit[0] > 0:
+            buckets.append(("client_rate_limit", f"rate:client:{client_id}", self.client_limit))
+        if not buckets:
+            return None
+
+        rejected, retry_after = await self._take(
+            keys=[key for _, key, _ in buckets],
+            args=[value for _, _, limit in buckets for value in limit],
+        )
+        if int(rejected) == 0:
+            return None
+        return Rejection(buckets[int(rejected) - 1][0], float(retry_after))
+
+
+class AdmissionControl:
+    """Решает, принять ли операцию в очередь: перегрузка партиции, затем лимиты кошелька и клиента."""
+
+    def __init__(self, redis_conn: Redis):
+        self.monitor = QueueMonitor(redis_conn)
+        self.limiter = RateLimiter(redis_conn)
+
+    async def check(self, partition: int, wallet_uuid: str, client_id: str, queued: bool = True) -> Rejection | None:
+        """
+        queued=False — операция выполняется без очереди (mode=sync): проверяются только лимиты частоты,
+        а перегрузка партиции — через check_queue, если операция всё же ставится в очередь.
+        """
+        if queued:
+            rejection = await self.check_queue(partition)
+            if rejection is not None:
+                return rejection
+        return await self.limiter.acquire(wallet_uuid, client_id)
+
+    async def check_queue(self, partition: int) -> Rejection | None:
+        if await self.monitor.is_overloaded(partition):
+            return Rejection("queue_overloaded", QUEUE_RETRY_AFTER)
+        return None
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+from decimal import Decimal
+
+import orjson
+from redis.asyncio import Redis
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который воркер публикует изменения балансов после фиксации транзакции
+BALANCE_CHANNEL = "wallet_balance_updates"
+# Сколько событий может ждать отправки одному подписчику; при переполнении подписчик отключается
+STREAM_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("STREAM_SUBSCRIBER_QUEUE_SIZE", "100"))
+# Максимум подписчиков на процесс API
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "10000"))
+# Максимум кошельков в одной подписке
+STREAM_MAX_WALLETS = int(os.getenv("STREAM_MAX_WALLETS", "100"))
+# Как часто (с) отправлять комментарий-пинг при отсутствии событий, чтобы прокси не закрывали соединение
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+
+
+def balance_event(wallet_uuid: str, balance: Decimal, version: int) -> str:
+    """Событие изменения баланса; version позволяет клиенту отбросить запоздавшее событие."""
+    return orjson.dumps({"wallet_uuid": wallet_uuid, "balance": float(balance), "version": version}).decode()
+
+
+async def publish_balances(redis_conn: Redis, events: list[str]) -> None:
+    """Публикует события изменения балансов одним конвейером."""
+    if not events:
+        return
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        for event in events:
+            pipe.publish(BALANCE_CHANNEL, event)
+        await pipe.execute()
+
+
+class Subscriber:
+    """Подписка одного клиента на изменения балансов нескольких кошельков с ограниченной очередью событий."""
+
+    def __init__(self, wallets: list[str], queue_size: int):
+        self.wallets = wallets
+        self.queue: asyncio.Queue[str] = asyncio.Queue(queue_size)
+        # Клиент не успевал забирать события и отключён; пропущенные события не восстанавливаются
+        self.dropped = False
+
+    def offer(self, event: str) -> bool:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped = True
+            return False
+        return True
+
+    async def get(self, timeout: float) -> str | None:
+        """Следующее событие; None, если за timeout секунд событий не было."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BalanceBroadcaster:
+    """
+    Раздача изменений балансов подписчикам процесса API.
+
+    События приходят через общее pub/sub-соединение процесса (см. pubsub.PubSubHub)
+    и раскладываются по очередям подписчиков кошелька без ожидания. Подписчик, чья очередь
+    переполнена, отключается, чтобы медленный клиент не задерживал остальных и не копил память.
+    """
+
+    def __init__(self, queue_size: int = STREAM_SUBSCRIBER_QUEUE_SIZE, max_subscribers: int = STREAM_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.count = 0
+        self._subscribers: dict[str, set[Subscriber]] = {}
+
+    def subscribe(self, wallets: list[str]) -> Subscriber | None:
+        """Регистрирует подписчика; None, если достигнут предел подписчиков процесса."""
+        if self.count >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(wallets, self.queue_size)
+        for wallet_uuid in wallets:
+            self._subscribers.setdefault(wallet_uuid, set()).add(subscriber)
+        self.count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        removed = False
+        for wallet_uuid in subscriber.wallets:
+            subscribers = self._subscribers.get(wallet_uuid)
+            if subscribers is not None and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                removed = True
+                if not subscribers:
+                    del self._subscribers[wallet_uuid]
+        if removed:
+            self.count -= 1
+
+    def handle_message(self, channel: str, data: str) -> None:
+        if not self._subscribers:
+            return
+        wallet_uuid = orjson.loads(data)["wallet_uuid"]
+        for subscriber in list(self._subscribers.get(wallet_uuid, ())):
+            if not subscriber.offer(data):
+                logger.warning("Dropping slow balance stream subscriber (%d wallets)", len(subscriber.wallets))
+                metrics.STREAM_SUBSCRIBERS_DROPPED.inc()
+                self.unsubscribe(subscriber)
+
+    def drop_all(self) -> None:
+        """
+        Отключает всех подписчиков (после переподключения pub/sub события за время обрыва потеряны;
+        клиенты переподключатся и получат актуальные балансы).
+        """
+        for subscribers in list(self._subscribers.values()):
+            for subscriber in list(subscribers):
+                subscriber.dropped = True
+                # Будим ожидающий поток, чтобы он завершился сразу
+                subscriber.offer("")
+                self.unsubscribe(subscriber)
+
+
+# Подписчики процесса API
+broadcaster = BalanceBroadcaster()
@@ -0,0 +1,122 @@
+"""
+Процессорное время сериализации на одну операцию: прежний JSON против формата wire.py
+для сообщений очереди и ответ через response_model=dict (jsonable_encoder) против ORJSONResponse.
+
+Запросы передаются приложению напрямую через ASGI, без сети, БД и Redis, поэтому разница
+показывает только стоимость сериализации в процессе API.
+
+    python benchmarks/serialization.py --iterations 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+from uuid import uuid4
+
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import OperationType
+from wire import decode_operation, encode_operation
+
+WALLET_UUID = str(uuid4())
+OPERATION_ID = str(uuid4())
+AMOUNT = Decimal("1234.56")
+
+
+def cpu_per_call(call, iterations: int) -> float:
+    """Процессорное время одного вызова, мкс."""
+    started_at = time.process_time()
+    for _ in range(iterations):
+        call()
+    return (time.process_time() - started_at) / iterations * 1e6
+
+
+def encode_json() -> str:
+    return json.dumps({
+        "operation_id": OPERATION_ID,
+        "wallet_uuid": WALLET_UUID,
+        "operation_type": OperationType.DEPOSIT.value,
+        "amount": str(AMOUNT),
+    })
+
+
+def encode_wire() -> str:
+    return encode_operation(OPERATION_ID, WALLET_UUID, OperationType.DEPOSIT, AMOUNT)
+
+
+def build_app() -> FastAPI:
+    """Маршруты чтения баланса в прежнем и новом виде."""
+    app = FastAPI()
+
+    @app.get("/dict/{wallet_uuid}", response_model=dict)
+    async def balance_dict(wallet_uuid: str):
+        return {"wallet_uuid": wallet_uuid, "balance": float(AMOUNT)}
+
+    @app.get("/orjson/{wallet_uuid}")
+    async def balance_orjson(wallet_uuid: str):
+        return ORJSONResponse({"wallet_uuid": wallet_uuid, "balance": float(AMOUNT)})
+
+    return app
+
+
+async def asgi_cpu_per_request(app: FastAPI, path: str, iterations: int) -> float:
+    """Процессорное время обработки одного запроса приложением, мкс."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"host", b"benchmark")], "client": ("127.0.0.1", 1), "server": ("benchmark", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started_at = time.process_time()
+    for _ in range(iterations):
+        await app(scope, receive, send)
+    return (time.process_time() - started_at) / iterations * 1e6
+
+
+async def run(iterations: int) -> dict:
+    json_payload, wire_payload = encode_json(), encode_wire()
+    app = build_app()
+    # Прогрев: первые запросы строят кэши маршрутизации и схем
+    await asgi_cpu_per_request(app, f"/dict/{WALLET_UUID}", 100)
+    await asgi_cpu_per_request(app, f"/orjson/{WALLET_UUID}", 100)
+    return {
+        "queue.encode": (cpu_per_call(encode_json, iterations), cpu_per_call(encode_wire, iterations)),
+        "queue.decode": (
+            cpu_per_call(lambda: decode_operation(json_payload), iterations),
+            cpu_per_call(lambda: decode_operation(wire_payload), iterations),
+        ),
+        "queue.bytes": (len(json_payload), len(wire_payload)),
+        "api.get_balance": (
+            await asgi_cpu_per_request(app, f"/dict/{WALLET_UUID}", iterations),
+            await asgi_cpu_per_request(app, f"/orjson/{WALLET_UUID}", iterations),
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процессорное время сериализации на операцию")
+    parser.add_argument("--iterations", type=int, default=20000, help="Число повторов каждого замера")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations))
+    print(f"{'':>16} {'before':>10} {'after':>10} {'saved':>10}")
+    for name, (before, after) in results.items():
+        unit = "B" if name == "queue.bytes" else "us"
+        print(f"{name:>16} {before:>8.2f}{unit:>2} {after:>8.2f}{unit:>2} {before - after:>8.2f}{unit:>2}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from uuid import UUID
+
+from redis.asyncio import Redis
+
+
+# Время жизни записи о балансе в Redis, с
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+# Размер локального (L1) кэша процесса API; 0 — локальный кэш отключён
+L1_CACHE_SIZE = int(os.getenv("L1_CACHE_SIZE", "0"))
+# Время жизни записи в L1, с — ограничивает устаревание, если сообщение об инвалидации потерялось
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", "5"))
+# Время жизни суммы слотов горячего кошелька в кэше, с. Операции горячего кошелька не меняют
+# его версию и не обновляют кэш, поэтому сумма устаревает не дольше чем на этот срок
+HOT_BALANCE_CACHE_TTL = int(os.getenv("HOT_BALANCE_CACHE_TTL", "1"))
+# Канал, в который публикуются кошельки с изменившимся балансом
+INVALIDATION_CHANNEL = "wallet_cache_invalidate"
+
+# Значение в Redis хранится как "<version>:<balance>". Запись выполняется, только если
+# версия новее сохранённой, — так запоздавшая запись не затирает более свежий баланс.
+# Если передан канал, после записи кошелёк публикуется в него для инвалидации локальных кэшей
+# процессов API (нужно, когда баланс изменился, а не просто заполнен кэш после промаха).
+SET_IF_NEWER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local current_version = tonumber(string.match(current, '^(%d+):'))
+    if current_version and current_version >= tonumber(ARGV[1]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1] .. ':' .. ARGV[2], 'EX', ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('PUBLISH', ARGV[4], ARGV[5])
+end
+return 1
+"""
+
+
+def cache_key(wallet_uuid: UUID | str) -> str:
+    return f"wallet:{wallet_uuid}"
+
+
+def parse_cached(value: str | None) -> tuple[int, Decimal] | None:
+    """Разбирает значение кэша в (version, balance); записи старого формата считаются промахом."""
+    if value is None:
+        return None
+    version, separator, balance = value.partition(":")
+    if not separator:
+        return None
+    return int(version), Decimal(balance)
+
+
+class CacheStats:
+    """Счётчики попаданий кэша балансов в рамках процесса."""
+
+    def __init__(self):
+        self.l1_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def as_dict(self) -> dict:
+        total = self.l1_hits + self.redis_hits + self.misses
+        return {
+            "l1_hits": self.l1_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.l1_hits + self.redis_hits) / total if total else 0.0,
+        }
+
+
+class LocalCache:
+    """Ограниченный LRU-кэш с TTL внутри процесса (L1 перед Redis)."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[str, tuple[float, Decimal]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Decimal | None:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Decimal) -> None:
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+# Локальный кэш и статистика процесса
+local_cache = LocalCache(L1_CACHE_SIZE, L1_CACHE_TTL) if L1_CACHE_SIZE > 0 else None
+stats = CacheStats()
+
+
+def handle_invalidation(channel: str, data: str) -> None:
+    """Обработчик сообщений канала инвалидации (см. pubsub.PubSubHub)."""
+    if local_cache is not None:
+        local_cache.invalidate(cache_key(data))
+
+
+class BalanceCache:
+    """
+    Кэш балансов кошельков: необязательный L1 в памяти процесса и общий Redis.
+
+    Воркер записывает новый баланс после каждого изменения (write-through), роутер —
+    после чтения из БД при промахе. Обе записи защищены версией кошелька.
+    """
+
+    def __init__(self, redis_conn: Redis, local: LocalCache | None = None):
+        self.redis = redis_conn
+        self.local = local
+        self._set_if_newer = redis_conn.register_script(SET_IF_NEWER_SCRIPT)
+
+    async def get(self, wallet_uuid: UUID | str) -> Decimal | None:
+        key = cache_key(wallet_uuid)
+        if self.local is not None:
+            balance = self.local.get(key)
+            if balance is not None:
+                stats.l1_hits += 1
+                return balance
+
+        cached = parse_cached(await self.redis.get(key))
+        if cached is None:
+            stats.misses += 1
+            return None
+        stats.redis_hits += 1
+        if self.local is not None:
+            self.local.set(key, cached[1])
+        return cached[1]
+
+    async def get_many(self, wallet_uuids: list[str]) -> dict[str, Decimal]:
+        """Читает балансы нескольких кошельков: сначала из L1, остальные — одним MGET."""
+        found = {}
+        missing = []
+        for wallet_uuid in wallet_uuids:
+            balance = self.local.get(cache_key(wallet_uuid)) if self.local is not None else None
+            if balance is None:
+                missing.append(wallet_uuid)
+            else:
+                stats.l1_hits += 1
+                found[wallet_uuid] = balance
+        if not missing:
+            return found
+
+        values = await self.redis.mget([cache_key(wallet_uuid) for wallet_uuid in missing])
+        for wallet_uuid, value in zip(missing, values):
+            cached = parse_cached(value)
+            if cached is None:
+                stats.misses += 1
+                continue
+            stats.redis_hits += 1
+            found[wallet_uuid] = cached[1]
+            if self.local is not None:
+                self.local.set(cache_key(wallet_uuid), cached[1])
+        return found
+
+    async def set(self, wallet_uuid: UUID | str, balance: Decimal, version: int, publish: bool = True,
+                  ttl: int = CACHE_TTL) -> bool:
+        """
+        Записывает баланс, если version новее сохранённой. Возвращает True, если запись выполнена.
+        publish=False — заполнение кэша после промаха: баланс не менялся, инвалидировать L1 не нужно.
+        ttl — время жизни записи (HOT_BALANCE_CACHE_TTL для горячих кошельков).
+        """
+        stored = await self._set_if_newer(
+            keys=[cache_key(wallet_uuid)],
+            args=[version, str(balance), ttl, INVALIDATION_CHANNEL if publish else "", str(wallet_uuid)],
+        )
+        if stored and self.local is not None:
+            self.local.set(cache_key(wallet_uuid), balance)
+        return bool(stored)
+
+    async def set_many(self, updates: dict[str, tuple[Decimal, int]], publish: bool = True,
+                       ttl: int = CACHE_TTL) -> None:
+        """
+        Записывает несколько балансов {wallet_uuid: (balance, version)} одним конвейером.
+        publish и ttl — как в set.
+        """
+        if not updates:
+            return
+        channel = INVALIDATION_CHANNEL if publish else ""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for wallet_uuid, (balance, version) in updates.items():
+                await self._set_if_newer(
+                    keys=[cache_key(wallet_uuid)],
+                    args=[version, str(balance), ttl, channel, str(wallet_uuid)],
+                    client=pipe,
+                )
+            await pipe.execute()
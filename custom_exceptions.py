@@ -15,4 +15,9 @@ class WalletCreationError(Exception):
 
 class InvalidOperationTypeError(Exception):
     """Недопустимый тип операции."""
+    pass
+
+
+class DuplicateOperationError(Exception):
+    """Операция с таким идентификатором уже применена."""
     pass
\ No newline at end of file
@@ -1,11 +1,48 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import asyncio
+from contextlib import asynccontextmanager
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 import os
+import time
+
+import metrics
 
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://user:password@db:5432/wallets")
+# Размер пула соединений процесса и сколько соединений можно открыть сверх него при пиковой нагрузке
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Сколько ждать свободного соединения из пула, с
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Через сколько секунд соединение пересоздаётся (-1 — не пересоздаётся)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+# Сколько соединений открывается заранее при запуске процесса
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "5"))
+# DSN реплики для чтения балансов при промахе кэша (пусто — все чтения идут в основную БД)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+# Размер пула соединений с репликой
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", str(DB_POOL_SIZE)))
+
+# Соединения открываются не при импорте, а при первом запросе или прогреве (warm_up_engine)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+)
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+# Пул реплики (только для чтения) с теми же настройками, что и у основного
+replica_engine = create_async_engine(
+    DATABASE_REPLICA_URL,
+    echo=False,
+    pool_size=DB_REPLICA_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+) if DATABASE_REPLICA_URL else None
 
 # Создаем фабрику сессий
 async_session_factory = async_sessionmaker(
@@ -13,6 +50,50 @@ async_session_factory = async_sessionmaker(
     expire_on_commit=False
 )
 
+class TimedSessionFactory:
+    """
+    Фабрика сессий, которая берёт соединение из пула заранее и записывает время ожидания
+    в metrics.DB_POOL_WAIT. Используется так же, как async_sessionmaker: async with factory() as session.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.session_factory = async_sessionmaker(expire_on_commit=False)
+
+    @asynccontextmanager
+    async def __call__(self):
+        started_at = time.perf_counter()
+        async with self.engine.connect() as connection:
+            metrics.DB_POOL_WAIT.labels("sqlalchemy").observe(time.perf_counter() - started_at)
+            async with self.session_factory(bind=connection) as session:
+                yield session
+
+async def warm_up_engine(engine: AsyncEngine, count: int = DB_POOL_MIN_SIZE) -> None:
+    """
+    Открывает count соединений пула одновременно и возвращает их в пул, чтобы первые запросы
+    не ждали установки соединения. SELECT 1 нужен, чтобы соединение с сервером открыл и PgBouncer.
+    """
+    count = min(count, engine.pool.size())
+    remaining = count
+    opened = asyncio.Event()
+
+    async def open_connection():
+        nonlocal remaining
+        try:
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+                remaining -= 1
+                if remaining == 0:
+                    opened.set()
+                # Держим соединение, пока не откроются остальные, иначе пул выдаст его повторно
+                await opened.wait()
+        except Exception:
+            # Не оставляем остальные соединения ждать того, которое не откроется
+            opened.set()
+            raise
+
+    await asyncio.gather(*(open_connection() for _ in range(count)))
+
 # Базовый класс для моделей
 class Base(DeclarativeBase):
     pass
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Разрешает потоковую репликацию для реплики чтения (сервис db-replica, профиль replica).
+# Выполняется образом postgres только при инициализации пустого тома.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
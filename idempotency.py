@@ -0,0 +1,46 @@
+import json
+import os
+
+from redis.asyncio import Redis
+
+
+# Сколько хранится ключ идемпотентности (и отметка о применённой операции в БД), с
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def idempotency_key(key: str) -> str:
+    return f"idempotency:{key}"
+
+
+def request_fingerprint(wallet_uuid: str, operation_type: str, amount: str, target_uuid: str | None = None) -> str:
+    """Отпечаток запроса: повтор с тем же ключом, но другим телом запроса — ошибка клиента."""
+    fingerprint = f"{wallet_uuid}:{operation_type}:{amount}"
+    # Получатель входит в отпечаток только у перевода, отпечатки прочих операций не меняются
+    return f"{fingerprint}:{target_uuid}" if target_uuid else fingerprint
+
+
+async def reserve(redis_conn: Redis, key: str, fingerprint: str, response: dict) -> dict | None:
+    """
+    Атомарно резервирует ключ идемпотентности (SET NX GET), сохраняя ответ на запрос.
+
+    Возвращает None, если ключ зарезервирован этим запросом и операцию нужно ставить в очередь,
+    иначе — запись первого запроса с его отпечатком и ответом. Повтор стоит одной команды Redis.
+    """
+    record = json.dumps({"fingerprint": fingerprint, "response": response})
+    previous = await redis_conn.set(idempotency_key(key), record, nx=True, ex=IDEMPOTENCY_TTL, get=True)
+    return json.loads(previous) if previous is not None else None
+
+
+async def release(redis_conn: Redis, key: str) -> None:
+    """Снимает резерв, если операцию не удалось поставить в очередь."""
+    await redis_conn.delete(idempotency_key(key))
+
+
+async def complete(redis_conn: Redis, key: str, fingerprint: str, response: dict) -> None:
+    """
+    Заменяет ответ, сохранённый при резерве, итоговым (операция выполнена сразу, mode=sync),
+    не продлевая время жизни ключа.
+    """
+    record = json.dumps({"fingerprint": fingerprint, "response": response})
+    await redis_conn.set(idempotency_key(key), record, xx=True, keepttl=True)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import math
+import os
+from typing import Iterable
+
+from redis.asyncio import Redis
+
+import metrics
+from services import get_wallet_uuids
+
+
+logger = logging.getLogger(__name__)
+
+# Ожидаемое число кошельков и допустимая доля ложноположительных ответов фильтра известных кошельков;
+# по ним вычисляются размер битовой карты и число хешей (10 млн кошельков и 1% — около 12 МБ)
+WALLET_FILTER_CAPACITY = int(os.getenv("WALLET_FILTER_CAPACITY", "10000000"))
+WALLET_FILTER_ERROR_RATE = float(os.getenv("WALLET_FILTER_ERROR_RATE", "0.01"))
+# Включён ли фильтр; при выключенном операции и чтения проверяются только отрицательным кэшем
+WALLET_FILTER_ENABLED = os.getenv("WALLET_FILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Сколько кошельков читается из БД за один запрос при построении фильтра
+WALLET_FILTER_REBUILD_BATCH = int(os.getenv("WALLET_FILTER_REBUILD_BATCH", "10000"))
+# Сколько секунд помнить, что кошелька нет в БД (0 — отрицательный кэш выключен)
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "10"))
+# Сколько держится блокировка построения фильтра, с: построение идёт в одном процессе API
+WALLET_FILTER_REBUILD_LOCK_TTL = 600
+
+
+def missing_key(wallet_uuid: str) -> str:
+    return f"wallet_missing:{wallet_uuid}"
+
+
+class KnownWallets:
+    """
+    Проверка существования кошелька до обращения к БД и постановки операции в очередь.
+
+    Фильтр Блума по битовой карте Redis (BITFIELD): кошелёк, для которого хотя бы один бит не выставлен,
+    точно не существует; выставленные биты означают «возможно, существует» — такие запросы идут дальше
+    как обычно. Фильтр дополняется при создании кошельков и достраивается из БД при запуске API.
+    Пока фильтр не построен (нет отметки ready, например после очистки Redis), он ничего не отклоняет.
+
+    Отрицательный кэш запоминает на NEGATIVE_CACHE_TTL секунд кошельки, не найденные в БД
+    (ложноположительные ответы фильтра), чтобы повторные запросы к ним не доходили до БД.
+    """
+
+    def __init__(self, redis_conn: Redis, capacity: int = WALLET_FILTER_CAPACITY,
+                 error_rate: float = WALLET_FILTER_ERROR_RATE, enabled: bool = WALLET_FILTER_ENABLED,
+                 negative_ttl: int = NEGATIVE_CACHE_TTL):
+        self.redis = redis_conn
+        self.enabled = enabled
+        self.negative_ttl = negative_ttl
+        self.bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        if self.bits > 2 ** 32:
+            raise ValueError("WALLET_FILTER_CAPACITY is too large for a Redis bitmap")
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        # Параметры входят в ключ: после их изменения фильтр строится заново
+        self.key = f"wallet_filter:{self.bits}:{self.hashes}"
+        self.ready_key = f"{self.key}:ready"
+        self.lock_key = f"{self.key}:rebuilding"
+
+    def positions(self, wallet_uuid: str) -> list[int]:
+        """Номера битов кошелька: двойное хеширование одного 128-битного blake2b."""
+        digest = hashlib.blake2b(wallet_uuid.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def _bitfield(self, operation: str, wallet_uuids: Iterable[str]) -> list:
+        args = ["BITFIELD", self.key]
+        for wallet_uuid in wallet_uuids:
+            for position in self.positions(wallet_uuid):
+                args.extend((operation, "u1", position) if operation == "GET" else (operation, "u1", position, 1))
+        return args
+
+    async def add(self, wallet_uuids: list[str]) -> None:
+        """
+        Добавляет созданные кошельки в фильтр и удаляет их из отрицательного кэша. Вызывается после
+        фиксации транзакции; если запись не удалась, фильтр помечается непостроенным, чтобы новые
+        кошельки не отклонялись.
+        """
+        if not wallet_uuids:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if self.enabled:
+                    pipe.execute_command(*self._bitfield("SET", wallet_uuids))
+                if self.negative_ttl > 0:
+                    pipe.delete(*(missing_key(wallet_uuid) for wallet_uuid in wallet_uuids))
+                await pipe.execute()
+        except Exception as e:
+            # Кошельки уже созданы, поэтому ошибка не возвращается клиенту
+            logger.error("Error adding %d wallets to the known-wallet filter: %s", len(wallet_uuids), e)
+            await self.invalidate()
+
+    async def invalidate(self) -> None:
+        """Помечает фильтр непостроенным: до следующего построения он ничего не отклоняет."""
+        try:
+            await self.redis.delete(self.ready_key)
+        except Exception as e:
+            logger.error("Error invalidating the known-wallet filter: %s", e)
+
+    async def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ready": bool(await self.redis.exists(self.ready_key)),
+            "rebuilding": bool(await self.redis.exists(self.lock_key)),
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "negative_cache_ttl": self.negative_ttl,
+        }
+
+    async def unknown(self, wallet_uuids: list[str]) -> set[str]:
+        """
+        Кошельки, которых точно нет: не прошедшие фильтр или недавно не найденные в БД.
+        При ошибке Redis проверка пропускается — запрос обрабатывается как без фильтра.
+        """
+        if not self.enabled and self.negative_ttl <= 0:
+            return set()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if self.enabled:
+                    pipe.exists(self.ready_key)
+                    pipe.execute_command(*self._bitfield("GET", wallet_uuids))
+                if self.negative_ttl > 0:
+                    pipe.mget([missing_key(wallet_uuid) for wallet_uuid in wallet_uuids])
+                replies = await pipe.execute()
+        except Exception as e:
+            logger.warning("Known-wallet check failed, skipping it: %s", e)
+            return set()
+
+        unknown = set()
+        if self.enabled:
+            ready, bits = replies[0], replies[1]
+            if ready:
+                for i, wallet_uuid in enumerate(wallet_uuids):
+                    if not all(bits[i * self.hashes:(i + 1) * self.hashes]):
+                        unknown.add(wallet_uuid)
+            if unknown:
+                metrics.UNKNOWN_WALLETS_REJECTED.labels("filter").inc(len(unknown))
+        if self.negative_ttl > 0:
+            cached = {wallet_uuid for wallet_uuid, value in zip(wallet_uuids, replies[-1]) if value is not None}
+            if cached - unknown:
+                metrics.UNKNOWN_WALLETS_REJECTED.labels("negative_cache").inc(len(cached - unknown))
+            unknown |= cached
+        return unknown
+
+    async def remember_missing(self, wallet_uuids: list[str]) -> None:
+        """Запоминает кошельки, не найденные в БД, на negative_ttl секунд."""
+        if self.negative_ttl <= 0 or not wallet_uuids:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for wallet_uuid in wallet_uuids:
+                    pipe.set(missing_key(wallet_uuid), 1, ex=self.negative_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Error caching %d missing wallets: %s", len(wallet_uuids), e)
+
+    async def rebuild(self, session_factory, batch_size: int = WALLET_FILTER_REBUILD_BATCH) -> int | None:
+        """
+        Добавляет в фильтр все кошельки из БД постранично и отмечает фильтр построенным.
+        Биты только добавляются, поэтому кошельки, созданные во время построения, не теряются,
+        а уже построенный фильтр продолжает работать. Одновременно строит один процесс;
+        возвращает число добавленных кошельков или None, если построение идёт в другом процессе.
+        """
+        if not self.enabled:
+            return None
+        if not await self.redis.set(self.lock_key, 1, nx=True, ex=WALLET_FILTER_REBUILD_LOCK_TTL):
+            return None
+        try:
+            added = 0
+            after = None
+            while True:
+                async with session_factory() as db_session:
+                    wallet_uuids = await get_wallet_uuids(db_session, after, batch_size)
+                if not wallet_uuids:
+                    break
+                await self.redis.execute_command(*self._bitfield("SET", wallet_uuids))
+                added += len(wallet_uuids)
+                after = wallet_uuids[-1]
+            await self.redis.set(self.ready_key, 1)
+            return added
+        finally:
+            await self.redis.delete(self.lock_key)
@@ -0,0 +1,6 @@
+--liquibase formatted sql
+--changeset yourname:003-add-wallet-version
+
+ALTER TABLE wallet ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+--rollback ALTER TABLE wallet DROP COLUMN IF EXISTS version;
\ No newline at end of file
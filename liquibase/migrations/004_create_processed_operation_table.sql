@@ -0,0 +1,12 @@
+--liquibase formatted sql
+--changeset yourname:004-create-processed-operation-table
+
+CREATE TABLE IF NOT EXISTS processed_operation
+(
+    operation_id    UUID        PRIMARY KEY,
+    processed_at    TIMESTAMP   NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_processed_operation_processed_at ON processed_operation(processed_at);
+
+--rollback DROP TABLE IF EXISTS processed_operation;
\ No newline at end of file
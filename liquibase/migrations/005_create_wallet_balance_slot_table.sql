@@ -0,0 +1,20 @@
+--liquibase formatted sql
+--changeset yourname:005-create-wallet-balance-slot-table
+
+-- Число слотов «горячего» кошелька; 0 — обычный кошелёк, баланс хранится в wallet.balance
+ALTER TABLE wallet ADD COLUMN IF NOT EXISTS hot_slots SMALLINT NOT NULL DEFAULT 0;
+
+-- Баланс горячего кошелька — сумма его слотов (wallet.balance при этом равен 0)
+CREATE TABLE IF NOT EXISTS wallet_balance_slot
+(
+    wallet_uuid     UUID            NOT NULL,
+    slot            SMALLINT        NOT NULL,
+    balance         NUMERIC(20, 2)  NOT NULL DEFAULT 0 CHECK (balance >= 0),
+    PRIMARY KEY (wallet_uuid, slot)
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_hot ON wallet(wallet_uuid) WHERE hot_slots > 0;
+
+--rollback DROP TABLE IF EXISTS wallet_balance_slot;
+--rollback DROP INDEX IF EXISTS idx_wallet_hot;
+--rollback ALTER TABLE wallet DROP COLUMN IF EXISTS hot_slots;
@@ -0,0 +1,51 @@
+--liquibase formatted sql
+--changeset yourname:006-create-wallet-apply-operation-function splitStatements:false
+
+-- Применяет операцию к обычному кошельку одним вызовом и возвращает исход:
+-- ok (с новым балансом и версией), duplicate, insufficient_funds, not_found или hot
+-- (горячий кошелёк, операцию нужно применить к его слотам отдельно).
+-- p_delta — сумма со знаком: положительная для DEPOSIT, отрицательная для WITHDRAW.
+CREATE OR REPLACE FUNCTION wallet_apply_operation(p_wallet_uuid UUID, p_delta NUMERIC, p_operation_id UUID)
+    RETURNS TABLE (outcome TEXT, balance NUMERIC, version BIGINT)
+    LANGUAGE plpgsql
+AS
+$$
+#variable_conflict use_column
+BEGIN
+    IF p_operation_id IS NOT NULL THEN
+        INSERT INTO processed_operation (operation_id) VALUES (p_operation_id) ON CONFLICT DO NOTHING;
+        IF NOT FOUND THEN
+            RETURN QUERY SELECT 'duplicate'::TEXT, NULL::NUMERIC, NULL::BIGINT;
+            RETURN;
+        END IF;
+    END IF;
+
+    RETURN QUERY
+        UPDATE wallet AS w
+        SET balance    = w.balance + p_delta,
+            version    = w.version + 1,
+            updated_at = NOW()
+        WHERE w.wallet_uuid = p_wallet_uuid
+          AND w.hot_slots = 0
+          AND w.balance + p_delta >= 0
+        RETURNING 'ok'::TEXT, w.balance, w.version;
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    -- Операция не применена: снимаем отметку, чтобы повтор обрабатывался заново
+    IF p_operation_id IS NOT NULL THEN
+        DELETE FROM processed_operation WHERE operation_id = p_operation_id;
+    END IF;
+
+    RETURN QUERY
+        SELECT CASE WHEN w.hot_slots > 0 THEN 'hot' ELSE 'insufficient_funds' END, w.balance, w.version
+        FROM wallet AS w
+        WHERE w.wallet_uuid = p_wallet_uuid;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'not_found'::TEXT, NULL::NUMERIC, NULL::BIGINT;
+    END IF;
+END;
+$$;
+
+--rollback DROP FUNCTION IF EXISTS wallet_apply_operation(UUID, NUMERIC, UUID);
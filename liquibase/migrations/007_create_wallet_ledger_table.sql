@@ -0,0 +1,31 @@
+--liquibase formatted sql
+--changeset yourname:007-create-wallet-ledger-table
+
+-- Журнал изменений балансов: строки только добавляются, по строке на каждое изменение баланса
+-- кошелька (перевод — две строки). amount — сумма со знаком, поэтому баланс кошелька равен
+-- последнему снимку (wallet_balance_snapshot) плюс сумма строк после него.
+-- Таблица секционирована по месяцам created_at: свежие секции небольшие, а старые можно
+-- отсоединить и архивировать целиком (ALTER TABLE ... DETACH PARTITION) без DELETE.
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования.
+CREATE TABLE IF NOT EXISTS wallet_ledger
+(
+    id                  BIGSERIAL       NOT NULL,
+    wallet_uuid         UUID            NOT NULL,
+    -- INITIAL (начальный баланс), DEPOSIT, WITHDRAW или TRANSFER
+    entry_type          VARCHAR(16)     NOT NULL,
+    amount              NUMERIC(20, 2)  NOT NULL,
+    -- Операция из очереди (GET /api/v1/operations/{operation_id}); NULL у начального баланса
+    operation_id        UUID,
+    -- Второй кошелёк перевода
+    counterparty_uuid   UUID,
+    created_at          TIMESTAMP       NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- История кошелька читается постранично по (wallet_uuid, id); индекс создаётся в каждой секции
+CREATE INDEX IF NOT EXISTS idx_wallet_ledger_wallet_id ON wallet_ledger(wallet_uuid, id);
+
+-- Строки, для месяца которых секция ещё не создана (см. wallet_ledger_create_partitions)
+CREATE TABLE IF NOT EXISTS wallet_ledger_default PARTITION OF wallet_ledger DEFAULT;
+
+--rollback DROP TABLE IF EXISTS wallet_ledger;
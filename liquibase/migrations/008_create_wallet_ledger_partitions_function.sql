@@ -0,0 +1,37 @@
+--liquibase formatted sql
+--changeset yourname:008-create-wallet-ledger-partitions-function splitStatements:false
+
+-- Создаёт месячные секции wallet_ledger с текущего месяца на p_months_ahead месяцев вперёд
+-- и возвращает число созданных. Вызывается воркером периодически (см. worker.maintain_wallet_ledger),
+-- чтобы строки не попадали в секцию по умолчанию: секцию для месяца, строки которого уже лежат
+-- в секции по умолчанию, создать нельзя.
+CREATE OR REPLACE FUNCTION wallet_ledger_create_partitions(p_months_ahead INTEGER)
+    RETURNS INTEGER
+    LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    month_start     DATE;
+    partition_name  TEXT;
+    created         INTEGER := 0;
+BEGIN
+    -- Несколько воркеров не должны создавать одну секцию одновременно
+    PERFORM pg_advisory_xact_lock(hashtext('wallet_ledger_create_partitions'));
+    FOR i IN 0..p_months_ahead LOOP
+        month_start := (date_trunc('month', NOW()) + make_interval(months => i))::DATE;
+        partition_name := 'wallet_ledger_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF wallet_ledger FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+SELECT wallet_ledger_create_partitions(2);
+
+--rollback DROP FUNCTION IF EXISTS wallet_ledger_create_partitions(INTEGER);
@@ -0,0 +1,29 @@
+--liquibase formatted sql
+--changeset yourname:009-create-wallet-balance-snapshot-table
+
+-- Снимок баланса кошелька: balance включает все строки журнала кошелька с id <= ledger_id.
+-- Баланс на момент времени — последний снимок до него плюс строки журнала после снимка
+-- (см. services.get_balance_at). Снимки пишет воркер (см. services.take_balance_snapshots).
+CREATE TABLE IF NOT EXISTS wallet_balance_snapshot
+(
+    wallet_uuid     UUID            NOT NULL,
+    ledger_id       BIGINT          NOT NULL,
+    balance         NUMERIC(20, 2)  NOT NULL,
+    taken_at        TIMESTAMP       NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (wallet_uuid, ledger_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_balance_snapshot_taken_at ON wallet_balance_snapshot(wallet_uuid, taken_at);
+
+-- Изменения до появления журнала не записаны: текущие балансы становятся начальными снимками
+INSERT INTO wallet_balance_snapshot (wallet_uuid, ledger_id, balance)
+SELECT w.wallet_uuid,
+       0,
+       CASE WHEN w.hot_slots > 0
+            THEN (SELECT COALESCE(SUM(s.balance), 0) FROM wallet_balance_slot s WHERE s.wallet_uuid = w.wallet_uuid)
+            ELSE w.balance
+       END
+FROM wallet w
+ON CONFLICT DO NOTHING;
+
+--rollback DROP TABLE IF EXISTS wallet_balance_snapshot;
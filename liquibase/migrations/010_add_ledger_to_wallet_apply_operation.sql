@@ -0,0 +1,59 @@
+--liquibase formatted sql
+--changeset yourname:010-add-ledger-to-wallet-apply-operation splitStatements:false
+
+-- wallet_apply_operation из 006 с записью в журнал wallet_ledger в той же транзакции.
+-- p_reference — идентификатор операции для журнала (у операций без Idempotency-Key
+-- p_operation_id не передаётся, но операция в журнале всё равно связана со своим результатом).
+DROP FUNCTION IF EXISTS wallet_apply_operation(UUID, NUMERIC, UUID);
+
+CREATE OR REPLACE FUNCTION wallet_apply_operation(p_wallet_uuid UUID, p_delta NUMERIC, p_operation_id UUID,
+                                                  p_reference UUID DEFAULT NULL)
+    RETURNS TABLE (outcome TEXT, balance NUMERIC, version BIGINT)
+    LANGUAGE plpgsql
+AS
+$$
+#variable_conflict use_column
+DECLARE
+    new_balance NUMERIC;
+    new_version BIGINT;
+BEGIN
+    IF p_operation_id IS NOT NULL THEN
+        INSERT INTO processed_operation (operation_id) VALUES (p_operation_id) ON CONFLICT DO NOTHING;
+        IF NOT FOUND THEN
+            RETURN QUERY SELECT 'duplicate'::TEXT, NULL::NUMERIC, NULL::BIGINT;
+            RETURN;
+        END IF;
+    END IF;
+
+    UPDATE wallet AS w
+    SET balance    = w.balance + p_delta,
+        version    = w.version + 1,
+        updated_at = NOW()
+    WHERE w.wallet_uuid = p_wallet_uuid
+      AND w.hot_slots = 0
+      AND w.balance + p_delta >= 0
+    RETURNING w.balance, w.version INTO new_balance, new_version;
+    IF FOUND THEN
+        INSERT INTO wallet_ledger (wallet_uuid, entry_type, amount, operation_id)
+        VALUES (p_wallet_uuid, CASE WHEN p_delta >= 0 THEN 'DEPOSIT' ELSE 'WITHDRAW' END, p_delta,
+                COALESCE(p_reference, p_operation_id));
+        RETURN QUERY SELECT 'ok'::TEXT, new_balance, new_version;
+        RETURN;
+    END IF;
+
+    -- Операция не применена: снимаем отметку, чтобы повтор обрабатывался заново
+    IF p_operation_id IS NOT NULL THEN
+        DELETE FROM processed_operation WHERE operation_id = p_operation_id;
+    END IF;
+
+    RETURN QUERY
+        SELECT CASE WHEN w.hot_slots > 0 THEN 'hot' ELSE 'insufficient_funds' END, w.balance, w.version
+        FROM wallet AS w
+        WHERE w.wallet_uuid = p_wallet_uuid;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'not_found'::TEXT, NULL::NUMERIC, NULL::BIGINT;
+    END IF;
+END;
+$$;
+
+--rollback DROP FUNCTION IF EXISTS wallet_apply_operation(UUID, NUMERIC, UUID, UUID);
@@ -1,7 +1,145 @@
 import asyncio
-from fastapi import FastAPI
-from routers import router
+import logging
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
+
+import balance_events
+import cache
+import metrics
+import profiling
+import results
+from known_wallets import KnownWallets
+from pubsub import PubSubHub
+from queues import get_queue, partition_name, QUEUE_PARTITIONS
+from resources import open_resources, warm_up_cache
+from retries import DeadLetterQueue, RetryScheduler
+import routers
+from routers import router, operations_router, admin_router, get_redis, get_balance_cache
+
+
+logger = logging.getLogger(__name__)
+
+# Общее pub/sub-соединение процесса
+pubsub_hub: PubSubHub | None = None
+
+
+async def rebuild_wallet_filter(known: KnownWallets, session_factory) -> None:
+    """Достраивает фильтр известных кошельков из БД в фоне, не задерживая запуск API."""
+    try:
+        added = await known.rebuild(session_factory)
+        if added is not None:
+            logger.info("Known-wallet filter rebuilt with %d wallets", added)
+    except Exception as e:
+        # Непостроенный фильтр ничего не отклоняет
+        logger.error("Known-wallet filter rebuild failed: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Открывает и прогревает пулы БД и Redis до приёма первого запроса, загружает в кэш балансы
+    последних активных кошельков, запускает построение фильтра известных кошельков и общее
+    pub/sub-соединение; при остановке всё закрывает.
+    """
+    global pubsub_hub
+    async with open_resources() as resources:
+        routers.redis_client = resources.redis
+        routers.wallet_repository = resources.repository
+        routers.known_wallets = KnownWallets(resources.redis)
+        # Фильтр известных кошельков достраивается в фоне; до отметки ready он ничего не отклоняет
+        wallet_filter_tasks = [
+            asyncio.create_task(rebuild_wallet_filter(routers.known_wallets, resources.session_factory))
+        ]
+        try:
+            warmed = await warm_up_cache(resources.session_factory, await get_balance_cache(resources.redis))
+            logger.info("Balance cache warmed up with %d wallets", warmed)
+        except Exception as e:
+            # Без прогрева кэш заполнится при первых чтениях
+            logger.error("Balance cache warm-up failed: %s", e)
+
+        await profiling.load_settings(resources.redis)
+        pubsub_hub = PubSubHub(resources.redis)
+        # Настройки профилирования, изменённые через PUT /api/v1/admin/profiling
+        pubsub_hub.subscribe(profiling.PROFILING_CHANNEL, profiling.handle_settings_message)
+        # Результаты операций для long-poll запросов
+        pubsub_hub.subscribe(results.RESULT_CHANNEL, results.waiter.handle_message)
+        # Изменения балансов для подписчиков потока /api/v1/wallets/stream; события за время
+        # обрыва соединения потеряны, поэтому после переподключения подписчики отключаются
+        pubsub_hub.subscribe(balance_events.BALANCE_CHANNEL, balance_events.broadcaster.handle_message)
+        pubsub_hub.on_reconnect(balance_events.broadcaster.drop_all)
+        if cache.local_cache is not None:
+            # Инвалидация локального кэша при изменении баланса воркером
+            pubsub_hub.subscribe(cache.INVALIDATION_CHANNEL, cache.handle_invalidation)
+            pubsub_hub.on_reconnect(cache.local_cache.clear)
+        pubsub_hub.start()
+        # /metrics на общем порту попадает в случайный процесс gunicorn, поэтому у каждого процесса
+        # свой порт экспортёра (см. metrics.API_METRICS_PORT)
+        metrics_server = None
+        if metrics.API_METRICS_PORT:
+            metrics_server = await metrics.start_http_server_on_free_port(
+                metrics.API_METRICS_PORT, metrics.API_METRICS_PORTS
+            )
+        try:
+            yield
+        finally:
+            if metrics_server is not None:
+                metrics_server.close()
+            await pubsub_hub.stop()
+            pubsub_hub = None
+            if routers.wallet_filter_rebuild is not None:
+                wallet_filter_tasks.append(routers.wallet_filter_rebuild)
+            # Построение снимает свою блокировку, пока соединения с Redis открыты
+            for task in wallet_filter_tasks:
+                task.cancel()
+            await asyncio.gather(*wallet_filter_tasks, return_exceptions=True)
+            routers.known_wallets = None
+            routers.wallet_filter_rebuild = None
+            routers.redis_client = None
+            routers.wallet_repository = None
+            routers.balance_cache = None
+            routers.admission_control = None
+            routers.read_router = None
+            routers.latency_budget = None
+
+
+# Ответы без явного класса (статусы операций, служебные маршруты) также сериализуются orjson
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
+# Семплирующий профилировщик доли запросов (выключен, пока PROFILE_SAMPLE_RATE = 0)
+app.add_middleware(profiling.ProfilingMiddleware)
 
 app.include_router(router)
+app.include_router(operations_router)
+app.include_router(admin_router)
+
+
+async def collect_metrics():
+    """
+    Обновляет метрики, которые читаются в момент запроса /metrics: лаг очереди, отложенные повторы,
+    dead letter, подписчики потока балансов и счётчики кэша.
+    """
+    redis_conn = await get_redis()
+    lengths = await asyncio.gather(*(
+        get_queue(redis_conn, partition_name(partition)).backlog() for partition in range(QUEUE_PARTITIONS)
+    ))
+    for partition, length in enumerate(lengths):
+        metrics.QUEUE_LENGTH.labels(str(partition)).set(length)
+    metrics.RETRY_SCHEDULED.set(await RetryScheduler(redis_conn).size())
+    metrics.DEAD_LETTER_LENGTH.set(await DeadLetterQueue(redis_conn).length())
+    metrics.STREAM_SUBSCRIBERS.set(balance_events.broadcaster.count)
+    metrics.CACHE_REQUESTS.labels("l1_hit").value = cache.stats.l1_hits
+    metrics.CACHE_REQUESTS.labels("redis_hit").value = cache.stats.redis_hits
+    metrics.CACHE_REQUESTS.labels("miss").value = cache.stats.misses
+
+metrics.REGISTRY.add_collector(collect_metrics)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """
+    Метрики процесса API в текстовом формате Prometheus. При нескольких процессах gunicorn
+    метрики собираются с их экспортёров (API_METRICS_PORT), а не с этого маршрута.
+    """
+    return Response(await metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
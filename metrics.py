@@ -0,0 +1,309 @@
+import asyncio
+import bisect
+import logging
+import os
+import time
+from typing import Awaitable, Callable
+
+
+logger = logging.getLogger(__name__)
+
+# Порт HTTP-экспортёра метрик воркера (0 — экспортёр отключён)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+# Первый порт экспортёров метрик процессов API (0 — отключено): каждый процесс gunicorn занимает
+# первый свободный порт из API_METRICS_PORT ... API_METRICS_PORT + API_METRICS_PORTS - 1
+API_METRICS_PORT = int(os.getenv("API_METRICS_PORT", "0"))
+API_METRICS_PORTS = int(os.getenv("API_METRICS_PORTS", "16"))
+
+# Границы корзин гистограмм задержек, с
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramValue:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """
+    Метрика с набором меток. Значения хранятся в памяти процесса и изменяются без блокировок:
+    весь код процесса выполняется в одном цикле событий, а обновление — несколько операций
+    над числами без await, поэтому его не может прервать другая корутина.
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self, labels: tuple[str, ...], child) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {child.value}"]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for labels, child in list(self._children.items()):
+            lines.extend(self._samples(labels, child))
+        return lines
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return CounterValue()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return GaugeValue()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS, registry=None):
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self, labels: tuple[str, ...], child: HistogramValue) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {child.sum}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Timer:
+    """Контекстный менеджер, записывающий длительность блока в гистограмму (или её дочернюю метрику)."""
+
+    __slots__ = ("histogram", "started_at")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started_at)
+
+
+class Registry:
+    """
+    Набор метрик процесса и их вывод в текстовом формате Prometheus.
+    Сборщики (collectors) вызываются перед выводом, чтобы обновить метрики,
+    значения которых дешевле прочитать в момент запроса (длина очереди, счётчики кэша).
+    """
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors: list[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]) -> None:
+        self.collectors.append(collector)
+
+    async def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logger.error("Metrics collector failed: %s", e)
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Метрики API
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Длительность обработки HTTP-запроса", ("method", "route", "status")
+)
+BALANCE_LOOKUP_DURATION = Histogram(
+    "wallet_balance_lookup_seconds", "Длительность обращений к кэшу (L1 и Redis) и БД при чтении баланса", ("source",)
+)
+QUEUE_LENGTH = Gauge(
+    "operation_queue_length", "Число необработанных сообщений (лаг) в партиции очереди операций", ("partition",)
+)
+RETRY_SCHEDULED = Gauge("operation_retry_scheduled", "Операции, ожидающие повтора после временной ошибки")
+DEAD_LETTER_LENGTH = Gauge("operation_dead_letter_length", "Записи в стриме dead letter")
+OPERATIONS_REJECTED = Counter(
+    "wallet_operations_rejected_total", "Операции, отклонённые с 429, по причине", ("reason",)
+)
+DB_READS = Counter(
+    "wallet_db_reads_total", "Чтения балансов из БД по источнику: replica, primary или fallback", ("target",)
+)
+REPLICA_LAG = Gauge("db_replica_lag_seconds", "Последнее измеренное отставание реплики (-1 — реплика недоступна)")
+STREAM_SUBSCRIBERS = Gauge("balance_stream_subscribers", "Подписчики потока изменений балансов процесса API")
+STREAM_SUBSCRIBERS_DROPPED = Counter(
+    "balance_stream_subscribers_dropped_total", "Подписчики, отключённые из-за переполнения очереди событий"
+)
+CACHE_REQUESTS = Counter("wallet_cache_requests_total", "Обращения к кэшу балансов по результату", ("result",))
+UNKNOWN_WALLETS_REJECTED = Counter(
+    "wallet_unknown_rejected_total",
+    "Запросы к несуществующим кошелькам, отклонённые без обращения к БД: filter или negative_cache", ("source",)
+)
+REQUESTS_PROFILED = Counter("http_requests_profiled_total", "HTTP-запросы, снятые семплирующим профилировщиком")
+SYNC_OPERATIONS = Counter(
+    "wallet_sync_operations_total",
+    "Операции mode=sync по исходу: completed, insufficient_funds, not_found, error или queued (поставлена в очередь)",
+    ("outcome",)
+)
+SYNC_OPERATION_DURATION = Histogram(
+    "wallet_sync_operation_seconds", "Длительность синхронного выполнения операции, включая ожидание соединения"
+)
+
+# Метрики воркера
+DEQUEUE_TO_COMMIT = Histogram(
+    "worker_dequeue_to_commit_seconds", "Время от получения пачки из очереди до фиксации транзакции"
+)
+WORKER_OPERATIONS = Counter("worker_operations_total", "Обработанные воркером операции по исходу", ("outcome",))
+OPERATIONS_RETRIED = Counter(
+    "worker_operations_retried_total", "Операции, отложенные для повтора после временной ошибки"
+)
+OPERATIONS_DEAD_LETTERED = Counter(
+    "worker_operations_dead_lettered_total", "Операции, отправленные в dead letter, по причине", ("reason",)
+)
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Ожидание соединения из пула БД", ("pool",))
+SLOW_QUERIES = Counter("db_slow_queries_total", "SQL-запросы не быстрее порога SLOW_QUERY_MS")
+WORKER_BATCH_STAGE_DURATION = Histogram(
+    "worker_batch_stage_seconds", "Длительность этапов обработки пачки воркером (при включённых замерах)", ("stage",)
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware, измеряющее длительность запросов по шаблону маршрута
+    (например, /api/v1/wallets/{wallet_uuid}), чтобы число рядов не зависело от идентификаторов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], route.path if route is not None else "unmatched", status
+            ).observe(time.perf_counter() - started_at)
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        # Запрос не разбирается: экспортёр на любой путь отвечает метриками
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        body = (await REGISTRY.render()).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            + f"Content-Type: {CONTENT_TYPE}; charset=utf-8\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_http_server(port: int) -> asyncio.AbstractServer:
+    """Запускает минимальный HTTP-экспортёр метрик процесса (для воркера, у которого нет FastAPI)."""
+    server = await asyncio.start_server(_serve_metrics, "0.0.0.0", port)
+    logger.info("Metrics exporter listening on port %d", port)
+    return server
+
+
+async def start_http_server_on_free_port(first_port: int, ports: int) -> asyncio.AbstractServer | None:
+    """
+    Запускает экспортёр метрик на первом свободном порту из first_port ... first_port + ports - 1.
+    Так у каждого процесса gunicorn, которые не знают своего номера, свой постоянный адрес метрик:
+    перезапущенный процесс занимает освободившийся порт. None — все порты заняты.
+    """
+    for port in range(first_port, first_port + ports):
+        try:
+            return await start_http_server(port)
+        except OSError:
+            continue
+    logger.error("No free metrics port in %d-%d", first_port, first_port + ports - 1)
+    return None
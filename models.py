@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Numeric, String, TIMESTAMP, ForeignKey, func
+from sqlalchemy import BigInteger, Column, Numeric, SmallInteger, String, TIMESTAMP, ForeignKey, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -13,6 +13,19 @@ class Wallet(Base):
     balance = Column(Numeric(20, 2), nullable=False, default=0)
     created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
     updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
+    # Увеличивается при каждом изменении баланса; защищает кэш от записи устаревшего значения
+    version = Column(BigInteger, nullable=False, server_default="0")
+    # Число слотов горячего кошелька (0 — обычный кошелёк), см. WalletBalanceSlot
+    hot_slots = Column(SmallInteger, nullable=False, server_default="0")
+
+
+class WalletBalanceSlot(Base):
+    """Часть баланса горячего кошелька: операции распределяются по слотам, чтобы не ждать блокировку одной строки."""
+    __tablename__ = "wallet_balance_slot"
+
+    wallet_uuid = Column(UUID(as_uuid=True), primary_key=True)
+    slot = Column(SmallInteger, primary_key=True)
+    balance = Column(Numeric(20, 2), nullable=False, default=0)
 
 
 
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis для координации воркеров
+MEMBERS_KEY = os.getenv("WORKER_MEMBERS_KEY", "worker_members")
+LEASE_KEY_PREFIX = "partition_lease"
+# Воркер считается живым, пока его heartbeat не старше WORKER_MEMBER_TTL секунд
+WORKER_MEMBER_TTL = float(os.getenv("WORKER_MEMBER_TTL", "10"))
+# Время жизни аренды партиции; продлевается на каждом шаге ребалансировки
+PARTITION_LEASE_TTL = float(os.getenv("PARTITION_LEASE_TTL", "10"))
+# Как часто (с) воркер обновляет heartbeat, продлевает аренды и пересчитывает назначение партиций
+REBALANCE_INTERVAL = float(os.getenv("REBALANCE_INTERVAL", "2"))
+
+# Продление и освобождение аренды только её владельцем
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def partition_owner(partition: int, members: list[str]) -> str:
+    """
+    Выбирает владельца партиции по rendezvous-хешированию: при добавлении или уходе
+    воркера переезжают только партиции, которые этот воркер получает или отдаёт.
+    """
+    def weight(member: str) -> bytes:
+        return hashlib.blake2b(f"{member}:{partition}".encode(), digest_size=8).digest()
+    return max(members, key=weight)
+
+
+class PartitionCoordinator:
+    """
+    Распределяет партиции очереди между живыми воркерами.
+
+    Каждый воркер периодически пишет heartbeat в sorted set участников и по списку живых
+    участников вычисляет свои партиции. Партиция обрабатывается только при наличии аренды
+    (SET NX PX), поэтому при ребалансировке новый владелец начинает чтение лишь после того,
+    как прежний закончил текущую пачку и освободил аренду (или аренда истекла после его падения).
+    Так операции одного кошелька никогда не обрабатываются двумя воркерами одновременно.
+    """
+
+    def __init__(
+            self,
+            redis_conn: Redis,
+            partitions_count: int,
+            static_partitions: set[int] | None = None,
+            member_id: str | None = None,
+    ):
+        self.redis = redis_conn
+        self.partitions_count = partitions_count
+        self.static_partitions = static_partitions
+        self.member_id = member_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._renew = self.redis.register_script(RENEW_LEASE_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_LEASE_SCRIPT)
+
+    @staticmethod
+    def lease_key(partition: int) -> str:
+        return f"{LEASE_KEY_PREFIX}:{partition}"
+
+    async def desired_partitions(self) -> set[int]:
+        """Обновляет heartbeat и возвращает партиции, которые должен обрабатывать этот воркер."""
+        if self.static_partitions is not None:
+            return self.static_partitions
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(MEMBERS_KEY, {self.member_id: now})
+            pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now - WORKER_MEMBER_TTL)
+            pipe.zrange(MEMBERS_KEY, 0, -1)
+            _, _, members = await pipe.execute()
+        return {
+            partition for partition in range(self.partitions_count)
+            if partition_owner(partition, members) == self.member_id
+        }
+
+    async def acquire(self, partition: int) -> bool:
+        return bool(await self.redis.set(
+            self.lease_key(partition), self.member_id, nx=True, px=int(PARTITION_LEASE_TTL * 1000)
+        ))
+
+    async def renew(self, partition: int) -> bool:
+        return bool(await self._renew(
+            keys=[self.lease_key(partition)], args=[self.member_id, int(PARTITION_LEASE_TTL * 1000)]
+        ))
+
+    async def release(self, partition: int) -> None:
+        await self._release(keys=[self.lease_key(partition)], args=[self.member_id])
+
+    async def leave(self) -> None:
+        """Удаляет воркер из списка участников, чтобы остальные сразу забрали его партиции."""
+        await self.redis.zrem(MEMBERS_KEY, self.member_id)
+
+    async def run(self, consume: Callable[[int, asyncio.Event], Awaitable[None]]) -> None:
+        """
+        Запускает consume(partition, stop_event) для каждой арендованной партиции
+        и останавливает его, когда партиция уходит другому воркеру.
+        """
+        running: dict[int, tuple[asyncio.Task, asyncio.Event]] = {}
+        logger.info("Worker %s joined, %d partitions in total", self.member_id, self.partitions_count)
+        try:
+            while True:
+                desired = await self.desired_partitions()
+
+                for partition, (task, stop) in list(running.items()):
+                    if task.done():
+                        # Потребитель закончил текущую пачку — отдаём партицию
+                        del running[partition]
+                        await self.release(partition)
+                        if not task.cancelled() and task.exception() is not None:
+                            logger.error("Consumer of partition %d failed", partition, exc_info=task.exception())
+                        continue
+                    if partition not in desired:
+                        stop.set()
+                    elif not await self.renew(partition):
+                        logger.warning("Lost lease on partition %d", partition)
+                        stop.set()
+
+                for partition in sorted(desired - running.keys()):
+                    if await self.acquire(partition):
+                        stop = asyncio.Event()
+                        running[partition] = (asyncio.create_task(consume(partition, stop)), stop)
+
+                await asyncio.sleep(REBALANCE_INTERVAL)
+        finally:
+            for task, stop in running.values():
+                stop.set()
+            if running:
+                await asyncio.gather(*(task for task, _ in running.values()), return_exceptions=True)
+            for partition in running:
+                await self.release(partition)
+            await self.leave()
@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import orjson
+from redis.asyncio import Redis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Доля HTTP-запросов, профилируемых семплирующим профилировщиком (0 — выключен)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Интервал снятия стека при профилировании, мс
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+# Каталог, в который дописываются свёрнутые стеки (по файлу на процесс)
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "/tmp/wallet-profiles")
+# Порог (мс), начиная с которого SQL-запрос пишется в лог (0 — выключено)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Порог (мс), начиная с которого пачка воркера пишется в лог с длительностями этапов (0 — выключено)
+WORKER_SLOW_BATCH_MS = float(os.getenv("WORKER_SLOW_BATCH_MS", "0"))
+# Ключ с текущими настройками (для процессов, запущенных после изменения) и канал их рассылки
+PROFILING_SETTINGS_KEY = "profiling:settings"
+PROFILING_CHANNEL = "profiling_settings"
+# Сколько символов SQL-запроса попадает в лог
+SLOW_QUERY_LOG_LENGTH = 500
+
+
+class ProfilingSettings:
+    """
+    Настройки профилирования процесса. Меняются без перезапуска: через
+    PUT /api/v1/admin/profiling настройки сохраняются в Redis и рассылаются всем процессам
+    API и воркерам (см. publish_settings и handle_settings_message).
+    """
+
+    FIELDS = ("sample_rate", "slow_query_ms", "worker_slow_batch_ms")
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, slow_query_ms: float = SLOW_QUERY_MS,
+                 worker_slow_batch_ms: float = WORKER_SLOW_BATCH_MS):
+        self.sample_rate = sample_rate
+        self.slow_query_ms = slow_query_ms
+        self.worker_slow_batch_ms = worker_slow_batch_ms
+
+    def as_dict(self) -> dict[str, float]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def update(self, values: dict) -> None:
+        """Применяет известные поля; неизвестные поля игнорируются."""
+        for field in self.FIELDS:
+            if values.get(field) is not None:
+                setattr(self, field, float(values[field]))
+
+
+# Настройки текущего процесса
+settings = ProfilingSettings()
+
+
+async def publish_settings(redis_conn: Redis, changes: dict) -> dict[str, float]:
+    """
+    Объединяет изменения с сохранёнными настройками, сохраняет результат и рассылает его процессам.
+    Возвращает новые настройки.
+    """
+    stored = await redis_conn.get(PROFILING_SETTINGS_KEY)
+    merged = ProfilingSettings()
+    merged.update(settings.as_dict())
+    if stored:
+        merged.update(orjson.loads(stored))
+    merged.update(changes)
+    data = orjson.dumps(merged.as_dict()).decode()
+    await redis_conn.set(PROFILING_SETTINGS_KEY, data)
+    await redis_conn.publish(PROFILING_CHANNEL, data)
+    settings.update(merged.as_dict())
+    return merged.as_dict()
+
+
+async def load_settings(redis_conn: Redis) -> None:
+    """Загружает настройки, изменённые до запуска процесса; без сохранённых остаются значения из окружения."""
+    try:
+        stored = await redis_conn.get(PROFILING_SETTINGS_KEY)
+    except Exception as e:
+        logger.warning("Could not load profiling settings: %s", e)
+        return
+    if stored:
+        settings.update(orjson.loads(stored))
+
+
+def handle_settings_message(channel: str, data: str) -> None:
+    """Обработчик канала PROFILING_CHANNEL для pubsub.PubSubHub."""
+    settings.update(orjson.loads(data))
+    logger.info("Profiling settings changed: %s", settings.as_dict())
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+def collapse_stack(frame) -> str:
+    """Стек от корня к вершине в свёрнутом формате (кадры через «;»), как его принимают flamegraph.pl и speedscope."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Семплирующий профилировщик потока событийного цикла.
+
+    Фоновый поток каждые interval секунд снимает стек потока цикла (sys._current_frames)
+    и добавляет его к каждому открытому сеансу; без открытых сеансов поток спит. Стек цикла
+    показывает код, выполняющийся в момент снятия, в том числе других запросов, идущих параллельно;
+    ожидание ввода-вывода (Redis, БД) видно как кадры селектора событийного цикла.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.thread_id: int | None = None
+        self._sessions: list[Counter] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def begin(self) -> Counter:
+        """Открывает сеанс в потоке событийного цикла; возвращает счётчик снятых стеков."""
+        session = Counter()
+        with self._lock:
+            self._sessions.append(session)
+            self.thread_id = threading.get_ident()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return session
+
+    def end(self, session: Counter) -> None:
+        with self._lock:
+            self._sessions.remove(session)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            frame = sys._current_frames().get(self.thread_id)
+            stack = collapse_stack(frame) if frame is not None else None
+            del frame
+            with self._lock:
+                if not self._sessions:
+                    self._wakeup.clear()
+                    continue
+                if stack:
+                    for session in self._sessions:
+                        session[stack] += 1
+            time.sleep(self.interval)
+
+
+sampler = StackSampler()
+
+
+def write_folded(path: str, root: str, samples: Counter) -> None:
+    """Дописывает стеки в файл в свёрнутом формате: «корень;кадр;...;кадр число»."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as output:
+        for stack, count in samples.items():
+            output.write(f"{root};{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI-middleware, профилирующее долю settings.sample_rate HTTP-запросов (см. StackSampler).
+    Стеки запроса дописываются в PROFILE_OUTPUT_DIR/profile-<pid>.folded с корневым кадром
+    «метод шаблон-маршрута», так что файл сразу строится flamegraph.pl или открывается в speedscope.
+    """
+
+    def __init__(self, app, output_dir: str = PROFILE_OUTPUT_DIR):
+        self.app = app
+        self.output_dir = output_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or settings.sample_rate <= 0 or random.random() >= settings.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        session = sampler.begin()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.end(session)
+            elapsed = time.perf_counter() - started_at
+            route = scope.get("route")
+            root = f"{scope['method']} {route.path if route is not None else 'unmatched'}"
+            if session:
+                path = os.path.join(self.output_dir, f"profile-{os.getpid()}.folded")
+                try:
+                    await asyncio.to_thread(write_folded, path, root, session)
+                except OSError as e:
+                    logger.error("Could not write profile of %s: %s", root, e)
+            metrics.REQUESTS_PROFILED.inc()
+            logger.info("Profiled %s: %.1f ms, %d samples", root, elapsed * 1000, sum(session.values()))
+
+
+def parameters_shape(parameters) -> str:
+    """
+    Форма параметров запроса без значений: типы позиционных или именованных параметров,
+    для списков — длина; для executemany — число наборов и форма первого.
+    """
+    def shape(value) -> str:
+        if isinstance(value, (list, tuple)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {shape(value)}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, list):
+        return f"{len(parameters)} x {parameters_shape(parameters[0])}" if parameters else "[]"
+    if isinstance(parameters, tuple):
+        return "(" + ", ".join(shape(value) for value in parameters) + ")"
+    return shape(parameters)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if settings.slow_query_ms > 0:
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started_at")
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    if elapsed_ms < settings.slow_query_ms:
+        return
+    metrics.SLOW_QUERIES.inc()
+    logger.warning(
+        "Slow query (%.1f ms%s): %s; parameters %s",
+        elapsed_ms, ", executemany" if executemany else "",
+        " ".join(statement.split())[:SLOW_QUERY_LOG_LENGTH], parameters_shape(parameters),
+    )
+
+
+def install_query_hooks(engine: AsyncEngine) -> None:
+    """
+    Подключает к движку замер SQL-запросов: при settings.slow_query_ms > 0 запросы не быстрее порога
+    пишутся в лог с формой параметров (без значений). Повторный вызов для того же движка ничего не меняет.
+    """
+    sync_engine = engine.sync_engine
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        # Запрос, завершившийся ошибкой, не должен оставлять отметку начала
+        event.listen(sync_engine, "handle_error", _discard_query_start)
+
+
+def _discard_query_start(context) -> None:
+    connection = context.connection
+    if connection is not None and connection.info.get("query_started_at"):
+        connection.info["query_started_at"].pop()
+
+
+class Trace:
+    """
+    Длительности этапов одной единицы работы (например, пачки воркера). Если
+    settings.worker_slow_batch_ms > 0, длительности этапов пишутся в гистограмму
+    worker_batch_stage_seconds, а единица работы не быстрее порога — в лог с длительностями этапов.
+    """
+
+    __slots__ = ("name", "enabled", "started_at", "stages")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.enabled = settings.worker_slow_batch_ms > 0
+        self.started_at = time.perf_counter()
+        self.stages: list[tuple[str, float]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.stages.append((name, elapsed))
+            metrics.WORKER_BATCH_STAGE_DURATION.labels(name).observe(elapsed)
+
+    def finish(self, **attributes) -> None:
+        if not self.enabled:
+            return
+        elapsed_ms = (time.perf_counter() - self.started_at) * 1000
+        if elapsed_ms < settings.worker_slow_batch_ms:
+            return
+        logger.warning(
+            "Slow %s (%.1f ms): %s; %s",
+            self.name, elapsed_ms,
+            ", ".join(f"{name} {elapsed * 1000:.1f} ms" for name, elapsed in self.stages),
+            ", ".join(f"{key}={value}" for key, value in attributes.items()),
+        )
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from typing import Callable
+
+from redis.asyncio import Redis
+
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед переподключением после обрыва соединения pub/sub, с
+RECONNECT_DELAY = 1.0
+
+MessageHandler = Callable[[str, str], None]
+
+
+class PubSubHub:
+    """
+    Одно pub/sub-соединение Redis на процесс с раздачей сообщений подписчикам.
+
+    Обработчики регистрируются до запуска (subscribe/psubscribe) и вызываются синхронно
+    в фоновой задаче для каждого сообщения: handler(channel, data). Во время обрыва соединения
+    сообщения теряются, поэтому после переподключения вызываются обработчики on_reconnect
+    (например, чтобы сбросить локальный кэш).
+    """
+
+    def __init__(self, redis_conn: Redis):
+        self.redis = redis_conn
+        self.channels: dict[str, list[MessageHandler]] = {}
+        self.patterns: dict[str, list[MessageHandler]] = {}
+        self.reconnect_handlers: list[Callable[[], None]] = []
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        self.channels.setdefault(channel, []).append(handler)
+
+    def psubscribe(self, pattern: str, handler: MessageHandler) -> None:
+        self.patterns.setdefault(pattern, []).append(handler)
+
+    def on_reconnect(self, handler: Callable[[], None]) -> None:
+        self.reconnect_handlers.append(handler)
+
+    def start(self) -> None:
+        if self._task is None and (self.channels or self.patterns):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _dispatch(self, message: dict) -> None:
+        if message["type"] == "pmessage":
+            handlers = self.patterns.get(message["pattern"], [])
+        elif message["type"] == "message":
+            handlers = self.channels.get(message["channel"], [])
+        else:
+            return
+        for handler in handlers:
+            try:
+                handler(message["channel"], message["data"])
+            except Exception as e:
+                logger.error("Pub/sub handler failed for %s: %s", message["channel"], e, exc_info=True)
+
+    async def _run(self) -> None:
+        connected_before = False
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                if self.channels:
+                    await pubsub.subscribe(*self.channels)
+                if self.patterns:
+                    await pubsub.psubscribe(*self.patterns)
+                if connected_before:
+                    for handler in self.reconnect_handlers:
+                        handler()
+                connected_before = True
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Pub/sub connection lost: %s", e)
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await pubsub.close()
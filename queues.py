@@ -0,0 +1,234 @@
+import logging
+import os
+import socket
+import time
+from typing import NamedTuple
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+
+logger = logging.getLogger(__name__)
+
+# Бэкенд очереди операций: "list" (RPUSH/BLPOP) или "stream" (Redis Streams с группой потребителей)
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "list")
+QUEUE_NAME = os.getenv("QUEUE_NAME", "operation_queue")
+STREAM_GROUP = os.getenv("STREAM_GROUP", "wallet_workers")
+# Приблизительная максимальная длина стрима (XADD MAXLEN ~), 0 — без ограничения
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "1000000"))
+# Число партиций очереди: операции кошелька всегда попадают в одну партицию,
+# поэтому порядок операций внутри кошелька сохраняется при нескольких воркерах
+QUEUE_PARTITIONS = int(os.getenv("QUEUE_PARTITIONS", "1"))
+# Сообщения, не подтверждённые дольше этого времени (мс), забираются другими потребителями
+STREAM_RECLAIM_IDLE_MS = int(os.getenv("STREAM_RECLAIM_IDLE_MS", "30000"))
+
+
+class QueueMessage(NamedTuple):
+    """Сообщение из очереди: идентификатор (для подтверждения) и полезная нагрузка."""
+    id: str
+    payload: str
+
+
+class OperationQueue:
+    """
+    Очередь операций с кошельками.
+
+    Роутер публикует сообщения через push, воркер забирает их пачками через pop
+    и подтверждает через ack после фиксации транзакции.
+    """
+
+    def __init__(self, redis_conn: Redis, name: str = QUEUE_NAME):
+        self.redis = redis_conn
+        self.name = name
+
+    async def push(self, payload: str, client=None) -> None:
+        """
+        Добавляет сообщение в очередь. client — конвейер Redis, если постановку
+        нужно выполнить за один round trip вместе с другими командами.
+        """
+        raise NotImplementedError
+
+    async def pop(self, count: int, linger: float, timeout: float = 0) -> list[QueueMessage]:
+        """
+        Ждёт первое сообщение не дольше timeout секунд (0 — бесконечно), затем
+        добирает пачку до count сообщений, ожидая не дольше linger секунд.
+        """
+        raise NotImplementedError
+
+    async def ack(self, messages: list[QueueMessage]) -> None:
+        """Подтверждает обработку сообщений."""
+
+    async def reclaim(self, count: int) -> list[QueueMessage]:
+        """Забирает зависшие сообщения упавших потребителей."""
+        return []
+
+    async def length(self) -> int:
+        raise NotImplementedError
+
+    async def backlog(self) -> int:
+        """Число сообщений, ещё не обработанных воркерами (лаг очереди)."""
+        return await self.length()
+
+
+class ListQueue(OperationQueue):
+    """
+    Очередь на списке Redis (RPUSH/BLPOP).
+
+    Сообщение удаляется из очереди при получении, поэтому падение воркера
+    до фиксации транзакции приводит к потере операции.
+    """
+
+    async def push(self, payload: str, client=None) -> None:
+        await (client if client is not None else self.redis).rpush(self.name, payload)
+
+    async def pop(self, count: int, linger: float, timeout: float = 0) -> list[QueueMessage]:
+        item = await self.redis.blpop(self.name, timeout=timeout)
+        if item is None:
+            return []
+        batch = [QueueMessage("", item[1])]
+        deadline = time.monotonic() + linger
+        while len(batch) < count:
+            # Забираем всё, что уже лежит в очереди, одним LPOP с count
+            items = await self.redis.lpop(self.name, count - len(batch))
+            if items:
+                batch.extend(QueueMessage("", payload) for payload in items)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            item = await self.redis.blpop(self.name, timeout=remaining)
+            if item is None:
+                break
+            batch.append(QueueMessage("", item[1]))
+        return batch
+
+    async def length(self) -> int:
+        return await self.redis.llen(self.name)
+
+
+class StreamQueue(OperationQueue):
+    """
+    Очередь на Redis Streams с группой потребителей (XADD/XREADGROUP/XACK).
+
+    Сообщение остаётся в списке ожидающих (PEL), пока воркер не подтвердит его
+    после фиксации транзакции. Сообщения упавших воркеров забираются через XAUTOCLAIM,
+    поэтому несколько процессов воркера могут безопасно делить одну очередь.
+    """
+
+    def __init__(self, redis_conn: Redis, name: str = QUEUE_NAME, group: str = STREAM_GROUP,
+                 consumer: str | None = None):
+        super().__init__(redis_conn, name)
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._group_ready = False
+
+    async def ensure_group(self) -> None:
+        """Создаёт группу потребителей (и сам стрим), если их ещё нет."""
+        if self._group_ready:
+            return
+        try:
+            # id="0", чтобы не потерять сообщения, добавленные до создания группы
+            await self.redis.xgroup_create(self.name, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def push(self, payload: str, client=None) -> None:
+        await (client if client is not None else self.redis).xadd(
+            self.name,
+            {"payload": payload},
+            maxlen=STREAM_MAXLEN or None,
+            approximate=True,
+        )
+
+    async def _read(self, count: int, block_ms: int | None) -> list[QueueMessage]:
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.name: ">"}, count=count, block=block_ms
+        )
+        if not response:
+            return []
+        _, entries = response[0]
+        return [QueueMessage(message_id, fields["payload"]) for message_id, fields in entries]
+
+    async def pop(self, count: int, linger: float, timeout: float = 0) -> list[QueueMessage]:
+        await self.ensure_group()
+        batch = await self._read(count, int(timeout * 1000))
+        if not batch:
+            return []
+        deadline = time.monotonic() + linger
+        while len(batch) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            items = await self._read(count - len(batch), max(int(remaining * 1000), 1))
+            if not items:
+                break
+            batch.extend(items)
+        return batch
+
+    async def ack(self, messages: list[QueueMessage]) -> None:
+        if messages:
+            await self.redis.xack(self.name, self.group, *(message.id for message in messages))
+
+    async def reclaim(self, count: int) -> list[QueueMessage]:
+        await self.ensure_group()
+        response = await self.redis.xautoclaim(
+            self.name, self.group, self.consumer,
+            min_idle_time=STREAM_RECLAIM_IDLE_MS, start_id="0-0", count=count,
+        )
+        entries = response[1]
+        if entries:
+            logger.warning("Reclaimed %d pending messages from %s", len(entries), self.name)
+        # Записи, удалённые из стрима по MAXLEN, приходят без полей — их пропускаем
+        return [QueueMessage(message_id, fields["payload"]) for message_id, fields in entries if fields]
+
+    async def length(self) -> int:
+        return await self.redis.xlen(self.name)
+
+    async def backlog(self) -> int:
+        """
+        Непрочитанные группой (lag) и неподтверждённые (pending) сообщения. XLEN для стрима
+        не подходит: подтверждённые сообщения остаются в нём до обрезки по MAXLEN.
+        """
+        try:
+            groups = await self.redis.xinfo_groups(self.name)
+        except ResponseError:
+            # Стрима ещё нет
+            return 0
+        for group in groups:
+            if group["name"] == self.group:
+                # lag неизвестен (Redis < 7 или часть стрима обрезана) — оцениваем длиной стрима сверху
+                if group.get("lag") is None:
+                    return await self.length()
+                return group["lag"] + group["pending"]
+        return await self.length()
+
+
+def get_queue(redis_conn: Redis, name: str = QUEUE_NAME) -> OperationQueue:
+    """Возвращает очередь операций согласно QUEUE_BACKEND."""
+    if QUEUE_BACKEND == "stream":
+        return StreamQueue(redis_conn, name)
+    if QUEUE_BACKEND == "list":
+        return ListQueue(redis_conn, name)
+    raise ValueError(f"Unknown QUEUE_BACKEND: {QUEUE_BACKEND}")
+
+
+def partition_for(wallet_uuid: UUID | str) -> int:
+    """Номер партиции кошелька (UUID v4 случайны, поэтому остаток от деления распределяет их равномерно)."""
+    if not isinstance(wallet_uuid, UUID):
+        wallet_uuid = UUID(wallet_uuid)
+    return wallet_uuid.int % QUEUE_PARTITIONS
+
+
+def partition_name(partition: int) -> str:
+    """Имя ключа партиции; при одной партиции сохраняется прежнее имя очереди."""
+    if QUEUE_PARTITIONS == 1:
+        return QUEUE_NAME
+    return f"{QUEUE_NAME}:{partition}"
+
+
+def get_wallet_queue(redis_conn: Redis, wallet_uuid: UUID | str) -> OperationQueue:
+    """Возвращает партицию очереди, в которую попадают операции кошелька."""
+    return get_queue(redis_conn, partition_name(partition_for(wallet_uuid)))
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+import metrics
+from services import get_balances, BalanceUpdate
+
+
+logger = logging.getLogger(__name__)
+
+# Допустимое отставание реплики, с; при большем отставании чтения идут в основную БД
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "1"))
+# Как часто (с) проверяется отставание реплики
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1"))
+# Сколько ждать ответа реплики при проверке, с; не ответила — считается недоступной
+REPLICA_CHECK_TIMEOUT = float(os.getenv("REPLICA_CHECK_TIMEOUT", "0.5"))
+
+# Отставание реплики по времени последней применённой транзакции. Если реплика применила всё
+# полученное, отставания нет, даже если в основную БД давно не писали. Сервер не в режиме
+# восстановления (отдельный экземпляр для локальной проверки) считается неотстающим.
+REPLICA_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class ReadRouter:
+    """
+    Направляет чтения балансов при промахе кэша в реплику, если она доступна и отстаёт
+    не больше чем на max_lag секунд, иначе — в основную БД.
+
+    Отставание проверяется не чаще раза в interval секунд; одновременные запросы ждут одну
+    общую проверку. Ошибка чтения из реплики помечает её недоступной до следующей проверки,
+    а запрос повторяется в основной БД.
+    """
+
+    def __init__(self, primary_session_factory, replica_engine: AsyncEngine | None,
+                 max_lag: float = REPLICA_MAX_LAG, interval: float = REPLICA_CHECK_INTERVAL):
+        self.primary_session_factory = primary_session_factory
+        self.replica_engine = replica_engine
+        self.replica_session_factory = (
+            async_sessionmaker(bind=replica_engine, expire_on_commit=False) if replica_engine is not None else None
+        )
+        self.max_lag = max_lag
+        self.interval = interval
+        # Последнее измеренное отставание; None — реплика недоступна
+        self.lag: float | None = None
+        self.checked_at = float("-inf")
+        self._check: asyncio.Task | None = None
+
+    async def _measure_lag(self) -> float:
+        async with self.replica_engine.connect() as connection:
+            return float((await connection.execute(REPLICA_LAG_QUERY)).scalar())
+
+    async def check(self) -> float | None:
+        """Измеряет отставание реплики, с; None — реплика не ответила за REPLICA_CHECK_TIMEOUT."""
+        try:
+            # Таймаут охватывает и установку соединения: недоступный хост не должен задерживать чтения
+            lag = await asyncio.wait_for(self._measure_lag(), REPLICA_CHECK_TIMEOUT)
+        except Exception as e:
+            logger.warning("Replica is unavailable, reading from the primary: %s", e)
+            lag = None
+        self.lag = lag
+        self.checked_at = time.monotonic()
+        metrics.REPLICA_LAG.set(lag if lag is not None else -1)
+        return lag
+
+    async def replica_usable(self) -> bool:
+        if self.replica_engine is None:
+            return False
+        if time.monotonic() - self.checked_at >= self.interval:
+            if self._check is None or self._check.done():
+                self._check = asyncio.create_task(self.check())
+            # shield: отмена одного запроса не отменяет общую проверку
+            await asyncio.shield(self._check)
+        return self.lag is not None and self.lag <= self.max_lag
+
+    async def get_balances(self, wallet_uuids: list[str], primary: bool = False) -> dict[str, BalanceUpdate]:
+        """
+        Балансы кошельков (см. services.get_balances) из реплики или основной БД.
+        primary=True — всегда из основной БД (чтение своих записей).
+        """
+        if not primary and await self.replica_usable():
+            try:
+                async with self.replica_session_factory() as db_session:
+                    balances = await get_balances(db_session, wallet_uuids)
+                metrics.DB_READS.labels("replica").inc()
+                return balances
+            except Exception as e:
+                logger.warning("Replica read failed, falling back to the primary: %s", e)
+                self.lag = None
+                metrics.DB_READS.labels("fallback").inc()
+        else:
+            metrics.DB_READS.labels("primary").inc()
+        async with self.primary_session_factory() as db_session:
+            return await get_balances(db_session, wallet_uuids)
@@ -0,0 +1,166 @@
+import logging
+import os
+import time
+from decimal import Decimal
+from uuid import UUID
+
+import asyncpg
+
+import metrics
+from custom_exceptions import (
+    WalletNotFoundError,
+    InsufficientFundsError,
+    InvalidOperationTypeError,
+    DuplicateOperationError,
+)
+from services import apply_operation, create_wallet, BalanceUpdate, OperationType, LEDGER_INITIAL
+
+
+logger = logging.getLogger(__name__)
+
+# Реализация горячего пути (создание кошелька и одиночная операция): "sqlalchemy" (services.py
+# через AsyncSession) или "asyncpg" (прямые запросы к пулу asyncpg с подготовленными запросами)
+WALLET_REPOSITORY = os.getenv("WALLET_REPOSITORY", "sqlalchemy")
+# Размер пула соединений asyncpg
+ASYNCPG_POOL_SIZE = int(os.getenv("ASYNCPG_POOL_SIZE", "20"))
+# Сколько подготовленных запросов кэшируется на соединение. Через PgBouncer в режиме transaction
+# кэш работает только с max_prepared_statements > 0 (PgBouncer 1.21+); иначе задайте 0
+ASYNCPG_STATEMENT_CACHE_SIZE = int(os.getenv("ASYNCPG_STATEMENT_CACHE_SIZE", "100"))
+
+# Ненулевой начальный баланс записывается в журнал тем же запросом (как в services.create_wallet)
+CREATE_WALLET_SQL = (
+    "WITH created AS (INSERT INTO wallet (balance) VALUES ($1) RETURNING wallet_uuid, balance), "
+    "ledger AS (INSERT INTO wallet_ledger (wallet_uuid, entry_type, amount) "
+    f"SELECT wallet_uuid, '{LEDGER_INITIAL}', balance FROM created WHERE balance <> 0) "
+    "SELECT wallet_uuid, balance FROM created"
+)
+APPLY_OPERATION_SQL = "SELECT outcome, balance, version FROM wallet_apply_operation($1, $2, $3, $4)"
+
+
+class WalletRepository:
+    """
+    Горячий путь операций с кошельками: создание кошелька и применение одиночной операции.
+
+    Исключения те же, что у функций services.py: WalletNotFoundError, InsufficientFundsError,
+    DuplicateOperationError, InvalidOperationTypeError, WalletCreationError.
+    Изменения балансов записываются в журнал wallet_ledger в той же транзакции;
+    reference — идентификатор операции для журнала (по умолчанию operation_id).
+    """
+
+    async def create_wallet(self, initial_balance: Decimal) -> dict:
+        raise NotImplementedError
+
+    async def apply_operation(
+            self,
+            wallet_uuid: UUID | str,
+            operation_type: OperationType,
+            amount: Decimal,
+            operation_id: str | None = None,
+            reference: str | None = None
+    ) -> BalanceUpdate:
+        raise NotImplementedError
+
+    @property
+    def pool_size(self) -> int:
+        """Размер пула соединений, на котором выполняются операции (см. sync_mode.LatencyBudget)."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class SqlAlchemyWalletRepository(WalletRepository):
+    """Реализация через функции services.py и сессии SQLAlchemy."""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    async def create_wallet(self, initial_balance: Decimal) -> dict:
+        async with self.session_factory() as db_session:
+            return await create_wallet(db_session, initial_balance)
+
+    async def apply_operation(self, wallet_uuid, operation_type, amount, operation_id=None, reference=None) -> BalanceUpdate:
+        async with self.session_factory() as db_session:
+            return await apply_operation(db_session, wallet_uuid, operation_type, amount, operation_id, reference)
+
+    @property
+    def pool_size(self) -> int:
+        # database.TimedSessionFactory хранит движок сам, async_sessionmaker — в параметрах сессий
+        engine = getattr(self.session_factory, "engine", None) or self.session_factory.kw["bind"]
+        return engine.pool.size()
+
+
+class AsyncpgWalletRepository(WalletRepository):
+    """
+    Реализация на пуле asyncpg: один подготовленный запрос на операцию без SQLAlchemy.
+
+    Операция применяется функцией wallet_apply_operation, которая за один round trip
+    возвращает и результат, и причину отказа, — повторный SELECT не нужен.
+    Операции горячих кошельков (исход hot) передаются в fallback.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, fallback: WalletRepository):
+        self.pool = pool
+        self.fallback = fallback
+
+    @classmethod
+    async def connect(cls, database_url: str, fallback: WalletRepository) -> "AsyncpgWalletRepository":
+        pool = await asyncpg.create_pool(
+            database_url.replace("postgresql+asyncpg://", "postgresql://", 1),
+            min_size=1,
+            max_size=ASYNCPG_POOL_SIZE,
+            statement_cache_size=ASYNCPG_STATEMENT_CACHE_SIZE,
+        )
+        return cls(pool, fallback)
+
+    async def create_wallet(self, initial_balance: Decimal) -> dict:
+        row = await self.pool.fetchrow(CREATE_WALLET_SQL, initial_balance)
+        logger.info("Создан кошелёк: %s", row[0])
+        return {"wallet_uuid": row[0], "balance": row[1]}
+
+    async def apply_operation(self, wallet_uuid, operation_type, amount, operation_id=None, reference=None) -> BalanceUpdate:
+        if operation_type == OperationType.DEPOSIT:
+            delta = amount
+        elif operation_type == OperationType.WITHDRAW:
+            delta = -amount
+        else:
+            raise InvalidOperationTypeError("Invalid operation type")
+
+        wallet_id = wallet_uuid if isinstance(wallet_uuid, UUID) else UUID(str(wallet_uuid))
+        started_at = time.perf_counter()
+        async with self.pool.acquire() as connection:
+            metrics.DB_POOL_WAIT.labels("asyncpg").observe(time.perf_counter() - started_at)
+            outcome, balance, version = await connection.fetchrow(
+                APPLY_OPERATION_SQL, wallet_id, delta, UUID(operation_id) if operation_id else None,
+                UUID(reference) if reference else None,
+            )
+        if outcome == "ok":
+            return BalanceUpdate(balance, version)
+        if outcome == "hot":
+            return await self.fallback.apply_operation(wallet_uuid, operation_type, amount, operation_id, reference)
+        if outcome == "duplicate":
+            logger.warning("Операция %s уже применена", operation_id)
+            raise DuplicateOperationError("Operation already processed")
+        if outcome == "not_found":
+            logger.error("Кошелёк %s не найден", wallet_uuid)
+            raise WalletNotFoundError("Wallet not found")
+        logger.error("Недостаточно средств на кошельке %s: операция %s, сумма %s",
+                     wallet_uuid, operation_type, amount)
+        raise InsufficientFundsError("Insufficient funds")
+
+    @property
+    def pool_size(self) -> int:
+        return self.pool.get_max_size()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+
+async def create_repository(session_factory, database_url: str) -> WalletRepository:
+    """Возвращает реализацию горячего пути согласно WALLET_REPOSITORY."""
+    sqlalchemy_repository = SqlAlchemyWalletRepository(session_factory)
+    if WALLET_REPOSITORY == "asyncpg":
+        return await AsyncpgWalletRepository.connect(database_url, sqlalchemy_repository)
+    if WALLET_REPOSITORY == "sqlalchemy":
+        return sqlalchemy_repository
+    raise ValueError(f"Unknown WALLET_REPOSITORY: {WALLET_REPOSITORY}")
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, NamedTuple
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import database
+from cache import BalanceCache
+from database import TimedSessionFactory, warm_up_engine
+from profiling import install_query_hooks
+from repository import create_repository, WalletRepository
+from services import get_recent_balances
+
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+# Максимум соединений с Redis на процесс; при исчерпании запрос ждёт свободное соединение
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+# Сколько ждать свободного соединения с Redis, с
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+# Сколько соединений с Redis открывается заранее при запуске процесса
+REDIS_POOL_MIN_SIZE = int(os.getenv("REDIS_POOL_MIN_SIZE", "5"))
+# Сколько последних изменённых кошельков загружается в кэш при запуске API (0 — без прогрева)
+CACHE_WARMUP_SIZE = int(os.getenv("CACHE_WARMUP_SIZE", "1000"))
+
+
+class Resources(NamedTuple):
+    """Пулы соединений процесса (API или воркера), открытые при запуске и закрываемые при остановке."""
+    engine: AsyncEngine
+    session_factory: TimedSessionFactory
+    redis: Redis
+    repository: WalletRepository
+
+
+def create_redis(url: str = REDIS_URL) -> Redis:
+    """Клиент Redis с ограниченным пулом: при исчерпании соединений запрос ждёт, а не падает."""
+    pool = BlockingConnectionPool.from_url(
+        url, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT, decode_responses=True
+    )
+    return Redis(connection_pool=pool)
+
+
+async def warm_up_redis(redis_conn: Redis, count: int = REDIS_POOL_MIN_SIZE) -> None:
+    """Открывает count соединений пула Redis одновременно и возвращает их в пул."""
+    pool = redis_conn.connection_pool
+    connections = await asyncio.gather(*(
+        pool.get_connection("PING") for _ in range(min(count, REDIS_MAX_CONNECTIONS))
+    ))
+    for connection in connections:
+        await pool.release(connection)
+
+
+async def warm_up_cache(session_factory, balance_cache: BalanceCache, count: int = CACHE_WARMUP_SIZE) -> int:
+    """
+    Загружает в кэш балансы count последних изменённых кошельков: одним запросом к БД
+    и одним конвейером в Redis (запись защищена версией). Если включён L1, балансы
+    затем читаются из Redis в L1 одним MGET. Возвращает число загруженных кошельков.
+    """
+    if count <= 0:
+        return 0
+    async with session_factory() as db_session:
+        balances = await get_recent_balances(db_session, count)
+    await balance_cache.set_many(
+        {wallet_uuid: (update.balance, update.version) for wallet_uuid, update in balances.items()},
+        publish=False,
+    )
+    if balance_cache.local is not None:
+        await balance_cache.get_many(list(balances))
+    return len(balances)
+
+
+async def warm_up_replica() -> None:
+    """Прогревает пул реплики, если она настроена; недоступная реплика не мешает запуску."""
+    if database.replica_engine is None:
+        return
+    try:
+        await warm_up_engine(database.replica_engine)
+    except Exception as e:
+        logger.warning("Replica pool warm-up failed, reads will use the primary until it recovers: %s", e)
+
+
+@asynccontextmanager
+async def open_resources() -> AsyncIterator[Resources]:
+    """
+    Открывает пулы БД и Redis (с прогревом DB_POOL_MIN_SIZE и REDIS_POOL_MIN_SIZE соединений)
+    и реализацию горячего пути; при выходе закрывает их. Используется lifespan API и воркером.
+    """
+    engine = database.engine
+    redis_conn = create_redis()
+    session_factory = TimedSessionFactory(engine)
+    repository = None
+    # Замер медленных SQL-запросов включается без перезапуска (см. profiling.install_query_hooks)
+    install_query_hooks(engine)
+    if database.replica_engine is not None:
+        install_query_hooks(database.replica_engine)
+    try:
+        await asyncio.gather(warm_up_engine(engine), warm_up_redis(redis_conn), warm_up_replica())
+        repository = await create_repository(session_factory, database.DATABASE_URL)
+        logger.info("Connection pools are ready (database %d, redis %d connections opened)",
+                    min(database.DB_POOL_MIN_SIZE, database.DB_POOL_SIZE), min(REDIS_POOL_MIN_SIZE, REDIS_MAX_CONNECTIONS))
+        yield Resources(engine, session_factory, redis_conn, repository)
+    finally:
+        if repository is not None:
+            await repository.close()
+        await redis_conn.close(close_connection_pool=True)
+        await engine.dispose()
+        if database.replica_engine is not None:
+            await database.replica_engine.dispose()
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+from decimal import Decimal
+
+from redis.asyncio import Redis
+
+
+# Сколько хранится результат операции, с
+OPERATION_RESULT_TTL = int(os.getenv("OPERATION_RESULT_TTL", "3600"))
+# Максимальное время ожидания результата в long-poll запросе, с
+OPERATION_MAX_WAIT = float(os.getenv("OPERATION_MAX_WAIT", "30"))
+# Канал, в который воркер публикует результаты операций
+RESULT_CHANNEL = "operation_results"
+
+STATUS_QUEUED = "queued"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+def result_key(operation_id: str) -> str:
+    return f"operation:{operation_id}"
+
+
+def completed_record(
+        operation_id: str,
+        wallet_uuid: str,
+        balance: Decimal,
+        target_wallet_uuid: str | None = None,
+        target_balance: Decimal | None = None,
+) -> dict:
+    record = {
+        "operation_id": operation_id,
+        "status": STATUS_COMPLETED,
+        "wallet_uuid": wallet_uuid,
+        "balance": str(balance),
+    }
+    # Для перевода — также новый баланс кошелька-получателя
+    if target_wallet_uuid is not None:
+        record["target_wallet_uuid"] = target_wallet_uuid
+        record["target_balance"] = str(target_balance)
+    return record
+
+
+def failed_record(operation_id: str, wallet_uuid: str, error: Exception) -> dict:
+    return {
+        "operation_id": operation_id,
+        "status": STATUS_FAILED,
+        "wallet_uuid": wallet_uuid,
+        "error": type(error).__name__,
+    }
+
+
+class ResultStore:
+    """
+    Хранилище результатов операций в Redis с ограниченным временем жизни.
+
+    Роутер записывает статус queued вместе с постановкой в очередь, воркер — итог
+    операции (новый баланс или ошибку) и публикует его в RESULT_CHANNEL для ожидающих клиентов.
+    """
+
+    def __init__(self, redis_conn: Redis):
+        self.redis = redis_conn
+
+    @staticmethod
+    def mark_queued(pipe, operation_id: str, wallet_uuid: str) -> None:
+        """Добавляет в конвейер запись статуса queued (выполняется вместе с постановкой в очередь)."""
+        record = {"operation_id": operation_id, "status": STATUS_QUEUED, "wallet_uuid": wallet_uuid}
+        pipe.set(result_key(operation_id), json.dumps(record), ex=OPERATION_RESULT_TTL)
+
+    async def save_many(self, records: list[dict]) -> None:
+        """Сохраняет и публикует результаты операций одним конвейером."""
+        if not records:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for record in records:
+                data = json.dumps(record)
+                pipe.set(result_key(record["operation_id"]), data, ex=OPERATION_RESULT_TTL)
+                pipe.publish(RESULT_CHANNEL, data)
+            await pipe.execute()
+
+    async def get(self, operation_id: str) -> dict | None:
+        data = await self.redis.get(result_key(operation_id))
+        return json.loads(data) if data is not None else None
+
+
+class ResultWaiter:
+    """
+    Ожидание результатов операций в процессе API без опроса Redis.
+
+    Сообщения канала результатов приходят через общее pub/sub-соединение процесса
+    (см. pubsub.PubSubHub) и будят все запросы, ожидающие этой операции.
+    """
+
+    def __init__(self):
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+
+    def handle_message(self, channel: str, data: str) -> None:
+        record = json.loads(data)
+        for future in self._waiters.pop(record["operation_id"], []):
+            if not future.done():
+                future.set_result(record)
+
+    async def wait(self, store: ResultStore, operation_id: str, timeout: float) -> dict | None:
+        """
+        Возвращает результат операции, дожидаясь его не дольше timeout секунд.
+        Ожидание регистрируется до чтения из Redis, чтобы не пропустить результат,
+        опубликованный между чтением и подпиской.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(operation_id, []).append(future)
+        try:
+            record = await store.get(operation_id)
+            if record is None or record["status"] != STATUS_QUEUED or timeout <= 0:
+                return record
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return record
+        finally:
+            waiters = self._waiters.get(operation_id, [])
+            if future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[operation_id]
+
+
+# Ожидающие запросы процесса API
+waiter = ResultWaiter()
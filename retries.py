@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+import asyncpg
+from redis.asyncio import Redis
+from sqlalchemy import exc as sa_exc
+
+from custom_exceptions import WalletNotFoundError, InvalidOperationTypeError
+from queues import get_wallet_queue
+from wire import decode_operation
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз операция откладывается после временной ошибки, прежде чем попасть в dead letter
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+# Задержка первого повтора, с; каждая следующая вдвое больше
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+# Максимальная задержка повтора, с
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+# Как часто (с) воркер переносит наступившие повторы обратно в очередь
+RETRY_POLL_INTERVAL = float(os.getenv("RETRY_POLL_INTERVAL", "0.5"))
+# Сколько повторов переносится за один проход
+RETRY_MOVE_BATCH = int(os.getenv("RETRY_MOVE_BATCH", "500"))
+# На сколько (с) повтор откладывается на время переноса: если воркер упал до постановки в очередь,
+# повтор перенесёт другой воркер
+RETRY_CLAIM_TIMEOUT = float(os.getenv("RETRY_CLAIM_TIMEOUT", "30"))
+# Сколько хранится счётчик попыток операции, с
+RETRY_ATTEMPTS_TTL = int(os.getenv("RETRY_ATTEMPTS_TTL", "86400"))
+RETRY_SET = os.getenv("RETRY_SET", "operation_retry")
+DEAD_LETTER_STREAM = os.getenv("DEAD_LETTER_STREAM", "operation_dead_letter")
+# Приблизительная максимальная длина стрима dead letter (XADD MAXLEN ~)
+DEAD_LETTER_MAXLEN = int(os.getenv("DEAD_LETTER_MAXLEN", "100000"))
+
+# Причины попадания операции в dead letter (кроме имён исключений бизнес-ошибок)
+REASON_INVALID_MESSAGE = "invalid_message"
+REASON_RETRIES_EXHAUSTED = "retries_exhausted"
+REASON_PERMANENT_ERROR = "permanent_error"
+
+# Бизнес-ошибки, которые не исправятся повтором; недостаток средств и повтор применённой
+# операции — штатные исходы, они в dead letter не попадают
+PERMANENT_ERRORS = (WalletNotFoundError, InvalidOperationTypeError)
+
+# Классы SQLSTATE временных ошибок: 08 — соединение, 40 — откат транзакции (serialization_failure,
+# deadlock_detected), 53 — нехватка ресурсов сервера, 57P — сервер останавливается или перезапускается
+TRANSIENT_SQLSTATE_PREFIXES = ("08", "40", "53", "57P")
+# SQLSTATE отказа в установлении соединения: запрос на сервер не отправлялся
+CONNECT_SQLSTATES = ("08001", "08004")
+
+# Захватывает наступившие повторы: сдвигает их на время переноса и возвращает
+CLAIM_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    redis.call('ZADD', KEYS[1], ARGV[3], member)
+end
+return due
+"""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Временная ошибка (потеря соединения, конфликт сериализации, deadlock), которую имеет смысл повторить."""
+    if isinstance(error, (ConnectionError, OSError, asyncio.TimeoutError, asyncpg.InterfaceError,
+                          sa_exc.OperationalError, sa_exc.InterfaceError, sa_exc.TimeoutError,
+                          sa_exc.DisconnectionError)):
+        return True
+    if isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated:
+        return True
+    # Ошибки asyncpg приходят напрямую (репозиторий asyncpg) или обёрнутыми в DBAPIError SQLAlchemy
+    for candidate in (error, getattr(error, "orig", None)):
+        sqlstate = getattr(candidate, "sqlstate", None) or getattr(candidate, "pgcode", None)
+        if isinstance(sqlstate, str) and sqlstate.startswith(TRANSIENT_SQLSTATE_PREFIXES):
+            return True
+    return False
+
+
+def failed_before_commit(error: BaseException) -> bool:
+    """
+    Транзакция точно не зафиксирована: соединение не получено (таймаут пула, отказ в соединении)
+    или сервер вернул ошибку запроса, и транзакция откатилась. При обрыве уже открытого соединения
+    (сброс соединения, SQLSTATE 08006) итог COMMIT неизвестен.
+    """
+    for candidate in (error, getattr(error, "orig", None)):
+        if isinstance(candidate, (ConnectionRefusedError, FileNotFoundError, socket.gaierror, asyncio.TimeoutError,
+                                  sa_exc.TimeoutError)):
+            return True
+        sqlstate = getattr(candidate, "sqlstate", None) or getattr(candidate, "pgcode", None)
+        if isinstance(sqlstate, str):
+            return not sqlstate.startswith("08") or sqlstate in CONNECT_SQLSTATES
+    return False
+
+
+def retry_delay(attempt: int) -> float:
+    """Задержка перед попыткой attempt (с 1): экспоненциальный рост до RETRY_MAX_DELAY."""
+    return min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+
+
+def attempts_key(payload: str) -> str:
+    return f"operation_attempts:{payload}"
+
+
+class RetryScheduler:
+    """
+    Отложенные повторы операций в sorted set Redis (член — сообщение очереди, вес — время повтора).
+
+    Воркер откладывает операцию вызовом schedule и сразу подтверждает сообщение, не задерживая
+    остальные операции очереди. Отдельная корутина (move_due) переносит наступившие повторы
+    обратно в партицию кошелька.
+    """
+
+    def __init__(self, redis_conn: Redis, name: str = RETRY_SET):
+        self.redis = redis_conn
+        self.name = name
+        self._claim_due = redis_conn.register_script(CLAIM_DUE_SCRIPT)
+
+    async def schedule(self, payloads: list[str]) -> list[str]:
+        """
+        Откладывает операции с экспоненциальной задержкой по номеру попытки.
+        Возвращает сообщения, исчерпавшие RETRY_MAX_ATTEMPTS попыток (их нужно отправить в dead letter).
+        """
+        if not payloads:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for payload in payloads:
+                pipe.incr(attempts_key(payload))
+                pipe.expire(attempts_key(payload), RETRY_ATTEMPTS_TTL)
+            attempts = (await pipe.execute())[::2]
+
+        now = time.time()
+        scheduled = {}
+        exhausted = []
+        for payload, attempt in zip(payloads, attempts):
+            if attempt > RETRY_MAX_ATTEMPTS:
+                exhausted.append(payload)
+            else:
+                scheduled[payload] = now + retry_delay(attempt)
+        if scheduled:
+            await self.redis.zadd(self.name, scheduled)
+        return exhausted
+
+    async def move_due(self, count: int = RETRY_MOVE_BATCH) -> int:
+        """Переносит наступившие повторы в партиции их кошельков. Возвращает число перенесённых."""
+        now = time.time()
+        due = await self._claim_due(keys=[self.name], args=[now, count, now + RETRY_CLAIM_TIMEOUT])
+        if not due:
+            return 0
+        # Постановка в очередь и удаление из набора — одной транзакцией: повтор, отложенный заново
+        # сразу после постановки, не будет удалён из набора этим переносом
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for payload in due:
+                operation = decode_operation(payload)
+                if operation is not None:
+                    await get_wallet_queue(self.redis, operation.wallet_uuid).push(payload, client=pipe)
+            pipe.zrem(self.name, *due)
+            await pipe.execute()
+        return len(due)
+
+    async def size(self) -> int:
+        return await self.redis.zcard(self.name)
+
+
+class DeadLetterQueue:
+    """
+    Стрим операций, которые воркер не смог применить: сообщение очереди, причина и текст ошибки.
+    Записи просматриваются и возвращаются в очередь через /api/v1/admin/dead-letter.
+    """
+
+    def __init__(self, redis_conn: Redis, name: str = DEAD_LETTER_STREAM):
+        self.redis = redis_conn
+        self.name = name
+
+    async def add_many(self, entries: list[tuple[str, str, str]]) -> None:
+        """Добавляет записи (payload, reason, error) одним конвейером."""
+        if not entries:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for payload, reason, error in entries:
+                pipe.xadd(
+                    self.name,
+                    {"payload": payload, "reason": reason, "error": error, "failed_at": str(time.time())},
+                    maxlen=DEAD_LETTER_MAXLEN or None,
+                    approximate=True,
+                )
+            await pipe.execute()
+
+    async def entries(self, count: int, after: str | None = None) -> list[dict]:
+        """Записи в порядке поступления, начиная после идентификатора after."""
+        response = await self.redis.xrange(self.name, min=f"({after}" if after else "-", count=count)
+        return [{"id": entry_id, **fields} for entry_id, fields in response]
+
+    async def replay(self, entry_ids: list[str]) -> dict:
+        """
+        Возвращает операции записей в партиции их кошельков со сброшенным счётчиком попыток
+        и удаляет записи. Некорректные сообщения не возвращаются.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for entry_id in entry_ids:
+                pipe.xrange(self.name, min=entry_id, max=entry_id)
+            found = await pipe.execute()
+
+        replayed, invalid, missing = [], [], []
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for entry_id, response in zip(entry_ids, found):
+                if not response:
+                    missing.append(entry_id)
+                    continue
+                payload = response[0][1]["payload"]
+                operation = decode_operation(payload)
+                if operation is None:
+                    invalid.append(entry_id)
+                    continue
+                pipe.delete(attempts_key(payload))
+                await get_wallet_queue(self.redis, operation.wallet_uuid).push(payload, client=pipe)
+                pipe.xdel(self.name, entry_id)
+                replayed.append(entry_id)
+            if replayed:
+                await pipe.execute()
+        return {"replayed": replayed, "invalid": invalid, "missing": missing}
+
+    async def length(self) -> int:
+        return await self.redis.xlen(self.name)
@@ -1,35 +1,152 @@
-import json
-from typing import Annotated
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Annotated, Iterable
+from uuid import UUID, uuid4
 
-import redis.asyncio as aioredis
+import orjson
 from redis.asyncio import Redis
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, Field, condecimal
-from uuid import UUID
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, condecimal, confloat, conlist, validator
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from starlette.status import HTTP_404_NOT_FOUND
+from starlette.status import (
+    HTTP_404_NOT_FOUND,
+    HTTP_409_CONFLICT,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+    HTTP_429_TOO_MANY_REQUESTS,
+    HTTP_503_SERVICE_UNAVAILABLE,
+)
+
+from custom_exceptions import InsufficientFundsError, WalletNotFoundError
 
+from admission import AdmissionControl, Rejection, RATE_LIMIT_CLIENT_HEADER
+import balance_events
+from balance_events import balance_event, publish_balances, Subscriber, STREAM_HEARTBEAT_INTERVAL, STREAM_MAX_WALLETS
+import cache
+from cache import BalanceCache, HOT_BALANCE_CACHE_TTL
+import idempotency
+from known_wallets import KnownWallets
+import metrics
+import database
+import profiling
 from database import get_db
-from models import Wallet
-from services import create_wallet, OperationType
+from replica import ReadRouter
+from repository import create_repository, WalletRepository
+from queues import get_wallet_queue, partition_for
+from resources import create_redis
+from results import completed_record, failed_record, ResultStore, OPERATION_MAX_WAIT
+import results
+from retries import failed_before_commit, DeadLetterQueue, RetryScheduler
+from services import create_wallets, enable_hot_wallet, get_balance_at, get_balances, get_wallet_history, OperationType
+from sync_mode import LatencyBudget, OperationMode, OPERATION_MODE, SYNC_MAX_IN_FLIGHT
+from wire import decode_operation, encode_operation
+
 
-REDIS_URL = "redis://redis:6379"
+logger = logging.getLogger(__name__)
 
-# Глобальный клиент Redis (создаётся один раз)
-redis_client: aioredis.Redis | None = None
+# Максимальное число кошельков в одном запросе пакетного создания
+WALLET_BATCH_MAX_SIZE = int(os.getenv("WALLET_BATCH_MAX_SIZE", "10000"))
+# Максимальное число кошельков в одном запросе пакетного чтения балансов
+BALANCES_BATCH_MAX_SIZE = int(os.getenv("BALANCES_BATCH_MAX_SIZE", "1000"))
+# Начиная с этого размера ответ пакетных запросов отдаётся потоком, а не собирается целиком
+STREAM_RESPONSE_THRESHOLD = int(os.getenv("STREAM_RESPONSE_THRESHOLD", "1000"))
+# Максимальное число записей dead letter в одном запросе просмотра или повтора
+DEAD_LETTER_PAGE_MAX_SIZE = 1000
+# Максимальное число слотов горячего кошелька
+HOT_WALLET_MAX_SLOTS = int(os.getenv("HOT_WALLET_MAX_SLOTS", "64"))
+# Сколько элементов ответа сериализуется в один фрагмент потока
+STREAM_CHUNK_SIZE = 500
+# Число строк истории кошелька на странице по умолчанию и максимальное
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_PAGE_MAX_SIZE = int(os.getenv("HISTORY_PAGE_MAX_SIZE", "500"))
+
+# Глобальный клиент Redis процесса (открывается в lifespan приложения, см. main.lifespan)
+redis_client: Redis | None = None
 
 async def get_redis() -> Redis:
     global redis_client
     if redis_client is None:
-        redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+        redis_client = create_redis()
     return redis_client
 
+# Реализация горячего пути процесса (SQLAlchemy или asyncpg, см. repository.WALLET_REPOSITORY);
+# открывается в lifespan приложения вместе с пулами
+wallet_repository: WalletRepository | None = None
+
+async def get_repository() -> WalletRepository:
+    global wallet_repository
+    if wallet_repository is None:
+        wallet_repository = await create_repository(database.async_session_factory, database.DATABASE_URL)
+    return wallet_repository
+
+# Выбор БД для чтения балансов при промахе кэша (реплика или основная, см. replica.ReadRouter)
+read_router: ReadRouter | None = None
+
+async def get_read_router() -> ReadRouter:
+    global read_router
+    if read_router is None:
+        read_router = ReadRouter(database.async_session_factory, database.replica_engine)
+    return read_router
+
+# Кэш балансов процесса (Redis и, если включён, локальный L1)
+balance_cache: BalanceCache | None = None
+
+async def get_balance_cache(redis_conn: Annotated[Redis, Depends(get_redis)]) -> BalanceCache:
+    global balance_cache
+    if balance_cache is None:
+        balance_cache = BalanceCache(redis_conn, cache.local_cache)
+    return balance_cache
+
+# Фильтр известных кошельков и отрицательный кэш (см. known_wallets.KnownWallets)
+known_wallets: KnownWallets | None = None
+
+async def get_known_wallets(redis_conn: Annotated[Redis, Depends(get_redis)]) -> KnownWallets:
+    global known_wallets
+    if known_wallets is None:
+        known_wallets = KnownWallets(redis_conn)
+    return known_wallets
+
+# Фоновое построение фильтра, запущенное через POST /api/v1/admin/wallet-filter/rebuild
+wallet_filter_rebuild: asyncio.Task | None = None
+
+# Контроль приёма операций процесса (лаг очереди и лимиты частоты)
+admission_control: AdmissionControl | None = None
+
+async def get_admission_control(redis_conn: Annotated[Redis, Depends(get_redis)]) -> AdmissionControl:
+    global admission_control
+    if admission_control is None:
+        admission_control = AdmissionControl(redis_conn)
+    return admission_control
+
+# Бюджет задержки синхронных операций процесса (см. sync_mode.LatencyBudget)
+latency_budget: LatencyBudget | None = None
+
+async def get_latency_budget(repository: Annotated[WalletRepository, Depends(get_repository)]) -> LatencyBudget:
+    global latency_budget
+    if latency_budget is None:
+        # Ограничение по умолчанию — пул, на котором выполняются синхронные операции
+        latency_budget = LatencyBudget(SYNC_MAX_IN_FLIGHT or repository.pool_size)
+    return latency_budget
+
 router = APIRouter(
     prefix="/api/v1/wallets",
     tags=["wallets"]
 )
 
+operations_router = APIRouter(
+    prefix="/api/v1/operations",
+    tags=["operations"]
+)
+
+admin_router = APIRouter(
+    prefix="/api/v1/admin",
+    tags=["admin"]
+)
+
 # Схемы для запросов
 class WalletCreateRequest(BaseModel):
     initial_balance: condecimal(decimal_places=2, ge=0) = Field(..., description="Начальный баланс кошелька")
@@ -38,53 +155,747 @@ class WalletOperationRequest(BaseModel):
     operationType: OperationType = Field(..., description="Тип операции: DEPOSIT или WITHDRAW")
     amount: condecimal(decimal_places=2, gt=0) = Field(..., description="Сумма операции")
 
-@router.post("/", response_model=dict, summary="Создание кошелька")
+    @validator("operationType")
+    def check_not_transfer(cls, value: OperationType) -> OperationType:
+        # Переводу нужен кошелёк-получатель, он выполняется через POST /{wallet_uuid}/transfer
+        if value == OperationType.TRANSFER:
+            raise ValueError("use POST /api/v1/wallets/{wallet_uuid}/transfer for transfers")
+        return value
+
+class WalletTransferRequest(BaseModel):
+    target_wallet_uuid: UUID = Field(..., description="Кошелёк-получатель")
+    amount: condecimal(decimal_places=2, gt=0) = Field(..., description="Сумма перевода")
+
+class WalletBatchCreateRequest(BaseModel):
+    initial_balances: conlist(condecimal(decimal_places=2, ge=0), min_items=1, max_items=WALLET_BATCH_MAX_SIZE) = Field(
+        ..., description="Начальные балансы создаваемых кошельков"
+    )
+
+class HotWalletRequest(BaseModel):
+    slots: int = Field(..., ge=2, le=HOT_WALLET_MAX_SLOTS, description="Число слотов баланса")
+
+class DeadLetterReplayRequest(BaseModel):
+    ids: conlist(str, min_items=1, max_items=DEAD_LETTER_PAGE_MAX_SIZE) = Field(
+        ..., description="Идентификаторы записей dead letter"
+    )
+
+class ProfilingSettingsRequest(BaseModel):
+    sample_rate: confloat(ge=0, le=1) | None = Field(None, description="Доля профилируемых HTTP-запросов (0 — выключено)")
+    slow_query_ms: confloat(ge=0) | None = Field(None, description="Порог медленного SQL-запроса, мс (0 — выключено)")
+    worker_slow_batch_ms: confloat(ge=0) | None = Field(
+        None, description="Порог медленной пачки воркера, мс (0 — выключено)"
+    )
+
+class WalletBalancesRequest(BaseModel):
+    wallet_uuids: conlist(UUID, min_items=1, max_items=BALANCES_BATCH_MAX_SIZE) = Field(
+        ..., description="Идентификаторы кошельков"
+    )
+
+# Схемы для ответов. Маршруты возвращают ORJSONResponse напрямую, минуя проверку и jsonable_encoder
+# FastAPI, поэтому схемы описывают ответ в OpenAPI, а его форма задаётся в самих маршрутах
+class WalletResponse(BaseModel):
+    wallet_uuid: str = Field(..., description="Идентификатор кошелька")
+    balance: float = Field(..., description="Баланс кошелька")
+
+class WalletBalanceResponse(BaseModel):
+    wallet_uuid: str = Field(..., description="Идентификатор кошелька")
+    balance: float | None = Field(..., description="Баланс кошелька; null, если кошелёк не найден")
+
+class OperationQueuedResponse(BaseModel):
+    status: str = Field(..., description="Статус операции: queued")
+    operation_id: str = Field(..., description="Идентификатор операции для GET /api/v1/operations/{operation_id}")
+    detail: str
+
+class OperationCompletedResponse(BaseModel):
+    status: str = Field(..., description="Статус операции: completed")
+    operation_id: str = Field(..., description="Идентификатор операции (строки журнала кошелька)")
+    wallet_uuid: str = Field(..., description="Идентификатор кошелька")
+    balance: float = Field(..., description="Новый баланс кошелька")
+
+class HotWalletResponse(WalletResponse):
+    hot_slots: int = Field(..., description="Число слотов баланса")
+
+class LedgerEntryResponse(BaseModel):
+    id: int = Field(..., description="Номер строки журнала")
+    entry_type: str = Field(..., description="INITIAL, DEPOSIT, WITHDRAW или TRANSFER")
+    amount: float = Field(..., description="Изменение баланса (отрицательное для снятия и исходящего перевода)")
+    operation_id: str | None = Field(..., description="Идентификатор операции")
+    counterparty_uuid: str | None = Field(..., description="Второй кошелёк перевода")
+    created_at: str = Field(..., description="Время изменения (UTC)")
+
+class WalletHistoryResponse(BaseModel):
+    wallet_uuid: str = Field(..., description="Идентификатор кошелька")
+    entries: list[LedgerEntryResponse] = Field(..., description="Строки журнала от новых к старым")
+    next_before: int | None = Field(..., description="Значение before для следующей страницы; null — страниц больше нет")
+
+class WalletBalanceAtResponse(WalletResponse):
+    at: str = Field(..., description="Момент времени (UTC)")
+
+
+def json_array_response(items: list[dict]):
+    """
+    Возвращает список как JSON-массив. Большие списки отдаются потоком по STREAM_CHUNK_SIZE
+    элементов, чтобы не собирать весь ответ в памяти одной строкой.
+    """
+    if len(items) < STREAM_RESPONSE_THRESHOLD:
+        return ORJSONResponse(items)
+
+    def chunks() -> Iterable[bytes]:
+        yield b"["
+        for start in range(0, len(items), STREAM_CHUNK_SIZE):
+            prefix = b"," if start else b""
+            # Срез сериализуется одним вызовом orjson, внешние скобки массива отбрасываются
+            yield prefix + orjson.dumps(items[start:start + STREAM_CHUNK_SIZE])[1:-1]
+        yield b"]"
+
+    return StreamingResponse(chunks(), media_type="application/json")
+
+@router.post("/", response_model=WalletResponse, summary="Создание кошелька")
 async def create_wallet_route(
     request: WalletCreateRequest,
-    db: AsyncSession = Depends(get_db)
+    balances: Annotated[BalanceCache, Depends(get_balance_cache)],
+    repository: Annotated[WalletRepository, Depends(get_repository)],
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
 ):
     # Передаём в сервис значение типа Decimal, полученное из Pydantic через condecimal
-    wallet = await create_wallet(db, request.initial_balance)
-    return {
+    wallet = await repository.create_wallet(request.initial_balance)
+    # Новый кошелёк сразу попадает в кэш с начальной версией и в фильтр известных кошельков
+    await balances.set(wallet["wallet_uuid"], wallet["balance"], 0, publish=False)
+    await known.add([str(wallet["wallet_uuid"])])
+    return ORJSONResponse({
         "wallet_uuid": str(wallet["wallet_uuid"]),
         "balance": float(wallet["balance"]),
-    }
+    })
+
 
+@router.post("/batch", response_model=list[WalletResponse], summary="Пакетное создание кошельков")
+async def create_wallets_route(
+    request: WalletBatchCreateRequest,
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Создаёт до WALLET_BATCH_MAX_SIZE кошельков одним INSERT в одной транзакции и добавляет их
+    в фильтр известных кошельков одной командой. Кэш балансов не заполняется: балансы попадут
+    в него при первом чтении.
+    """
+    wallets = await create_wallets(db, request.initial_balances)
+    await known.add([str(wallet["wallet_uuid"]) for wallet in wallets])
+    return json_array_response([
+        {"wallet_uuid": str(wallet["wallet_uuid"]), "balance": float(wallet["balance"])}
+        for wallet in wallets
+    ])
+
+
+@router.post("/balances", response_model=list[WalletBalanceResponse], summary="Пакетное получение балансов")
+async def get_wallet_balances(
+    request: WalletBalancesRequest,
+    balances: Annotated[BalanceCache, Depends(get_balance_cache)],
+    reads: Annotated[ReadRouter, Depends(get_read_router)],
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
+    read_primary: bool = Header(False, description="Читать из основной БД, минуя кэш и реплику"),
+):
+    """
+    Возвращает балансы кошельков в порядке запроса; для несуществующих кошельков balance равен null.
+    Найденные в кэше балансы читаются одним MGET, точно несуществующие кошельки (фильтр известных
+    кошельков и отрицательный кэш) отбрасываются, остальные читаются одним запросом к БД (к реплике,
+    если она не отстаёт), после чего промахи возвращаются в кэш одним конвейером.
+    """
+    wallet_uuids = [str(wallet_uuid) for wallet_uuid in request.wallet_uuids]
+    unique_uuids = list(dict.fromkeys(wallet_uuids))
+    found = {} if read_primary else await balances.get_many(unique_uuids)
+
+    missing = [wallet_uuid for wallet_uuid in unique_uuids if wallet_uuid not in found]
+    if missing and not read_primary:
+        unknown = await known.unknown(missing)
+        missing = [wallet_uuid for wallet_uuid in missing if wallet_uuid not in unknown]
+    if missing:
+        loaded = await reads.get_balances(missing, primary=read_primary)
+        await known.remember_missing([wallet_uuid for wallet_uuid in missing if wallet_uuid not in loaded])
+        # Версия не даст перезаписать более свежие значения от воркера
+        await balances.set_many(
+            {wallet_uuid: (update.balance, update.version) for wallet_uuid, update in loaded.items() if not update.hot},
+            publish=False,
+        )
+        await balances.set_many(
+            {wallet_uuid: (update.balance, update.version) for wallet_uuid, update in loaded.items() if update.hot},
+            publish=False, ttl=HOT_BALANCE_CACHE_TTL,
+        )
+        found.update({wallet_uuid: update.balance for wallet_uuid, update in loaded.items()})
+
+    return json_array_response([
+        {
+            "wallet_uuid": wallet_uuid,
+            "balance": float(found[wallet_uuid]) if wallet_uuid in found else None,
+        }
+        for wallet_uuid in wallet_uuids
+    ])
+
+
+async def balance_event_stream(subscriber: Subscriber, snapshot: list[dict]):
+    """
+    События SSE: текущие балансы (snapshot), затем изменения (balance) по мере публикации воркером.
+    При отсутствии событий отправляется комментарий-пинг; отключённый за медленное чтение
+    подписчик получает событие dropped, после чего поток закрывается.
+    """
+    try:
+        for item in snapshot:
+            yield b"event: snapshot\ndata: " + orjson.dumps(item) + b"\n\n"
+        while not subscriber.dropped:
+            event = await subscriber.get(STREAM_HEARTBEAT_INTERVAL)
+            if event is None:
+                yield b": ping\n\n"
+            elif event:
+                yield f"event: balance\ndata: {event}\n\n".encode()
+        yield b"event: dropped\ndata: {}\n\n"
+    finally:
+        balance_events.broadcaster.unsubscribe(subscriber)
+
+
+@router.get("/stream", summary="Поток изменений балансов (SSE)")
+async def stream_balances(
+    balances: Annotated[BalanceCache, Depends(get_balance_cache)],
+    reads: Annotated[ReadRouter, Depends(get_read_router)],
+    wallet_uuid: list[UUID] = Query(..., description="Кошельки, изменения балансов которых нужно получать"),
+):
+    """
+    Поток Server-Sent Events с изменениями балансов кошельков вместо периодического опроса
+    GET /api/v1/wallets/{wallet_uuid}: GET /api/v1/wallets/stream?wallet_uuid=...&wallet_uuid=...
+
+    Сначала отправляются текущие балансы (событие snapshot; для несуществующего кошелька balance
+    равен null), затем каждое зафиксированное изменение (событие balance с версией кошелька).
+    Процесс API держит одно pub/sub-соединение на всех подписчиков; клиент, не успевающий
+    читать события, отключается (событие dropped) и должен переподключиться.
+    """
+    wallet_uuids = list(dict.fromkeys(str(wallet_id) for wallet_id in wallet_uuid))
+    if len(wallet_uuids) > STREAM_MAX_WALLETS:
+        raise HTTPException(
+            status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {STREAM_MAX_WALLETS} wallets per stream",
+        )
+    # Подписка оформляется до чтения текущих балансов, чтобы не пропустить изменение между ними
+    subscriber = balance_events.broadcaster.subscribe(wallet_uuids)
+    if subscriber is None:
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many balance stream subscribers",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        found = await balances.get_many(wallet_uuids)
+        missing = [wallet_id for wallet_id in wallet_uuids if wallet_id not in found]
+        if missing:
+            loaded = await reads.get_balances(missing)
+            found.update({wallet_id: update.balance for wallet_id, update in loaded.items()})
+    except Exception:
+        balance_events.broadcaster.unsubscribe(subscriber)
+        raise
+
+    snapshot = [
+        {"wallet_uuid": wallet_id, "balance": float(found[wallet_id]) if wallet_id in found else None}
+        for wallet_id in wallet_uuids
+    ]
+    return StreamingResponse(
+        balance_event_stream(subscriber, snapshot),
+        media_type="text/event-stream",
+        # Прокси не должны буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{wallet_uuid}", response_model=WalletResponse, summary="Получение баланса")
+async def get_wallet_balance(
+    wallet_uuid: UUID,
+    balances: Annotated[BalanceCache, Depends(get_balance_cache)],
+    reads: Annotated[ReadRouter, Depends(get_read_router)],
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
+    read_primary: bool = Header(False, description="Читать из основной БД, минуя кэш и реплику"),
+):
+    # Проверяем наличие баланса в кэше (L1 процесса, затем Redis); с заголовком Read-Primary
+    # клиент читает свои записи из основной БД
+    if not read_primary:
+        with metrics.Timer(metrics.BALANCE_LOOKUP_DURATION.labels("cache")):
+            cached_balance = await balances.get(wallet_uuid)
+        if cached_balance is not None:
+            return ORJSONResponse({"wallet_uuid": str(wallet_uuid), "balance": float(cached_balance)})
+        # Несуществующий кошелёк (по фильтру известных кошельков или отрицательному кэшу) — без обращения к БД
+        if await known.unknown([str(wallet_uuid)]):
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+
+    # Если баланс не найден в кэше, запрашиваем из БД — из реплики, если она не отстаёт
+    # (для горячего кошелька — сумму слотов)
+    with metrics.Timer(metrics.BALANCE_LOOKUP_DURATION.labels("db")):
+        wallet = (await reads.get_balances([str(wallet_uuid)], primary=read_primary)).get(str(wallet_uuid))
+    if wallet is None:
+        await known.remember_missing([str(wallet_uuid)])
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
 
-@router.get("/{wallet_uuid}", response_model=dict, summary="Получение баланса")
-async def get_wallet_balance(wallet_uuid: UUID, db: AsyncSession = Depends(get_db)):
-    redis_conn = await get_redis()
-    cache_key = f"wallet:{wallet_uuid}"
+    # Кэшируем баланс; версия не даст перезаписать более свежее значение от воркера
+    ttl = HOT_BALANCE_CACHE_TTL if wallet.hot else cache.CACHE_TTL
+    await balances.set(wallet_uuid, wallet.balance, wallet.version, publish=False, ttl=ttl)
+    return ORJSONResponse({"wallet_uuid": str(wallet_uuid), "balance": float(wallet.balance)})
 
-    # Проверяем наличие баланса в кэше Redis
-    cached_balance = await redis_conn.get(cache_key)
-    if cached_balance is not None:
-        return {"wallet_uuid": str(wallet_uuid), "balance": float(cached_balance)}
 
-    # Если баланс не найден в кэше, запрашиваем из БД
-    result = await db.execute(select(Wallet).filter_by(wallet_uuid=wallet_uuid))
-    wallet = result.scalars().first()
-    if not wallet:
+@router.get("/{wallet_uuid}/history", response_model=WalletHistoryResponse, summary="История операций кошелька")
+async def get_wallet_history_route(
+    wallet_uuid: UUID,
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
+    db: AsyncSession = Depends(get_db),
+    before: int | None = Query(None, ge=1, description="Вернуть строки журнала с номером меньше before"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX_SIZE, description="Число строк на странице"),
+):
+    """
+    Изменения баланса кошелька из журнала wallet_ledger, от новых к старым. Страницы выбираются
+    по номеру строки (keyset), а не смещением: следующая страница — запрос с before=next_before,
+    и её чтение не зависит от числа уже пройденных строк.
+    """
+    if await known.unknown([str(wallet_uuid)]):
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+    entries = await get_wallet_history(db, str(wallet_uuid), before, limit)
+    # У кошелька может не быть строк журнала (нулевой начальный баланс): проверяем, что он существует
+    if not entries and before is None and not await get_balances(db, [str(wallet_uuid)]):
+        await known.remember_missing([str(wallet_uuid)])
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+    return ORJSONResponse({
+        "wallet_uuid": str(wallet_uuid),
+        "entries": [
+            {**entry, "amount": float(entry["amount"]), "created_at": entry["created_at"].isoformat()}
+            for entry in entries
+        ],
+        "next_before": entries[-1]["id"] if len(entries) == limit else None,
+    })
 
-    # Кэшируем баланс в Redis на 60 секунд
-    await redis_conn.setex(cache_key, 60, str(wallet.balance))
-    return {"wallet_uuid": str(wallet.wallet_uuid), "balance": float(wallet.balance)}
+
+@router.get("/{wallet_uuid}/balance-at", response_model=WalletBalanceAtResponse, summary="Баланс на момент времени")
+async def get_wallet_balance_at(
+    wallet_uuid: UUID,
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
+    at: datetime = Query(..., description="Момент времени (ISO 8601; без часового пояса — UTC)"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Баланс кошелька на момент at: последний снимок баланса до этого момента плюс строки журнала
+    после снимка (см. services.get_balance_at), без чтения всей истории кошелька.
+    """
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    if await known.unknown([str(wallet_uuid)]):
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+    balance = await get_balance_at(db, str(wallet_uuid), at)
+    if balance is None:
+        await known.remember_missing([str(wallet_uuid)])
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+    return ORJSONResponse({"wallet_uuid": str(wallet_uuid), "balance": float(balance), "at": at.isoformat()})
 
 
-@router.post("/{wallet_uuid}/operation", response_model=dict, summary="Депозит/Снятие средств (асинхронная очередь)")
+@router.post(
+    "/{wallet_uuid}/operation",
+    response_model=OperationQueuedResponse | OperationCompletedResponse,
+    summary="Депозит/Снятие средств (асинхронная очередь или синхронно)",
+)
 async def wallet_operation(
     wallet_uuid: UUID,
     request: WalletOperationRequest,
     redis_conn: Annotated[Redis, Depends(get_redis)],
+    admission: Annotated[AdmissionControl, Depends(get_admission_control)],
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
+    repository: Annotated[WalletRepository, Depends(get_repository)],
+    balances: Annotated[BalanceCache, Depends(get_balance_cache)],
+    budget: Annotated[LatencyBudget, Depends(get_latency_budget)],
+    http_request: Request,
+    mode: OperationMode | None = Query(None, description="async — через очередь, sync — сразу; по умолчанию OPERATION_MODE"),
+    idempotency_key: str | None = Header(
+        None, max_length=idempotency.IDEMPOTENCY_KEY_MAX_LENGTH, description="Ключ идемпотентности запроса"
+    ),
 ):
     """
     Помещает операцию в очередь Redis для асинхронной обработки воркером.
+    Операции одного кошелька всегда попадают в одну партицию очереди.
+    Результат операции доступен по GET /api/v1/operations/{operation_id}.
+
+    С mode=sync (или OPERATION_MODE=sync) операция выполняется сразу на пуле соединений API:
+    ответ содержит новый баланс (статус completed), при недостатке средств возвращается 409.
+    Если процесс не укладывается в бюджет задержки (см. sync_mode.LatencyBudget), операция
+    ставится в очередь, и ответ такой же, как в режиме async (статус queued).
+
+    Операция над кошельком, которого точно нет (см. known_wallets.KnownWallets), сразу
+    отклоняется с 404 и в очередь не попадает.
+
+    С заголовком Idempotency-Key повтор запроса возвращает ответ первого запроса
+    без повторной постановки в очередь.
+
+    Если воркеры не успевают разбирать партицию очереди или превышен лимит частоты операций
+    кошелька либо клиента, возвращается 429 с заголовком Retry-After.
     """
-    op_data = {
-        "wallet_uuid": str(wallet_uuid),
-        "operation_type": request.operationType.value,  # Приводим Enum к строке
-        "amount": str(request.amount)
+    sync = (mode or OPERATION_MODE) == OperationMode.SYNC
+    await admit_operation(admission, known, http_request, wallet_uuid, queued=not sync)
+    if sync:
+        if budget.try_acquire():
+            try:
+                return await execute_operation(
+                    redis_conn, repository, balances, known, budget, wallet_uuid, request.operationType,
+                    request.amount, idempotency_key,
+                )
+            finally:
+                budget.release()
+        # Лаг партиции проверяется, только когда бюджет задержки выбрал очередь
+        reject_operation(await admission.check_queue(partition_for(wallet_uuid)))
+        metrics.SYNC_OPERATIONS.labels("queued").inc()
+    return await enqueue_operation(
+        redis_conn, wallet_uuid, request.operationType, request.amount, idempotency_key,
+    )
+
+
+@router.post("/{wallet_uuid}/transfer", response_model=OperationQueuedResponse, summary="Перевод на другой кошелёк (асинхронная очередь)")
+async def wallet_transfer(
+    wallet_uuid: UUID,
+    request: WalletTransferRequest,
+    redis_conn: Annotated[Redis, Depends(get_redis)],
+    admission: Annotated[AdmissionControl, Depends(get_admission_control)],
+    known: Annotated[KnownWallets, Depends(get_known_wallets)],
+    http_request: Request,
+    idempotency_key: str | None = Header(
+        None, max_length=idempotency.IDEMPOTENCY_KEY_MAX_LENGTH, description="Ключ идемпотентности запроса"
+    ),
+):
+    """
+    Помещает перевод с кошелька wallet_uuid на target_wallet_uuid в партицию очереди кошелька-источника.
+    Воркер списывает и зачисляет средства в одной транзакции, блокируя оба кошелька в порядке
+    wallet_uuid. Результат (с балансами обоих кошельков) доступен по GET /api/v1/operations/{operation_id}.
+
+    Idempotency-Key, лимиты, 429 и 404 для несуществующих кошельков — как у POST /{wallet_uuid}/operation.
+    """
+    if request.target_wallet_uuid == wallet_uuid:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail="Cannot transfer to the same wallet")
+    await admit_operation(admission, known, http_request, wallet_uuid, request.target_wallet_uuid)
+    return await enqueue_operation(
+        redis_conn, wallet_uuid, OperationType.TRANSFER, request.amount, idempotency_key, request.target_wallet_uuid,
+    )
+
+
+async def admit_operation(
+    admission: AdmissionControl,
+    known: KnownWallets,
+    http_request: Request,
+    wallet_uuid: UUID,
+    target_uuid: UUID | None = None,
+    queued: bool = True,
+) -> None:
+    """
+    Проверяет, что кошельки операции могут существовать (иначе 404), и приём операции
+    (лаг партиции, лимиты частоты; иначе 429 с Retry-After). queued=False — операция выполняется
+    без очереди, лаг партиции не проверяется.
+    """
+    # Несуществующий кошелёк отклоняется до лимитов частоты, чтобы не создавать для него счётчики
+    unknown = await known.unknown([str(wallet_uuid)] if target_uuid is None else [str(wallet_uuid), str(target_uuid)])
+    if str(wallet_uuid) in unknown:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+    if unknown:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Target wallet not found")
+
+    client_id = (
+        http_request.headers.get(RATE_LIMIT_CLIENT_HEADER) if RATE_LIMIT_CLIENT_HEADER else None
+    ) or (http_request.client.host if http_request.client else "unknown")
+    reject_operation(await admission.check(partition_for(wallet_uuid), str(wallet_uuid), client_id, queued))
+
+
+def reject_operation(rejection: Rejection | None) -> None:
+    """Отвечает 429 с Retry-After, если операция не принята."""
+    if rejection is not None:
+        metrics.OPERATIONS_REJECTED.labels(rejection.reason).inc()
+        raise HTTPException(
+            status_code=HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Operation rejected: {rejection.reason}",
+            headers={"Retry-After": rejection.retry_after_header},
+        )
+
+
+async def reserve_idempotency_key(
+    redis_conn: Redis, idempotency_key: str, fingerprint: str, response: dict
+) -> ORJSONResponse | None:
+    """
+    Резервирует ключ идемпотентности с ответом на запрос. Возвращает None, если операцию нужно
+    выполнить, иначе — ответ первого запроса (422, если ключ использован с другим запросом).
+    """
+    stored = await idempotency.reserve(redis_conn, idempotency_key, fingerprint, response)
+    if stored is None:
+        return None
+    if stored["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used with a different request",
+        )
+    return ORJSONResponse(stored["response"])
+
+
+async def enqueue_operation(
+    redis_conn: Redis,
+    wallet_uuid: UUID,
+    operation_type: OperationType,
+    amount: Decimal,
+    idempotency_key: str | None,
+    target_uuid: UUID | None = None,
+):
+    """
+    Резервирует ключ идемпотентности и ставит операцию в партицию кошелька wallet_uuid вместе со статусом queued.
+    """
+    operation_id = str(uuid4())
+    wallet_id = str(wallet_uuid)
+    target_id = str(target_uuid) if target_uuid is not None else None
+    response = {"status": "queued", "operation_id": operation_id, "detail": "Operation is queued for async processing"}
+
+    if idempotency_key is not None:
+        fingerprint = idempotency.request_fingerprint(wallet_id, operation_type.value, str(amount), target_id)
+        replay = await reserve_idempotency_key(redis_conn, idempotency_key, fingerprint, response)
+        if replay is not None:
+            return replay
+
+    # Компактное сообщение очереди (см. wire.py); воркер отмечает operation_id в БД и не применит
+    # операцию повторно при повторной доставке или повторе после временной ошибки
+    payload = encode_operation(operation_id, wallet_id, operation_type, amount, idempotency_key, target_id)
+    try:
+        # Статус queued и постановка в очередь — одним round trip
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            ResultStore.mark_queued(pipe, operation_id, wallet_id)
+            await get_wallet_queue(redis_conn, wallet_uuid).push(payload, client=pipe)
+            await pipe.execute()
+    except Exception:
+        if idempotency_key is not None:
+            await idempotency.release(redis_conn, idempotency_key)
+        raise
+    return ORJSONResponse(response)
+
+
+async def execute_operation(
+    redis_conn: Redis,
+    repository: WalletRepository,
+    balances: BalanceCache,
+    known: KnownWallets,
+    budget: LatencyBudget,
+    wallet_uuid: UUID,
+    operation_type: OperationType,
+    amount: Decimal,
+    idempotency_key: str | None,
+):
+    """
+    Выполняет депозит или снятие сразу (mode=sync) через репозиторий горячего пути — ту же функцию БД,
+    что и воркер, со строкой журнала и отметкой операции по ключу идемпотентности. После фиксации
+    новый баланс записывается в кэш, публикуется подписчикам и сохраняется как результат операции.
+    """
+    operation_id = str(uuid4())
+    wallet_id = str(wallet_uuid)
+
+    if idempotency_key is not None:
+        fingerprint = idempotency.request_fingerprint(wallet_id, operation_type.value, str(amount))
+        # До завершения повтор получает идентификатор операции; если процесс упадёт до ответа,
+        # применена ли операция, видно по истории кошелька
+        replay = await reserve_idempotency_key(redis_conn, idempotency_key, fingerprint, {
+            "status": "processing", "operation_id": operation_id, "detail": "Operation is being processed synchronously",
+        })
+        if replay is not None:
+            return replay
+
+    started_at = time.perf_counter()
+    try:
+        update = await repository.apply_operation(
+            wallet_uuid, operation_type, amount, operation_id if idempotency_key is not None else None, operation_id
+        )
+    except (InsufficientFundsError, WalletNotFoundError) as e:
+        # Операция не применена: повтор с тем же ключом выполняется заново, как и в воркере
+        if idempotency_key is not None:
+            await idempotency.release(redis_conn, idempotency_key)
+        if isinstance(e, WalletNotFoundError):
+            metrics.SYNC_OPERATIONS.labels("not_found").inc()
+            await known.remember_missing([wallet_id])
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+        metrics.SYNC_OPERATIONS.labels("insufficient_funds").inc()
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail="Insufficient funds")
+    except Exception as e:
+        metrics.SYNC_OPERATIONS.labels("error").inc()
+        # Ключ не должен остаться в статусе processing: до COMMIT резерв снимается, и повтор
+        # выполняется заново; при обрыве соединения посреди транзакции итог COMMIT неизвестен —
+        # повтор и GET /api/v1/operations/{operation_id} получают failed с именем ошибки, а применена ли
+        # операция, видно по истории кошелька
+        if failed_before_commit(e):
+            steps = [idempotency.release(redis_conn, idempotency_key)] if idempotency_key is not None else []
+        else:
+            record = failed_record(operation_id, wallet_id, e)
+            steps = [ResultStore(redis_conn).save_many([record])]
+            if idempotency_key is not None:
+                steps.append(idempotency.complete(redis_conn, idempotency_key, fingerprint, record))
+        await gather_logged(operation_id, steps)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        budget.observe(elapsed)
+        metrics.SYNC_OPERATION_DURATION.observe(elapsed)
+    metrics.SYNC_OPERATIONS.labels("completed").inc()
+
+    response = {"status": "completed", "operation_id": operation_id, "wallet_uuid": wallet_id, "balance": float(update.balance)}
+    # Запись в кэш, событие баланса, результат операции и ответ для повторов — параллельно.
+    # Горячий кошелёк в кэш не пишется: его версия не меняется (как в воркере)
+    steps = [
+        publish_balances(redis_conn, [balance_event(wallet_id, update.balance, update.version)]),
+        ResultStore(redis_conn).save_many([completed_record(operation_id, wallet_id, update.balance)]),
+    ]
+    if not update.hot:
+        steps.append(balances.set(wallet_id, update.balance, update.version))
+    if idempotency_key is not None:
+        steps.append(idempotency.complete(redis_conn, idempotency_key, fingerprint, response))
+    # Транзакция уже зафиксирована; устаревшая запись кэша истечёт по TTL
+    await gather_logged(operation_id, steps)
+    return ORJSONResponse(response)
+
+
+async def gather_logged(operation_id: str, steps: list) -> None:
+    """Выполняет обращения к Redis после синхронной операции параллельно; ошибки только логируются."""
+    for error in await asyncio.gather(*steps, return_exceptions=True):
+        if isinstance(error, Exception):
+            logger.error("Error publishing result of sync operation %s: %s", operation_id, error, exc_info=error)
+
+
+@operations_router.get("/{operation_id}", response_model=dict, summary="Статус операции")
+async def get_operation_status(
+    operation_id: UUID,
+    redis_conn: Annotated[Redis, Depends(get_redis)],
+    wait: float = Query(0, ge=0, le=OPERATION_MAX_WAIT, description="Сколько секунд ждать завершения операции"),
+):
+    """
+    Возвращает статус операции: queued, completed (с новым балансом) или failed (с именем ошибки).
+    С параметром wait запрос ждёт публикации результата воркером, но не дольше wait секунд.
+    """
+    record = await results.waiter.wait(ResultStore(redis_conn), str(operation_id), wait)
+    if record is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Operation not found")
+    return record
+
+
+@admin_router.get("/cache", response_model=dict, summary="Статистика кэша балансов")
+async def cache_stats():
+    """
+    Возвращает счётчики попаданий кэша балансов текущего процесса API.
+    """
+    return {
+        **cache.stats.as_dict(),
+        "l1_enabled": cache.local_cache is not None,
+        "l1_size": len(cache.local_cache) if cache.local_cache is not None else 0,
+    }
+
+
+@admin_router.get("/queue", response_model=dict, summary="Лаг очереди операций")
+async def queue_lag(admission: Annotated[AdmissionControl, Depends(get_admission_control)]):
+    """
+    Возвращает число необработанных операций в каждой партиции очереди (для автомасштабирования
+    воркеров) и признак перегрузки, при которой новые операции отклоняются с 429.
+    """
+    monitor = admission.monitor
+    backlogs = await monitor.sample()
+    return {
+        "backlog": sum(backlogs),
+        "high_watermark": monitor.high,
+        "low_watermark": monitor.low,
+        "partitions": [
+            {"partition": partition, "backlog": backlog, "overloaded": monitor.overloaded[partition]}
+            for partition, backlog in enumerate(backlogs)
+        ],
     }
-    await redis_conn.rpush("operation_queue", json.dumps(op_data))
-    return {"status": "queued", "detail": "Operation is queued for async processing"}
+
+
+@admin_router.get("/dead-letter", response_model=dict, summary="Операции в dead letter")
+async def dead_letter_entries(
+    redis_conn: Annotated[Redis, Depends(get_redis)],
+    count: int = Query(100, ge=1, le=DEAD_LETTER_PAGE_MAX_SIZE, description="Число записей"),
+    after: str | None = Query(None, description="Идентификатор записи, после которой начинать (постранично)"),
+):
+    """
+    Возвращает записи dead letter в порядке поступления: сообщение очереди и разобранную операцию,
+    причину (invalid_message, retries_exhausted, permanent_error или имя бизнес-ошибки) и текст ошибки,
+    а также число операций, ожидающих повтора.
+    """
+    dead_letters = DeadLetterQueue(redis_conn)
+    entries = await dead_letters.entries(count, after)
+    for entry in entries:
+        operation = decode_operation(entry["payload"])
+        entry["operation"] = None if operation is None else {
+            "operation_id": operation.operation_id,
+            "wallet_uuid": operation.wallet_uuid,
+            "operation_type": operation.operation_type.value,
+            "amount": str(operation.amount),
+            "target_wallet_uuid": operation.target_uuid,
+        }
+    return ORJSONResponse({
+        "length": await dead_letters.length(),
+        "retry_scheduled": await RetryScheduler(redis_conn).size(),
+        "entries": entries,
+    })
+
+
+@admin_router.post("/dead-letter/replay", response_model=dict, summary="Повтор операций из dead letter")
+async def replay_dead_letters(request: DeadLetterReplayRequest, redis_conn: Annotated[Redis, Depends(get_redis)]):
+    """
+    Возвращает операции указанных записей dead letter в партиции их кошельков (со сброшенным
+    счётчиком попыток) и удаляет записи. Некорректные сообщения (invalid) и отсутствующие записи
+    (missing) не возвращаются.
+    """
+    return ORJSONResponse(await DeadLetterQueue(redis_conn).replay(request.ids))
+
+
+@admin_router.get("/profiling", response_model=dict, summary="Настройки профилирования процесса")
+async def profiling_settings():
+    """
+    Возвращает настройки профилирования текущего процесса API: долю профилируемых запросов
+    и пороги медленных SQL-запросов и пачек воркера.
+    """
+    return profiling.settings.as_dict()
+
+
+@admin_router.put("/profiling", response_model=dict, summary="Изменение настроек профилирования")
+async def update_profiling_settings(
+    request: ProfilingSettingsRequest, redis_conn: Annotated[Redis, Depends(get_redis)]
+):
+    """
+    Меняет настройки профилирования всех процессов API и воркеров без перезапуска: переданные поля
+    объединяются с текущими, сохраняются в Redis (для процессов, запущенных позже) и рассылаются через pub/sub.
+    """
+    return await profiling.publish_settings(redis_conn, request.dict(exclude_none=True))
+
+
+@admin_router.get("/wallet-filter", response_model=dict, summary="Состояние фильтра известных кошельков")
+async def wallet_filter_status(known: Annotated[KnownWallets, Depends(get_known_wallets)]):
+    """
+    Возвращает параметры фильтра известных кошельков (размер битовой карты, число хешей),
+    признаки ready (фильтр построен и отклоняет запросы) и rebuilding, а также TTL отрицательного кэша.
+    """
+    return await known.status()
+
+
+@admin_router.post("/wallet-filter/rebuild", response_model=dict, summary="Построение фильтра известных кошельков")
+async def rebuild_wallet_filter(known: Annotated[KnownWallets, Depends(get_known_wallets)]):
+    """
+    Запускает в фоне добавление в фильтр всех кошельков из БД — например, после создания кошельков
+    в обход API. Ход построения виден в GET /api/v1/admin/wallet-filter.
+    """
+    global wallet_filter_rebuild
+    if wallet_filter_rebuild is None or wallet_filter_rebuild.done():
+        wallet_filter_rebuild = asyncio.create_task(known.rebuild(database.async_session_factory))
+    return await known.status()
+
+
+@admin_router.post("/wallets/{wallet_uuid}/hot", response_model=HotWalletResponse, summary="Перевод кошелька в горячий режим")
+async def make_wallet_hot(
+    wallet_uuid: UUID,
+    request: HotWalletRequest,
+    balances: Annotated[BalanceCache, Depends(get_balance_cache)],
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Распределяет баланс кошелька по нескольким строкам-слотам, чтобы операции над ним
+    не выстраивались в очередь за блокировкой одной строки. Число слотов можно только увеличить.
+    """
+    try:
+        wallet, slots = await enable_hot_wallet(db, wallet_uuid, request.slots)
+    except WalletNotFoundError:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Wallet not found")
+    # Новая версия вытесняет закэшированный баланс обычного кошелька
+    await balances.set(wallet_uuid, wallet.balance, wallet.version, ttl=HOT_BALANCE_CACHE_TTL)
+    return ORJSONResponse({"wallet_uuid": str(wallet_uuid), "balance": float(wallet.balance), "hot_slots": slots})
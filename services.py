@@ -1,14 +1,18 @@
 import logging
+import random
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from uuid import UUID
-from decimal import Decimal
+from datetime import datetime
+from decimal import Decimal, ROUND_DOWN
 from enum import Enum
+from typing import NamedTuple
 from custom_exceptions import (
     WalletNotFoundError,
     InsufficientFundsError,
     WalletCreationError,
     InvalidOperationTypeError,
+    DuplicateOperationError,
 )
 
 
@@ -20,11 +24,41 @@ class OperationType(str, Enum):
     """Перечисление для типов операций с кошельком."""
     DEPOSIT = "DEPOSIT"
     WITHDRAW = "WITHDRAW"
+    TRANSFER = "TRANSFER"
+
+
+class BalanceUpdate(NamedTuple):
+    """Новый баланс кошелька и его версия (увеличивается при каждом изменении баланса)."""
+    balance: Decimal
+    version: int
+    # Баланс горячего кошелька: версия не меняется при операциях, кэшировать можно только ненадолго
+    hot: bool = False
+
+
+class TransferResult(NamedTuple):
+    """Новые балансы кошелька-источника и кошелька-получателя перевода."""
+    source: BalanceUpdate
+    target: BalanceUpdate
+
+
+# Тип строки журнала для начального баланса; остальные строки имеют тип операции (OperationType)
+LEDGER_INITIAL = "INITIAL"
+
+
+class LedgerEntry(NamedTuple):
+    """Строка журнала wallet_ledger: изменение баланса кошелька на amount (со знаком)."""
+    wallet_uuid: str
+    entry_type: str
+    amount: Decimal
+    operation_id: str | None = None
+    # Второй кошелёк перевода
+    counterparty_uuid: str | None = None
 
 
 async def create_wallet(db: AsyncSession, initial_balance: Decimal):
     """
-    Создает новый кошелёк с начальным балансом.
+    Создает новый кошелёк с начальным балансом. Ненулевой начальный баланс записывается
+    в журнал (строка INITIAL) тем же запросом.
 
     Параметры:
         db (AsyncSession): сессия для работы с базой данных.
@@ -40,12 +74,18 @@ async def create_wallet(db: AsyncSession, initial_balance: Decimal):
         result = await db.execute(
             text(
                 """
-                INSERT INTO wallet (balance) 
-                VALUES (:balance) 
-                RETURNING wallet_uuid, balance
+                WITH created AS (
+                    INSERT INTO wallet (balance)
+                    VALUES (:balance)
+                    RETURNING wallet_uuid, balance
+                ), ledger AS (
+                    INSERT INTO wallet_ledger (wallet_uuid, entry_type, amount)
+                    SELECT wallet_uuid, :entry_type, balance FROM created WHERE balance <> 0
+                )
+                SELECT wallet_uuid, balance FROM created
                 """
             ),
-            {"balance": initial_balance}
+            {"balance": initial_balance, "entry_type": LEDGER_INITIAL}
         )
         wallet = result.fetchone()
         if wallet is None:
@@ -55,12 +95,392 @@ async def create_wallet(db: AsyncSession, initial_balance: Decimal):
         return {"wallet_uuid": wallet[0], "balance": wallet[1]}
 
 
-async def process_operation(
+async def create_wallets(db: AsyncSession, initial_balances: list[Decimal]) -> list[dict]:
+    """
+    Создает несколько кошельков одним многострочным INSERT ... RETURNING; ненулевые начальные
+    балансы записываются в журнал тем же запросом.
+
+    Параметры:
+        db (AsyncSession): сессия для работы с базой данных.
+        initial_balances (list): начальные балансы создаваемых кошельков.
+
+    Возвращает:
+        list: словари с wallet_uuid и balance созданных кошельков.
+
+    Исключения:
+        WalletCreationError: если создано меньше кошельков, чем запрошено.
+    """
+    async with db.begin():
+        result = await db.execute(
+            text(
+                """
+                WITH created AS (
+                    INSERT INTO wallet (balance)
+                    SELECT UNNEST(CAST(:balances AS numeric[]))
+                    RETURNING wallet_uuid, balance
+                ), ledger AS (
+                    INSERT INTO wallet_ledger (wallet_uuid, entry_type, amount)
+                    SELECT wallet_uuid, :entry_type, balance FROM created WHERE balance <> 0
+                )
+                SELECT wallet_uuid, balance FROM created
+                """
+            ),
+            {"balances": initial_balances, "entry_type": LEDGER_INITIAL}
+        )
+        wallets = [{"wallet_uuid": row[0], "balance": row[1]} for row in result.fetchall()]
+        if len(wallets) != len(initial_balances):
+            logger.error("Создано %d кошельков из %d", len(wallets), len(initial_balances))
+            raise WalletCreationError("Wallet creation failed")
+        logger.info("Создано кошельков: %d", len(wallets))
+        return wallets
+
+
+async def get_balances(db: AsyncSession, wallet_uuids: list[str]) -> dict[str, BalanceUpdate]:
+    """
+    Читает балансы нескольких кошельков одним запросом.
+    Возвращает словарь {wallet_uuid: BalanceUpdate}; несуществующие кошельки в него не попадают.
+    """
+    result = await db.execute(
+        text(
+            """
+            SELECT w.wallet_uuid,
+                   CASE WHEN w.hot_slots > 0
+                        THEN (SELECT COALESCE(SUM(s.balance), 0)
+                              FROM wallet_balance_slot s
+                              WHERE s.wallet_uuid = w.wallet_uuid)
+                        ELSE w.balance
+                   END,
+                   w.version,
+                   w.hot_slots > 0
+            FROM wallet w
+            WHERE w.wallet_uuid = ANY(CAST(:wallet_uuids AS uuid[]))
+            """
+        ),
+        {"wallet_uuids": wallet_uuids}
+    )
+    return {str(row[0]): BalanceUpdate(row[1], row[2], row[3]) for row in result.fetchall()}
+
+
+async def get_recent_balances(db: AsyncSession, limit: int) -> dict[str, BalanceUpdate]:
+    """
+    Читает балансы limit последних изменённых обычных кошельков (для прогрева кэша).
+    Горячие кошельки пропускаются: их сумма кэшируется лишь на HOT_BALANCE_CACHE_TTL.
+    """
+    result = await db.execute(
+        text(
+            """
+            SELECT wallet_uuid, balance, version
+            FROM wallet
+            WHERE hot_slots = 0
+            ORDER BY updated_at DESC
+            LIMIT :limit
+            """
+        ),
+        {"limit": limit}
+    )
+    return {str(row[0]): BalanceUpdate(row[1], row[2]) for row in result.fetchall()}
+
+
+async def get_wallet_uuids(db: AsyncSession, after: str | None, limit: int) -> list[str]:
+    """
+    Возвращает до limit идентификаторов кошельков, следующих за after в порядке wallet_uuid
+    (постранично по уникальному индексу, для построения фильтра известных кошельков).
+    """
+    # Условие без after не добавляется, чтобы план запроса всегда шёл по индексу
+    condition = "WHERE wallet_uuid > CAST(:after AS uuid)" if after is not None else ""
+    result = await db.execute(
+        text(
+            f"""
+            SELECT wallet_uuid
+            FROM wallet
+            {condition}
+            ORDER BY wallet_uuid
+            LIMIT :limit
+            """
+        ),
+        {"after": after, "limit": limit} if after is not None else {"limit": limit}
+    )
+    return [str(row[0]) for row in result.fetchall()]
+
+
+async def mark_processed(db: AsyncSession, operation_ids: list[str]) -> set[str]:
+    """
+    Отмечает операции как применённые в текущей транзакции.
+    Возвращает идентификаторы, которые ещё не применялись; остальные — повторы.
+    """
+    if not operation_ids:
+        return set()
+    result = await db.execute(
+        text(
+            """
+            INSERT INTO processed_operation (operation_id)
+            SELECT UNNEST(CAST(:operation_ids AS uuid[]))
+            ON CONFLICT DO NOTHING
+            RETURNING operation_id
+            """
+        ),
+        {"operation_ids": operation_ids}
+    )
+    return {str(row[0]) for row in result.fetchall()}
+
+
+async def unmark_processed(db: AsyncSession, operation_ids: list[str]) -> None:
+    """
+    Снимает отметки операций, которые не удалось применить, в текущей транзакции:
+    как и в wallet_apply_operation, такую операцию можно повторить с тем же идентификатором.
+    """
+    if not operation_ids:
+        return
+    await db.execute(
+        text("DELETE FROM processed_operation WHERE operation_id = ANY(CAST(:operation_ids AS uuid[]))"),
+        {"operation_ids": operation_ids}
+    )
+
+
+async def purge_processed_operations(db: AsyncSession, older_than: int) -> int:
+    """Удаляет отметки о применённых операциях старше older_than секунд. Возвращает число удалённых."""
+    async with db.begin():
+        result = await db.execute(
+            text(
+                """
+                DELETE FROM processed_operation
+                WHERE processed_at < NOW() - make_interval(secs => :older_than)
+                """
+            ),
+            {"older_than": older_than}
+        )
+        return result.rowcount
+
+
+def ledger_entries(
+        operations: list[tuple],
+        operation_ids: list[str | None],
+        results: list[BalanceUpdate | TransferResult | Exception]
+) -> list[LedgerEntry]:
+    """
+    Строки журнала для применённых операций (в формате process_operations_batch): по строке
+    на депозит или снятие, две строки на перевод. Неприменённые операции в журнал не попадают.
+    """
+    entries = []
+    for operation, operation_id, result in zip(operations, operation_ids, results):
+        wallet_key, operation_type, amount = str(operation[0]), operation[1], operation[2]
+        if isinstance(result, TransferResult):
+            target_key = str(operation[3])
+            entries.append(LedgerEntry(wallet_key, operation_type.value, -amount, operation_id, target_key))
+            entries.append(LedgerEntry(target_key, operation_type.value, amount, operation_id, wallet_key))
+        elif isinstance(result, BalanceUpdate):
+            delta = amount if operation_type == OperationType.DEPOSIT else -amount
+            entries.append(LedgerEntry(wallet_key, operation_type.value, delta, operation_id))
+    return entries
+
+
+async def record_ledger(db: AsyncSession, entries: list[LedgerEntry]) -> None:
+    """
+    Дописывает строки в журнал wallet_ledger одним многострочным INSERT в текущей транзакции.
+    Идентификаторы строк выдаются в порядке списка, то есть в порядке применения операций.
+    """
+    if not entries:
+        return
+    await db.execute(
+        text(
+            """
+            INSERT INTO wallet_ledger (wallet_uuid, entry_type, amount, operation_id, counterparty_uuid)
+            SELECT wallet_uuid, entry_type, amount, operation_id, counterparty_uuid
+            FROM UNNEST(CAST(:wallet_uuids AS uuid[]), CAST(:entry_types AS varchar[]),
+                        CAST(:amounts AS numeric[]), CAST(:operation_ids AS uuid[]),
+                        CAST(:counterparty_uuids AS uuid[]))
+                 WITH ORDINALITY AS e(wallet_uuid, entry_type, amount, operation_id, counterparty_uuid, position)
+            ORDER BY position
+            """
+        ),
+        {
+            "wallet_uuids": [entry.wallet_uuid for entry in entries],
+            "entry_types": [entry.entry_type for entry in entries],
+            "amounts": [entry.amount for entry in entries],
+            "operation_ids": [entry.operation_id for entry in entries],
+            "counterparty_uuids": [entry.counterparty_uuid for entry in entries],
+        }
+    )
+
+
+async def get_wallet_history(db: AsyncSession, wallet_uuid: str, before: int | None, limit: int) -> list[dict]:
+    """
+    Возвращает до limit строк журнала кошелька от новых к старым, с id меньше before
+    (постранично по индексу (wallet_uuid, id): следующая страница начинается с id последней строки).
+    """
+    # Как в get_wallet_uuids: без before условие не добавляется
+    condition = "AND id < :before" if before is not None else ""
+    params = {"wallet_uuid": wallet_uuid, "limit": limit}
+    if before is not None:
+        params["before"] = before
+    result = await db.execute(
+        text(
+            f"""
+            SELECT id, entry_type, amount, operation_id, counterparty_uuid, created_at
+            FROM wallet_ledger
+            WHERE wallet_uuid = :wallet_uuid
+              {condition}
+            ORDER BY id DESC
+            LIMIT :limit
+            """
+        ),
+        params
+    )
+    return [
+        {
+            "id": row[0],
+            "entry_type": row[1],
+            "amount": row[2],
+            "operation_id": str(row[3]) if row[3] is not None else None,
+            "counterparty_uuid": str(row[4]) if row[4] is not None else None,
+            "created_at": row[5],
+        }
+        for row in result.fetchall()
+    ]
+
+
+async def get_balance_at(db: AsyncSession, wallet_uuid: str, at: datetime) -> Decimal | None:
+    """
+    Баланс кошелька на момент at: последний снимок не позже at плюс строки журнала после снимка
+    до at включительно. Возвращает None, если кошелька нет. Изменения до появления журнала
+    учтены только начальным снимком (см. миграцию 009), поэтому баланс на более ранний момент не восстанавливается.
+    """
+    result = await db.execute(
+        text(
+            """
+            WITH snapshot AS (
+                SELECT ledger_id, balance
+                FROM wallet_balance_snapshot
+                WHERE wallet_uuid = :wallet_uuid
+                  AND taken_at <= :at
+                ORDER BY taken_at DESC, ledger_id DESC
+                LIMIT 1
+            )
+            SELECT COALESCE((SELECT balance FROM snapshot), 0) + COALESCE((
+                       SELECT SUM(l.amount)
+                       FROM wallet_ledger l
+                       WHERE l.wallet_uuid = :wallet_uuid
+                         AND l.id > COALESCE((SELECT ledger_id FROM snapshot), 0)
+                         AND l.created_at <= :at
+                   ), 0)
+            FROM wallet
+            WHERE wallet_uuid = :wallet_uuid
+            """
+        ),
+        {"wallet_uuid": wallet_uuid, "at": at}
+    )
+    row = result.fetchone()
+    return row[0] if row is not None else None
+
+
+async def take_balance_snapshots(db: AsyncSession, active_within: float, batch_size: int) -> int:
+    """
+    Записывает снимки балансов кошельков, у которых за последние active_within секунд появились
+    строки журнала после их последнего снимка. Возвращает число снимков.
+
+    Кошельки снимаются пачками по batch_size, каждая — отдельной короткой транзакцией. Строки кошельков
+    (и слоты горячих) блокируются FOR SHARE в порядке wallet_uuid: транзакции, уже изменившие баланс,
+    завершаются до снимка, поэтому снимок включает ровно строки журнала кошелька до последней на этот момент.
+    """
+    result = await db.execute(
+        text(
+            """
+            WITH recent AS (
+                SELECT wallet_uuid, MAX(id) AS last_id
+                FROM wallet_ledger
+                WHERE created_at >= NOW() - make_interval(secs => :active_within)
+                GROUP BY wallet_uuid
+            )
+            SELECT r.wallet_uuid
+            FROM recent r
+            WHERE r.last_id > COALESCE((
+                SELECT MAX(s.ledger_id) FROM wallet_balance_snapshot s WHERE s.wallet_uuid = r.wallet_uuid
+            ), 0)
+            ORDER BY r.wallet_uuid
+            """
+        ),
+        {"active_within": active_within}
+    )
+    wallet_ids = [str(row[0]) for row in result.fetchall()]
+    await db.commit()
+
+    taken = 0
+    for start in range(0, len(wallet_ids), batch_size):
+        async with db.begin():
+            locked = await db.execute(
+                text(
+                    """
+                    SELECT wallet_uuid, balance, hot_slots
+                    FROM wallet
+                    WHERE wallet_uuid = ANY(CAST(:wallet_ids AS uuid[]))
+                    ORDER BY wallet_uuid
+                    FOR SHARE
+                    """
+                ),
+                {"wallet_ids": wallet_ids[start:start + batch_size]}
+            )
+            balances = {}
+            hot_wallets = []
+            for wallet_uuid, balance, hot_slots in locked.fetchall():
+                balances[str(wallet_uuid)] = balance if hot_slots == 0 else Decimal("0")
+                if hot_slots > 0:
+                    hot_wallets.append(str(wallet_uuid))
+            if hot_wallets:
+                # Баланс горячего кошелька — сумма слотов (wallet.balance равен 0)
+                slots = await db.execute(
+                    text(
+                        """
+                        SELECT wallet_uuid, balance
+                        FROM wallet_balance_slot
+                        WHERE wallet_uuid = ANY(CAST(:wallet_ids AS uuid[]))
+                        ORDER BY wallet_uuid, slot
+                        FOR SHARE
+                        """
+                    ),
+                    {"wallet_ids": hot_wallets}
+                )
+                for wallet_uuid, balance in slots.fetchall():
+                    balances[str(wallet_uuid)] += balance
+            if not balances:
+                continue
+            inserted = await db.execute(
+                text(
+                    """
+                    INSERT INTO wallet_balance_snapshot (wallet_uuid, ledger_id, balance)
+                    SELECT v.wallet_uuid,
+                           COALESCE((SELECT MAX(l.id) FROM wallet_ledger l WHERE l.wallet_uuid = v.wallet_uuid), 0),
+                           v.balance
+                    FROM UNNEST(CAST(:wallet_ids AS uuid[]), CAST(:balances AS numeric[])) AS v(wallet_uuid, balance)
+                    ON CONFLICT DO NOTHING
+                    """
+                ),
+                {"wallet_ids": list(balances), "balances": list(balances.values())}
+            )
+            taken += inserted.rowcount
+    return taken
+
+
+async def create_ledger_partitions(db: AsyncSession, months_ahead: int) -> int:
+    """
+    Создаёт месячные секции журнала на months_ahead месяцев вперёд
+    (функция wallet_ledger_create_partitions, см. миграцию 008). Возвращает число созданных секций.
+    """
+    async with db.begin():
+        result = await db.execute(
+            text("SELECT wallet_ledger_create_partitions(:months_ahead)"),
+            {"months_ahead": months_ahead}
+        )
+        return result.scalar_one()
+
+
+async def apply_operation(
         db: AsyncSession,
         wallet_uuid: UUID,
         operation_type: OperationType,
-        amount: Decimal
-) -> Decimal:
+        amount: Decimal,
+        operation_id: str | None = None,
+        reference: str | None = None
+) -> BalanceUpdate:
     """
     Выполняет депозит или снятие денег за один SQL UPDATE.
 
@@ -69,15 +489,26 @@ async def process_operation(
 
     Для операции WITHDRAW:
       - уменьшает баланс на указанную сумму, если средств достаточно.
+
+    Если передан operation_id, он фиксируется в processed_operation в той же транзакции,
+    и повторное применение той же операции завершается DuplicateOperationError.
+
+    Изменение баланса записывается в журнал wallet_ledger в той же транзакции; reference —
+    идентификатор операции для журнала (по умолчанию operation_id).
+
+    Возвращает новый баланс вместе с версией кошелька.
     """
     # Формируем SQL-запрос и параметры в зависимости от типа операции
     if operation_type == OperationType.DEPOSIT:
         query = text(
             """
             UPDATE wallet
-            SET balance = balance + :amount
+            SET balance = balance + :amount,
+                version = version + 1,
+                updated_at = NOW()
             WHERE wallet_uuid = :wallet_uuid
-            RETURNING balance
+              AND hot_slots = 0
+            RETURNING balance, version
             """
         )
         params = {"amount": amount, "wallet_uuid": str(wallet_uuid)}
@@ -85,10 +516,13 @@ async def process_operation(
         query = text(
             """
             UPDATE wallet
-            SET balance = balance - :amount
+            SET balance = balance - :amount,
+                version = version + 1,
+                updated_at = NOW()
             WHERE wallet_uuid = :wallet_uuid
+              AND hot_slots = 0
               AND balance >= :amount
-            RETURNING balance
+            RETURNING balance, version
             """
         )
         params = {"amount": amount, "wallet_uuid": str(wallet_uuid)}
@@ -96,6 +530,10 @@ async def process_operation(
         raise InvalidOperationTypeError("Invalid operation type")
 
     async with db.begin():
+        if operation_id is not None and not await mark_processed(db, [operation_id]):
+            logger.warning("Операция %s уже применена", operation_id)
+            raise DuplicateOperationError("Operation already processed")
+
         result = await db.execute(query, params)
         row = result.fetchone()
 
@@ -103,7 +541,7 @@ async def process_operation(
         if not row:
             check_query = text(
                 """
-                SELECT wallet_uuid, balance 
+                SELECT wallet_uuid, version, hot_slots
                 FROM wallet 
                 WHERE wallet_uuid = :wallet_uuid
                 """
@@ -113,12 +551,452 @@ async def process_operation(
             if wallet_row is None:
                 logger.error("Кошелёк %s не найден", wallet_uuid)
                 raise WalletNotFoundError("Wallet not found")
+            elif wallet_row[2] > 0:
+                # Горячий кошелёк: операция идёт в слоты, строка wallet не блокируется
+                hot_result = (await apply_hot_operations(
+                    db, wallet_uuid, wallet_row[2], wallet_row[1], [(operation_type, amount)]
+                ))[0]
+                if isinstance(hot_result, Exception):
+                    raise hot_result
+                update = hot_result
             else:
                 logger.error("Недостаточно средств на кошельке %s: операция %s, сумма %s",
                              wallet_uuid, operation_type, amount)
                 raise InsufficientFundsError("Insufficient funds")
+        else:
+            update = BalanceUpdate(row[0], row[1])
+
+        await record_ledger(db, ledger_entries(
+            [(wallet_uuid, operation_type, amount)], [reference or operation_id], [update]
+        ))
 
-    new_balance = row[0]
     #logger.info("Операция %s на кошельке %s выполнена. Новый баланс: %s",
-     #           operation_type, wallet_uuid, new_balance)
-    return new_balance
+     #           operation_type, wallet_uuid, row[0])
+    return update
+
+
+async def enable_hot_wallet(db: AsyncSession, wallet_uuid: UUID, slots: int) -> tuple[BalanceUpdate, int]:
+    """
+    Переводит кошелёк в горячий режим: баланс распределяется по slots строкам wallet_balance_slot,
+    и операции разных транзакций почти всегда изменяют разные строки.
+
+    Число слотов можно только увеличить — операции читают его без блокировки строки wallet,
+    поэтому уменьшение могло бы оставить средства в удалённом слоте.
+    Возвращает текущий баланс кошелька и итоговое число слотов.
+    """
+    async with db.begin():
+        result = await db.execute(
+            text(
+                """
+                SELECT balance, version, hot_slots
+                FROM wallet
+                WHERE wallet_uuid = :wallet_uuid
+                FOR UPDATE
+                """
+            ),
+            {"wallet_uuid": str(wallet_uuid)}
+        )
+        row = result.fetchone()
+        if row is None:
+            logger.error("Кошелёк %s не найден", wallet_uuid)
+            raise WalletNotFoundError("Wallet not found")
+        balance, version, current_slots = row
+
+        if slots > current_slots:
+            # Баланс обычного кошелька переносится в слот 0; у горячего wallet.balance уже равен 0
+            await db.execute(
+                text(
+                    """
+                    INSERT INTO wallet_balance_slot (wallet_uuid, slot, balance)
+                    SELECT CAST(:wallet_uuid AS uuid), slot,
+                           CASE WHEN slot = 0 THEN CAST(:balance AS numeric) ELSE 0 END
+                    FROM generate_series(CAST(:first_slot AS integer), CAST(:last_slot AS integer)) AS slot
+                    ON CONFLICT DO NOTHING
+                    """
+                ),
+                {"wallet_uuid": str(wallet_uuid), "balance": balance,
+                 "first_slot": current_slots, "last_slot": slots - 1}
+            )
+            updated = await db.execute(
+                text(
+                    """
+                    UPDATE wallet
+                    SET balance = 0,
+                        hot_slots = :slots,
+                        version = version + 1,
+                        updated_at = NOW()
+                    WHERE wallet_uuid = :wallet_uuid
+                    RETURNING version
+                    """
+                ),
+                {"wallet_uuid": str(wallet_uuid), "slots": slots}
+            )
+            version = updated.scalar_one()
+            current_slots = slots
+            logger.info("Кошелёк %s переведён в горячий режим: %d слотов", wallet_uuid, slots)
+
+        total = await db.execute(
+            text("SELECT COALESCE(SUM(balance), 0) FROM wallet_balance_slot WHERE wallet_uuid = :wallet_uuid"),
+            {"wallet_uuid": str(wallet_uuid)}
+        )
+        return BalanceUpdate(total.scalar_one(), version, True), current_slots
+
+
+async def _add_to_slot(db: AsyncSession, wallet_uuid: UUID, slot: int, delta: Decimal) -> Decimal | None:
+    """
+    Изменяет один слот горячего кошелька на delta, если слот не уходит в минус.
+    Возвращает новый баланс кошелька (сумму слотов) или None, если в слоте недостаточно средств.
+    """
+    result = await db.execute(
+        text(
+            """
+            WITH changed AS (
+                UPDATE wallet_balance_slot
+                SET balance = balance + :delta
+                WHERE wallet_uuid = :wallet_uuid
+                  AND slot = :slot
+                  AND balance + :delta >= 0
+                RETURNING slot, balance
+            )
+            SELECT changed.balance + (
+                SELECT COALESCE(SUM(s.balance), 0)
+                FROM wallet_balance_slot s
+                WHERE s.wallet_uuid = :wallet_uuid
+                  AND s.slot <> changed.slot
+            )
+            FROM changed
+            """
+        ),
+        {"wallet_uuid": str(wallet_uuid), "slot": slot, "delta": delta}
+    )
+    row = result.fetchone()
+    return row[0] if row is not None else None
+
+
+async def _lock_slots(db: AsyncSession, wallet_uuid: UUID, slots: int) -> Decimal:
+    """Блокирует все слоты кошелька (в порядке номеров, чтобы не ловить deadlock) и возвращает их сумму."""
+    result = await db.execute(
+        text(
+            """
+            SELECT balance
+            FROM wallet_balance_slot
+            WHERE wallet_uuid = :wallet_uuid
+              AND slot < :slots
+            ORDER BY slot
+            FOR UPDATE
+            """
+        ),
+        {"wallet_uuid": str(wallet_uuid), "slots": slots}
+    )
+    return sum((row[0] for row in result.fetchall()), Decimal("0"))
+
+
+async def _spread_slots(db: AsyncSession, wallet_uuid: UUID, slots: int, total: Decimal) -> None:
+    """Распределяет total по заблокированным слотам поровну; остаток от деления достаётся слоту 0."""
+    share = (total / slots).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+    await db.execute(
+        text(
+            """
+            UPDATE wallet_balance_slot
+            SET balance = CASE WHEN slot = 0 THEN CAST(:first AS numeric) ELSE CAST(:share AS numeric) END
+            WHERE wallet_uuid = :wallet_uuid
+              AND slot < :slots
+            """
+        ),
+        {"wallet_uuid": str(wallet_uuid), "slots": slots, "share": share, "first": total - share * (slots - 1)}
+    )
+
+
+async def apply_hot_operations(
+        db: AsyncSession,
+        wallet_uuid: UUID,
+        slots: int,
+        version: int,
+        operations: list[tuple[OperationType, Decimal]]
+) -> list[BalanceUpdate | Exception]:
+    """
+    Применяет операции горячего кошелька в текущей транзакции, не блокируя строку wallet.
+
+    Депозиты (и одиночное снятие) изменяют один случайный слот. Если в операциях есть
+    снятия или в слоте не хватило средств, блокируются все слоты: операции применяются
+    к их сумме, а остаток заново распределяется по слотам поровну.
+    Версия кошелька при этом не меняется.
+    """
+    results: list[BalanceUpdate | Exception | None] = [None] * len(operations)
+    deltas: list[tuple[int, Decimal]] = []
+    for i, (operation_type, amount) in enumerate(operations):
+        if operation_type == OperationType.DEPOSIT:
+            deltas.append((i, amount))
+        elif operation_type == OperationType.WITHDRAW:
+            deltas.append((i, -amount))
+        else:
+            results[i] = InvalidOperationTypeError("Invalid operation type")
+    if not deltas:
+        return results
+
+    net = sum((delta for _, delta in deltas), Decimal("0"))
+    total = None
+    if len(deltas) == 1 or all(delta > 0 for _, delta in deltas):
+        total = await _add_to_slot(db, wallet_uuid, random.randrange(slots), net)
+
+    if total is not None:
+        balance = total - net
+        for i, delta in deltas:
+            balance += delta
+            results[i] = BalanceUpdate(balance, version, True)
+        return results
+
+    balance = await _lock_slots(db, wallet_uuid, slots)
+    for i, delta in deltas:
+        if balance + delta < 0:
+            logger.error("Недостаточно средств на кошельке %s: сумма %s", wallet_uuid, -delta)
+            results[i] = InsufficientFundsError("Insufficient funds")
+            continue
+        balance += delta
+        results[i] = BalanceUpdate(balance, version, True)
+    await _spread_slots(db, wallet_uuid, slots, balance)
+    return results
+
+
+async def compact_hot_wallets(db: AsyncSession) -> int:
+    """
+    Выравнивает слоты горячих кошельков: после депозитов в случайные слоты средства
+    распределены неравномерно, и снятие из случайного слота чаще упирается в блокировку всех слотов.
+    Каждый кошелёк выравнивается отдельной короткой транзакцией. Возвращает число кошельков.
+    """
+    result = await db.execute(text("SELECT wallet_uuid, hot_slots FROM wallet WHERE hot_slots > 0"))
+    hot_wallets = result.fetchall()
+    await db.commit()
+    for wallet_uuid, slots in hot_wallets:
+        async with db.begin():
+            await _spread_slots(db, wallet_uuid, slots, await _lock_slots(db, wallet_uuid, slots))
+    return len(hot_wallets)
+
+
+async def process_operation(
+        db: AsyncSession,
+        wallet_uuid: UUID,
+        operation_type: OperationType,
+        amount: Decimal
+) -> Decimal:
+    """
+    Выполняет депозит или снятие денег (см. apply_operation) и возвращает новый баланс.
+    """
+    update = await apply_operation(db, wallet_uuid, operation_type, amount)
+    return update.balance
+
+
+async def apply_transfer(
+        db: AsyncSession,
+        source_uuid: UUID,
+        target_uuid: UUID,
+        amount: Decimal,
+        operation_id: str | None = None,
+        reference: str | None = None
+) -> TransferResult:
+    """
+    Переводит amount с кошелька source_uuid на кошелёк target_uuid в одной транзакции
+    (пачка из одной операции, см. process_operations_batch). Строки обоих кошельков
+    блокируются в порядке wallet_uuid, поэтому встречные переводы не ловят deadlock.
+
+    Исключения те же, что у apply_operation; InvalidOperationTypeError — перевод на тот же кошелёк.
+    """
+    result = (await process_operations_batch(
+        db, [(source_uuid, OperationType.TRANSFER, amount, target_uuid)], [operation_id], [reference]
+    ))[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+async def process_operations_batch(
+        db: AsyncSession,
+        operations: list[tuple],
+        operation_ids: list[str | None] | None = None,
+        references: list[str | None] | None = None
+) -> list[BalanceUpdate | TransferResult | Exception]:
+    """
+    Применяет пачку операций в одной транзакции.
+
+    Строки всех затронутых кошельков (включая получателей переводов) блокируются одним
+    SELECT ... FOR UPDATE (в порядке wallet_uuid, чтобы параллельные воркеры не ловили deadlock),
+    затем операции применяются по очереди в памяти — так сохраняется порядок
+    операций внутри кошелька и семантика WITHDRAW для каждой операции.
+    Итоговые изменения записываются одним UPDATE ... FROM (VALUES ...).
+    Операции горячих кошельков применяются к их слотам (см. apply_hot_operations)
+    после блокировки обычных кошельков, строки wallet горячих кошельков не блокируются.
+    Если в пачке есть перевод с участием горячего кошелька, слоты всех горячих кошельков пачки
+    блокируются целиком (в порядке wallet_uuid), и их операции вычисляются в памяти вместе с остальными.
+    Применённые операции записываются в журнал wallet_ledger одним INSERT в той же транзакции.
+
+    Параметры:
+        db (AsyncSession): сессия для работы с базой данных.
+        operations (list): кортежи (wallet_uuid, operation_type, amount) или, для переводов,
+            (wallet_uuid, OperationType.TRANSFER, amount, target_uuid) в порядке очереди.
+        operation_ids (list): идентификаторы операций для защиты от повторного применения
+            (None — операция без защиты), в том же порядке.
+        references (list): идентификаторы операций для журнала в том же порядке
+            (по умолчанию operation_ids).
+
+    Возвращает:
+        list: для каждой операции новый баланс с версией (BalanceUpdate), для перевода —
+        балансы обоих кошельков (TransferResult), либо исключение (WalletNotFoundError,
+        InsufficientFundsError, InvalidOperationTypeError, DuplicateOperationError).
+        Ошибка одной операции не откатывает остальные операции пачки, а её отметка
+        в processed_operation снимается, чтобы операцию можно было повторить.
+    """
+    results: list[BalanceUpdate | TransferResult | Exception | None] = []
+    targets = [str(operation[3]) if len(operation) > 3 and operation[3] is not None else None
+               for operation in operations]
+    wallet_ids = sorted({str(operation[0]) for operation in operations} | {target for target in targets if target})
+    if not wallet_ids:
+        return results
+
+    async with db.begin():
+        locked = await db.execute(
+            text(
+                """
+                SELECT wallet_uuid, balance, version
+                FROM wallet
+                WHERE wallet_uuid = ANY(CAST(:wallet_ids AS uuid[]))
+                  AND hot_slots = 0
+                ORDER BY wallet_uuid
+                FOR UPDATE
+                """
+            ),
+            {"wallet_ids": wallet_ids}
+        )
+        balances = {str(row[0]): BalanceUpdate(row[1], row[2]) for row in locked.fetchall()}
+
+        # Кошельки, не попавшие под блокировку, — горячие или несуществующие
+        hot_wallets: dict[str, tuple[int, int]] = {}
+        missing = [wallet_id for wallet_id in wallet_ids if wallet_id not in balances]
+        if missing:
+            hot = await db.execute(
+                text(
+                    """
+                    SELECT wallet_uuid, hot_slots, version
+                    FROM wallet
+                    WHERE wallet_uuid = ANY(CAST(:wallet_ids AS uuid[]))
+                      AND hot_slots > 0
+                    """
+                ),
+                {"wallet_ids": missing}
+            )
+            hot_wallets = {str(row[0]): (row[1], row[2]) for row in hot.fetchall()}
+
+        # Перевод с участием горячего кошелька требует его точной суммы: блокируем все слоты
+        # горячих кошельков пачки после строк wallet, в порядке wallet_uuid
+        locked_hot: set[str] = set()
+        if any(target is not None and {str(operation[0]), target} & hot_wallets.keys()
+               for operation, target in zip(operations, targets)):
+            for wallet_key in sorted(hot_wallets):
+                slots, version = hot_wallets[wallet_key]
+                balances[wallet_key] = BalanceUpdate(await _lock_slots(db, wallet_key, slots), version, True)
+                locked_hot.add(wallet_key)
+
+        hot_operations: dict[str, list[tuple[int, OperationType, Decimal]]] = {}
+        deltas: dict[str, Decimal] = {}
+        applied: dict[str, int] = {}
+        changed_hot: set[str] = set()
+
+        def apply_delta(wallet_key: str, delta: Decimal) -> BalanceUpdate:
+            current = balances[wallet_key]
+            if current.hot:
+                # Версия горячего кошелька не меняется; итог распределяется по слотам в конце
+                balances[wallet_key] = current._replace(balance=current.balance + delta)
+                changed_hot.add(wallet_key)
+            else:
+                # Каждая применённая операция увеличивает версию кошелька на единицу
+                balances[wallet_key] = BalanceUpdate(current.balance + delta, current.version + 1)
+                deltas[wallet_key] = deltas.get(wallet_key, Decimal("0")) + delta
+                applied[wallet_key] = applied.get(wallet_key, 0) + 1
+            return balances[wallet_key]
+
+        operation_ids = operation_ids or [None] * len(operations)
+        fresh_ids = await mark_processed(db, [operation_id for operation_id in operation_ids if operation_id])
+
+        for operation, target_key, operation_id in zip(operations, targets, operation_ids):
+            wallet_uuid, operation_type, amount = operation[:3]
+            if operation_id is not None:
+                if operation_id not in fresh_ids:
+                    logger.warning("Операция %s уже применена", operation_id)
+                    results.append(DuplicateOperationError("Operation already processed"))
+                    continue
+                # Повтор той же операции внутри пачки тоже считается дубликатом
+                fresh_ids.discard(operation_id)
+
+            wallet_key = str(wallet_uuid)
+            if wallet_key in hot_wallets and wallet_key not in locked_hot:
+                hot_operations.setdefault(wallet_key, []).append((len(results), operation_type, amount))
+                results.append(None)
+                continue
+
+            current = balances.get(wallet_key)
+            if current is None:
+                logger.error("Кошелёк %s не найден", wallet_uuid)
+                results.append(WalletNotFoundError("Wallet not found"))
+                continue
+
+            if operation_type == OperationType.TRANSFER and (target_key is None or target_key == wallet_key):
+                results.append(InvalidOperationTypeError("Transfer requires a different target wallet"))
+            elif operation_type == OperationType.TRANSFER and target_key not in balances:
+                logger.error("Кошелёк %s не найден", target_key)
+                results.append(WalletNotFoundError("Wallet not found"))
+            elif operation_type not in (OperationType.DEPOSIT, OperationType.WITHDRAW, OperationType.TRANSFER):
+                results.append(InvalidOperationTypeError("Invalid operation type"))
+            elif operation_type != OperationType.DEPOSIT and current.balance < amount:
+                logger.error("Недостаточно средств на кошельке %s: операция %s, сумма %s",
+                             wallet_uuid, operation_type, amount)
+                results.append(InsufficientFundsError("Insufficient funds"))
+            elif operation_type == OperationType.TRANSFER:
+                results.append(TransferResult(apply_delta(wallet_key, -amount), apply_delta(target_key, amount)))
+            else:
+                results.append(apply_delta(wallet_key, amount if operation_type == OperationType.DEPOSIT else -amount))
+
+        if deltas:
+            values = []
+            params = {}
+            for i, (wallet_key, delta) in enumerate(deltas.items()):
+                values.append(
+                    f"(CAST(:wallet_{i} AS uuid), CAST(:delta_{i} AS numeric), CAST(:applied_{i} AS bigint))"
+                )
+                params[f"wallet_{i}"] = wallet_key
+                params[f"delta_{i}"] = delta
+                params[f"applied_{i}"] = applied[wallet_key]
+            await db.execute(
+                text(
+                    f"""
+                    UPDATE wallet AS w
+                    SET balance = w.balance + v.delta,
+                        version = w.version + v.applied,
+                        updated_at = NOW()
+                    FROM (VALUES {", ".join(values)}) AS v(wallet_uuid, delta, applied)
+                    WHERE w.wallet_uuid = v.wallet_uuid
+                    """
+                ),
+                params
+            )
+
+        for wallet_key in sorted(changed_hot):
+            await _spread_slots(db, wallet_key, hot_wallets[wallet_key][0], balances[wallet_key].balance)
+
+        # Слоты блокируются после строк wallet и по кошелькам в порядке wallet_uuid
+        for wallet_key in sorted(hot_operations):
+            slots, version = hot_wallets[wallet_key]
+            wallet_operations = hot_operations[wallet_key]
+            hot_results = await apply_hot_operations(
+                db, wallet_key, slots, version, [(operation_type, amount) for _, operation_type, amount in wallet_operations]
+            )
+            for (i, _, _), hot_result in zip(wallet_operations, hot_results):
+                results[i] = hot_result
+
+        # Отметки неудачных операций снимаются, иначе повтор (в том числе из DLQ) сочтут дубликатом
+        await unmark_processed(db, [
+            operation_id for operation_id, result in zip(operation_ids, results)
+            if operation_id is not None and isinstance(result, Exception)
+            and not isinstance(result, DuplicateOperationError)
+        ])
+        await record_ledger(db, ledger_entries(operations, references or operation_ids, results))
+
+    return results
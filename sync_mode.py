@@ -0,0 +1,68 @@
+import math
+import os
+import time
+from enum import Enum
+
+
+class OperationMode(str, Enum):
+    """Режим выполнения POST /api/v1/wallets/{wallet_uuid}/operation."""
+    # Постановка в очередь, итог — по GET /api/v1/operations/{operation_id}
+    ASYNC = "async"
+    # Выполнение сразу на пуле соединений API, итог — в ответе
+    SYNC = "sync"
+
+
+# Режим операций по умолчанию (если запрос не передал параметр mode): async или sync
+OPERATION_MODE = OperationMode(os.getenv("OPERATION_MODE", OperationMode.ASYNC.value))
+# Бюджет задержки синхронной операции, мс: пока сглаженная длительность выполнения (вместе
+# с ожиданием соединения из пула) выше бюджета, операции mode=sync ставятся в очередь
+SYNC_LATENCY_BUDGET_MS = float(os.getenv("SYNC_LATENCY_BUDGET_MS", "50"))
+# Сколько синхронных операций процесс API выполняет одновременно; остальные ставятся в очередь.
+# 0 — размер пула выбранной реализации горячего пути (DB_POOL_SIZE или ASYNCPG_POOL_SIZE,
+# см. repository.WalletRepository.pool_size), чтобы синхронные операции не ждали соединения
+SYNC_MAX_IN_FLIGHT = int(os.getenv("SYNC_MAX_IN_FLIGHT", "0"))
+# За сколько секунд оценка длительности без новых замеров затухает в e раз: после перегрузки
+# синхронное выполнение пробуется снова, хотя все операции уходили в очередь
+SYNC_LATENCY_DECAY = float(os.getenv("SYNC_LATENCY_DECAY", "1"))
+# Вес нового замера в сглаженной длительности
+SYNC_LATENCY_SMOOTHING = 0.2
+
+
+class LatencyBudget:
+    """
+    Решает, выполнить ли операцию mode=sync сразу или поставить в очередь.
+
+    Операция выполняется сразу, если процесс выполняет меньше max_in_flight синхронных операций
+    и сглаженная (экспоненциальное среднее) длительность последних из них не выше бюджета.
+    Без нагрузки это даёт наименьшую задержку, под нагрузкой — сглаживание очередью.
+    Состояние своё у каждого процесса API: он оценивает собственный пул соединений.
+    """
+
+    def __init__(self, max_in_flight: int, budget: float = SYNC_LATENCY_BUDGET_MS / 1000,
+                 decay: float = SYNC_LATENCY_DECAY):
+        self.budget = budget
+        self.max_in_flight = max_in_flight
+        self.decay = decay
+        self.in_flight = 0
+        self._latency = 0.0
+        self._observed_at = time.monotonic()
+
+    @property
+    def latency(self) -> float:
+        """Сглаженная длительность синхронной операции, затухающая со временем без новых замеров, с."""
+        return self._latency * math.exp(-(time.monotonic() - self._observed_at) / self.decay)
+
+    def try_acquire(self) -> bool:
+        """Занимает место синхронной операции; False — операцию нужно поставить в очередь."""
+        if self.in_flight >= self.max_in_flight or self.latency > self.budget:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    def observe(self, elapsed: float) -> None:
+        """Учитывает длительность выполненной синхронной операции, с."""
+        self._latency = self.latency * (1 - SYNC_LATENCY_SMOOTHING) + elapsed * SYNC_LATENCY_SMOOTHING
+        self._observed_at = time.monotonic()
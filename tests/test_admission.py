@@ -0,0 +1,126 @@
+import sys
+import os
+import unittest
+from unittest.mock import AsyncMock
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from admission import AdmissionControl, QueueMonitor, RateLimiter, Rejection
+from queues import QUEUE_NAME
+
+
+# Тесты для контроля приёма операций (fakeredis вместо локального Redis)
+class TestQueueMonitor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def _fill(self, count: int) -> None:
+        await self.redis.delete(QUEUE_NAME)
+        if count:
+            await self.redis.rpush(QUEUE_NAME, *(["op"] * count))
+
+    async def test_watermarks_hysteresis(self) -> None:
+        """
+        Тест для проверки гистерезиса: перегрузка наступает на верхней границе
+        и снимается только на нижней.
+        """
+        monitor = QueueMonitor(self.redis, high=10, low=5, interval=0)
+
+        await self._fill(9)
+        self.assertFalse(await monitor.is_overloaded(0))
+        await self._fill(10)
+        self.assertTrue(await monitor.is_overloaded(0))
+        await self._fill(7)
+        self.assertTrue(await monitor.is_overloaded(0))
+        await self._fill(5)
+        self.assertFalse(await monitor.is_overloaded(0))
+
+    async def test_backlog_is_sampled(self) -> None:
+        """
+        Тест для проверки, что лаг читается не на каждый запрос, а раз в интервал.
+        """
+        monitor = QueueMonitor(self.redis, high=10, low=5, interval=60)
+        monitor.queues[0].backlog = AsyncMock(return_value=0)
+
+        for _ in range(5):
+            await monitor.is_overloaded(0)
+
+        self.assertEqual(monitor.queues[0].backlog.await_count, 1)
+
+    async def test_disabled_without_high_watermark(self) -> None:
+        """
+        Тест для проверки, что при QUEUE_HIGH_WATERMARK=0 лаг не читается.
+        """
+        monitor = QueueMonitor(self.redis, high=0, low=0, interval=0)
+        monitor.queues[0].backlog = AsyncMock(return_value=100)
+
+        self.assertFalse(await monitor.is_overloaded(0))
+        monitor.queues[0].backlog.assert_not_awaited()
+
+    async def test_sync_operations_skip_watermark(self) -> None:
+        """
+        Тест для проверки операций mode=sync: при перегрузке партиции они принимаются (queued=False),
+        а перегрузку проверяет check_queue, только если операция ставится в очередь.
+        """
+        admission = AdmissionControl(self.redis)
+        admission.monitor = QueueMonitor(self.redis, high=10, low=5, interval=0)
+        await self._fill(10)
+
+        self.assertEqual((await admission.check(0, "wallet", "client")).reason, "queue_overloaded")
+        self.assertIsNone(await admission.check(0, "wallet", "client", queued=False))
+        self.assertEqual((await admission.check_queue(0)).reason, "queue_overloaded")
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def test_wallet_bucket(self) -> None:
+        """
+        Тест для проверки лимита кошелька: после всплеска операции отклоняются,
+        другие кошельки при этом не ограничены.
+        """
+        limiter = RateLimiter(self.redis, wallet_limit=(1, 3), client_limit=(0, 0))
+
+        for _ in range(3):
+            self.assertIsNone(await limiter.acquire("hot-wallet", "client"))
+        rejection = await limiter.acquire("hot-wallet", "client")
+
+        self.assertEqual(rejection.reason, "wallet_rate_limit")
+        self.assertTrue(0 < rejection.retry_after <= 1)
+        self.assertIsNone(await limiter.acquire("other-wallet", "client"))
+
+    async def test_rejection_does_not_spend_other_buckets(self) -> None:
+        """
+        Тест для проверки, что отклонённая по лимиту клиента операция не тратит токен кошелька.
+        """
+        limiter = RateLimiter(self.redis, wallet_limit=(1, 2), client_limit=(1, 1))
+
+        self.assertIsNone(await limiter.acquire("wallet", "client-1"))
+        self.assertEqual((await limiter.acquire("wallet", "client-1")).reason, "client_rate_limit")
+        self.assertIsNone(await limiter.acquire("wallet", "client-2"))
+
+    async def test_buckets_expire(self) -> None:
+        """
+        Тест для проверки, что корзины неактивных кошельков удаляются по TTL.
+        """
+        limiter = RateLimiter(self.redis, wallet_limit=(10, 20), client_limit=(0, 0))
+        await limiter.acquire("wallet", "client")
+
+        ttl = await self.redis.pttl("rate:wallet:wallet")
+        self.assertTrue(0 < ttl <= 3000)
+
+    def test_retry_after_header(self) -> None:
+        """
+        Тест для проверки округления Retry-After вверх до целых секунд (не меньше одной).
+        """
+        self.assertEqual(Rejection("wallet_rate_limit", 0.2).retry_after_header, "1")
+        self.assertEqual(Rejection("wallet_rate_limit", 2.5).retry_after_header, "3")
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
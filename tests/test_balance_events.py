@@ -0,0 +1,108 @@
+import sys
+import os
+import asyncio
+import unittest
+from decimal import Decimal
+
+import fakeredis
+import orjson
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from balance_events import balance_event, publish_balances, BalanceBroadcaster, BALANCE_CHANNEL
+from pubsub import PubSubHub
+
+FIRST = "6f1c2a4e-8b7d-4e0a-9c1b-2d3e4f5a6b7c"
+SECOND = "1a2b3c4d-5e6f-4a0b-8c1d-2e3f4a5b6c7d"
+
+
+# Тесты для раздачи изменений балансов подписчикам
+class TestBalanceBroadcaster(unittest.IsolatedAsyncioTestCase):
+    async def test_fan_out_by_wallet(self) -> None:
+        """
+        Тест для проверки раздачи: событие получают только подписчики изменившегося кошелька.
+        """
+        broadcaster = BalanceBroadcaster(queue_size=10)
+        both = broadcaster.subscribe([FIRST, SECOND])
+        second_only = broadcaster.subscribe([SECOND])
+
+        event = balance_event(FIRST, Decimal("10.50"), 3)
+        broadcaster.handle_message(BALANCE_CHANNEL, event)
+
+        self.assertEqual(await both.get(0.1), event)
+        self.assertIsNone(await second_only.get(0.01))
+        self.assertEqual(orjson.loads(event), {"wallet_uuid": FIRST, "balance": 10.5, "version": 3})
+
+    async def test_slow_subscriber_is_dropped(self) -> None:
+        """
+        Тест для проверки backpressure: подписчик с переполненной очередью отключается,
+        остальные продолжают получать события.
+        """
+        broadcaster = BalanceBroadcaster(queue_size=2)
+        slow = broadcaster.subscribe([FIRST])
+        fast = broadcaster.subscribe([FIRST])
+
+        for version in range(3):
+            broadcaster.handle_message(BALANCE_CHANNEL, balance_event(FIRST, Decimal("1.00"), version))
+            await fast.get(0.1)
+
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.dropped)
+        self.assertEqual(broadcaster.count, 1)
+
+    async def test_subscriber_limit(self) -> None:
+        """
+        Тест для проверки предела подписчиков процесса и освобождения места после отписки.
+        """
+        broadcaster = BalanceBroadcaster(max_subscribers=1)
+        subscriber = broadcaster.subscribe([FIRST])
+
+        self.assertIsNone(broadcaster.subscribe([SECOND]))
+        broadcaster.unsubscribe(subscriber)
+        broadcaster.unsubscribe(subscriber)
+        self.assertEqual(broadcaster.count, 0)
+        self.assertIsNotNone(broadcaster.subscribe([SECOND]))
+
+    async def test_drop_all(self) -> None:
+        """
+        Тест для проверки отключения всех подписчиков после переподключения pub/sub:
+        ожидающий событие поток просыпается.
+        """
+        broadcaster = BalanceBroadcaster()
+        subscriber = broadcaster.subscribe([FIRST, SECOND])
+        waiting = asyncio.create_task(subscriber.get(5))
+        await asyncio.sleep(0)
+
+        broadcaster.drop_all()
+
+        self.assertEqual(await waiting, "")
+        self.assertTrue(subscriber.dropped)
+        self.assertEqual(broadcaster.count, 0)
+
+    async def test_published_through_hub(self) -> None:
+        """
+        Тест для проверки доставки события от публикации воркером до подписчика через общее
+        pub/sub-соединение процесса.
+        """
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        broadcaster = BalanceBroadcaster()
+        subscriber = broadcaster.subscribe([FIRST])
+        hub = PubSubHub(redis)
+        hub.subscribe(BALANCE_CHANNEL, broadcaster.handle_message)
+        hub.start()
+        try:
+            event = balance_event(FIRST, Decimal("5.00"), 1)
+            for _ in range(50):
+                await publish_balances(redis, [event])
+                received = await subscriber.get(0.05)
+                if received is not None:
+                    break
+            self.assertEqual(received, event)
+        finally:
+            await hub.stop()
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
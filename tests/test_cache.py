@@ -0,0 +1,122 @@
+import sys
+import os
+import time
+import unittest
+from decimal import Decimal
+from uuid import uuid4
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cache
+from cache import BalanceCache, LocalCache, INVALIDATION_CHANNEL
+
+
+# Тесты для кэша балансов
+class TestBalanceCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.cache = BalanceCache(self.redis)
+        cache.stats = cache.CacheStats()
+
+    async def test_older_version_does_not_overwrite(self) -> None:
+        """
+        Тест для проверки защиты версией.
+        Запоздавшая запись со старой версией не затирает более свежий баланс.
+        """
+        wallet_uuid = uuid4()
+        self.assertTrue(await self.cache.set(wallet_uuid, Decimal("150.00"), 3))
+        self.assertFalse(await self.cache.set(wallet_uuid, Decimal("100.00"), 2))
+        self.assertEqual(await self.cache.get(wallet_uuid), Decimal("150.00"))
+
+    async def test_set_many_keeps_newest(self) -> None:
+        """
+        Тест для проверки пакетной записи воркером через конвейер.
+        """
+        first, second = str(uuid4()), str(uuid4())
+        await self.cache.set(first, Decimal("500.00"), 10)
+        await self.cache.set_many({first: (Decimal("1.00"), 9), second: (Decimal("2.00"), 1)})
+
+        self.assertEqual(await self.cache.get(first), Decimal("500.00"))
+        self.assertEqual(await self.cache.get(second), Decimal("2.00"))
+
+    async def test_publish_on_balance_change_only(self) -> None:
+        """
+        Тест для проверки публикации инвалидации.
+        Изменение баланса публикуется, заполнение кэша после промаха — нет.
+        """
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        await pubsub.get_message(timeout=0.1)  # Подтверждение подписки
+
+        changed, filled = str(uuid4()), str(uuid4())
+        await self.cache.set(filled, Decimal("1.00"), 1, publish=False)
+        await self.cache.set(changed, Decimal("2.00"), 1)
+
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
+        self.assertEqual(message["data"], changed)
+        self.assertIsNone(await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1))
+        await pubsub.close()
+
+    async def test_hit_ratio(self) -> None:
+        """
+        Тест для проверки подсчёта попаданий L1, Redis и промахов.
+        """
+        local_cache = LocalCache(10, 60)
+        balances = BalanceCache(self.redis, local_cache)
+        wallet_uuid = uuid4()
+
+        self.assertIsNone(await balances.get(wallet_uuid))
+        await self.redis.set(cache.cache_key(wallet_uuid), "1:10.00")
+        self.assertEqual(await balances.get(wallet_uuid), Decimal("10.00"))
+        self.assertEqual(await balances.get(wallet_uuid), Decimal("10.00"))
+
+        self.assertEqual(cache.stats.as_dict(), {"l1_hits": 1, "redis_hits": 1, "misses": 1, "hit_ratio": 2 / 3})
+
+    async def test_get_many(self) -> None:
+        """
+        Тест для проверки пакетного чтения: L1, затем один MGET для остальных, промахи не возвращаются.
+        """
+        local_cache = LocalCache(10, 60)
+        balances = BalanceCache(self.redis, local_cache)
+        in_l1, in_redis, missing = str(uuid4()), str(uuid4()), str(uuid4())
+        local_cache.set(cache.cache_key(in_l1), Decimal("1.00"))
+        await self.redis.set(cache.cache_key(in_redis), "3:2.00")
+
+        found = await balances.get_many([in_l1, in_redis, missing])
+
+        self.assertEqual(found, {in_l1: Decimal("1.00"), in_redis: Decimal("2.00")})
+        self.assertEqual(cache.stats.as_dict()["misses"], 1)
+        self.assertEqual(local_cache.get(cache.cache_key(in_redis)), Decimal("2.00"))
+
+
+class TestLocalCache(unittest.TestCase):
+    def test_lru_eviction(self) -> None:
+        """
+        Тест для проверки вытеснения давно не использованных записей.
+        """
+        local_cache = LocalCache(2, 60)
+        local_cache.set("a", Decimal("1"))
+        local_cache.set("b", Decimal("2"))
+        local_cache.get("a")
+        local_cache.set("c", Decimal("3"))
+
+        self.assertIsNone(local_cache.get("b"))
+        self.assertEqual(local_cache.get("a"), Decimal("1"))
+        self.assertEqual(local_cache.get("c"), Decimal("3"))
+
+    def test_ttl_expiry(self) -> None:
+        """
+        Тест для проверки истечения записей по TTL.
+        """
+        local_cache = LocalCache(10, 0.01)
+        local_cache.set("a", Decimal("1"))
+        time.sleep(0.02)
+        self.assertIsNone(local_cache.get("a"))
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
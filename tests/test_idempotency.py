@@ -0,0 +1,66 @@
+import sys
+import os
+import unittest
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import idempotency
+
+
+# Тесты для ключей идемпотентности
+class TestIdempotencyReserve(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def test_duplicate_gets_original_response(self) -> None:
+        """
+        Тест для проверки повторного запроса с тем же ключом.
+        Первый запрос резервирует ключ, повтор получает сохранённый ответ первого запроса.
+        """
+        first = {"status": "queued", "operation_id": "op-1"}
+        second = {"status": "queued", "operation_id": "op-2"}
+
+        self.assertIsNone(await idempotency.reserve(self.redis, "key", "fp", first))
+        stored = await idempotency.reserve(self.redis, "key", "fp", second)
+        self.assertEqual(stored, {"fingerprint": "fp", "response": first})
+
+    async def test_reserve_has_ttl(self) -> None:
+        """
+        Тест для проверки ограниченного времени хранения ключа.
+        """
+        await idempotency.reserve(self.redis, "key", "fp", {})
+        ttl = await self.redis.ttl(idempotency.idempotency_key("key"))
+        self.assertTrue(0 < ttl <= idempotency.IDEMPOTENCY_TTL)
+
+    async def test_release_allows_retry(self) -> None:
+        """
+        Тест для проверки снятия резерва, если операцию не удалось поставить в очередь.
+        """
+        await idempotency.reserve(self.redis, "key", "fp", {"operation_id": "op-1"})
+        await idempotency.release(self.redis, "key")
+        self.assertIsNone(await idempotency.reserve(self.redis, "key", "fp", {"operation_id": "op-2"}))
+
+    async def test_complete_replaces_response(self) -> None:
+        """
+        Тест для проверки замены сохранённого ответа итоговым после синхронного выполнения:
+        срок жизни ключа сохраняется, а снятый резерв не восстанавливается.
+        """
+        await idempotency.reserve(self.redis, "key", "fp", {"status": "processing"})
+        await self.redis.expire(idempotency.idempotency_key("key"), 100)
+        await idempotency.complete(self.redis, "key", "fp", {"status": "completed"})
+
+        stored = await idempotency.reserve(self.redis, "key", "fp", {})
+        self.assertEqual(stored["response"], {"status": "completed"})
+        self.assertTrue(0 < await self.redis.ttl(idempotency.idempotency_key("key")) <= 100)
+
+        await idempotency.release(self.redis, "key")
+        await idempotency.complete(self.redis, "key", "fp", {"status": "completed"})
+        self.assertIsNone(await self.redis.get(idempotency.idempotency_key("key")))
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import sys
+import os
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from known_wallets import KnownWallets
+
+
+@asynccontextmanager
+async def session_factory():
+    yield None
+
+
+# Тесты для фильтра известных кошельков и отрицательного кэша
+class TestKnownWallets(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.known = KnownWallets(self.redis, capacity=1000, error_rate=0.01)
+
+    async def _rebuild(self, wallets: list[str]) -> int | None:
+        """Строит фильтр по списку кошельков, отдавая его постранично вместо БД."""
+        async def get_wallet_uuids(db, after, limit):
+            start = wallets.index(after) + 1 if after is not None else 0
+            return wallets[start:start + limit]
+
+        with patch("known_wallets.get_wallet_uuids", get_wallet_uuids):
+            return await self.known.rebuild(session_factory, batch_size=2)
+
+    async def test_filter_rejects_unknown_wallets(self) -> None:
+        """
+        Тест для проверки фильтра: после построения существующие и созданные кошельки проходят,
+        а подавляющее большинство несуществующих отклоняется.
+        """
+        existing = sorted(str(uuid4()) for _ in range(5))
+        self.assertEqual(await self._rebuild(existing), 5)
+        created = str(uuid4())
+        await self.known.add([created])
+
+        self.assertEqual(await self.known.unknown(existing + [created]), set())
+        strangers = [str(uuid4()) for _ in range(200)]
+        self.assertGreater(len(await self.known.unknown(strangers)), 190)
+        self.assertEqual(self.known.hashes, 7)
+
+    async def test_not_ready_filter_rejects_nothing(self) -> None:
+        """
+        Тест для проверки, что непостроенный (или помеченный непостроенным после ошибки) фильтр
+        ничего не отклоняет, а ошибка Redis пропускает проверку.
+        """
+        stranger = str(uuid4())
+        self.assertEqual(await self.known.unknown([stranger]), set())
+
+        await self._rebuild([])
+        self.assertEqual(await self.known.unknown([stranger]), {stranger})
+        await self.known.invalidate()
+        self.assertEqual(await self.known.unknown([stranger]), set())
+
+        with patch.object(self.redis, "pipeline", side_effect=ConnectionError()):
+            self.assertEqual(await self.known.unknown([stranger]), set())
+
+    async def test_negative_cache(self) -> None:
+        """
+        Тест для проверки отрицательного кэша: кошелёк, не найденный в БД, отклоняется без фильтра,
+        пока не истёк TTL или пока кошелёк не создан.
+        """
+        known = KnownWallets(self.redis, capacity=1000, enabled=False, negative_ttl=10)
+        wallet_uuid = str(uuid4())
+
+        await known.remember_missing([wallet_uuid])
+        self.assertEqual(await known.unknown([wallet_uuid]), {wallet_uuid})
+        self.assertLessEqual(await self.redis.ttl(f"wallet_missing:{wallet_uuid}"), 10)
+
+        await known.add([wallet_uuid])
+        self.assertEqual(await known.unknown([wallet_uuid]), set())
+
+    async def test_single_rebuild(self) -> None:
+        """
+        Тест для проверки, что фильтр одновременно строит только один процесс.
+        """
+        await self.redis.set(self.known.lock_key, 1)
+        get_wallet_uuids = AsyncMock()
+
+        with patch("known_wallets.get_wallet_uuids", get_wallet_uuids):
+            self.assertIsNone(await self.known.rebuild(session_factory))
+        get_wallet_uuids.assert_not_awaited()
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
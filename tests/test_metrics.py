@@ -0,0 +1,91 @@
+import sys
+import os
+import asyncio
+import unittest
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Counter, Gauge, Histogram, Registry, start_http_server, start_http_server_on_free_port
+
+
+# Тесты для метрик в формате Prometheus
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.registry = Registry()
+
+    async def test_histogram_buckets_are_cumulative(self) -> None:
+        """
+        Тест для проверки вывода гистограммы: корзины накопительные, +Inf равна числу наблюдений.
+        """
+        histogram = Histogram("latency_seconds", "Задержка", ("route",), buckets=(0.1, 1.0), registry=self.registry)
+        for value in (0.05, 0.5, 5.0):
+            histogram.labels("/a").observe(value)
+
+        text = await self.registry.render()
+
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{route="/a"} 3', text)
+        self.assertIn("# TYPE latency_seconds histogram", text)
+
+    async def test_collectors_run_before_render(self) -> None:
+        """
+        Тест для проверки сборщиков: значения, читаемые в момент запроса, попадают в вывод.
+        """
+        gauge = Gauge("queue_length", "Длина очереди", registry=self.registry)
+
+        async def collect():
+            gauge.set(42)
+
+        self.registry.add_collector(collect)
+        self.assertIn("queue_length 42", await self.registry.render())
+
+    async def test_label_values_are_escaped(self) -> None:
+        """
+        Тест для проверки экранирования кавычек и обратной косой черты в значениях меток.
+        """
+        counter = Counter("errors_total", "Ошибки", ("reason",), registry=self.registry)
+        counter.labels('bad "value" \\').inc()
+
+        self.assertIn('errors_total{reason="bad \\"value\\" \\\\"} 1', await self.registry.render())
+
+    async def test_worker_exporter(self) -> None:
+        """
+        Тест для проверки HTTP-экспортёра воркера: на запрос отвечает метриками процесса.
+        """
+        server = await start_http_server(0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = (await reader.read()).decode()
+            writer.close()
+        finally:
+            server.close()
+
+        self.assertTrue(response.startswith("HTTP/1.1 200 OK"))
+        self.assertIn("# TYPE worker_operations_total counter", response)
+
+    async def test_exporter_takes_free_port(self) -> None:
+        """
+        Тест для проверки экспортёров процессов API: второй процесс занимает следующий порт,
+        а при занятых портах экспортёр не запускается.
+        """
+        first = await start_http_server(0)
+        port = first.sockets[0].getsockname()[1]
+        second = await start_http_server_on_free_port(port, 2)
+        try:
+            self.assertIsNotNone(second)
+            self.assertEqual(second.sockets[0].getsockname()[1], port + 1)
+            self.assertIsNone(await start_http_server_on_free_port(port, 2))
+        finally:
+            first.close()
+            if second is not None:
+                second.close()
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import sys
+import os
+import unittest
+from uuid import uuid4
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from partitions import PartitionCoordinator, partition_owner
+
+
+# Тесты для распределения партиций между воркерами
+class TestPartitionOwner(unittest.TestCase):
+    def test_each_partition_has_one_owner(self) -> None:
+        """
+        Тест для проверки, что все партиции распределены и каждая — ровно одному воркеру.
+        """
+        members = ["w1", "w2", "w3"]
+        owners = [partition_owner(partition, members) for partition in range(64)]
+        self.assertEqual(set(owners), set(members))
+
+    def test_adding_worker_moves_only_its_partitions(self) -> None:
+        """
+        Тест для проверки rendezvous-хеширования: при добавлении воркера переезжают
+        только партиции, доставшиеся новому воркеру.
+        """
+        before = {partition: partition_owner(partition, ["w1", "w2"]) for partition in range(64)}
+        after = {partition: partition_owner(partition, ["w1", "w2", "w3"]) for partition in range(64)}
+        moved = {partition for partition in before if before[partition] != after[partition]}
+        self.assertTrue(moved)
+        self.assertTrue(all(after[partition] == "w3" for partition in moved))
+
+
+class TestPartitionCoordinator(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def test_live_workers_split_partitions(self) -> None:
+        """
+        Тест для проверки, что живые воркеры делят партиции без пересечений.
+        """
+        first = PartitionCoordinator(self.redis, 16, member_id=str(uuid4()))
+        second = PartitionCoordinator(self.redis, 16, member_id=str(uuid4()))
+        await first.desired_partitions()
+        await second.desired_partitions()
+
+        first_partitions = await first.desired_partitions()
+        second_partitions = await second.desired_partitions()
+        self.assertFalse(first_partitions & second_partitions)
+        self.assertEqual(first_partitions | second_partitions, set(range(16)))
+
+    async def test_lease_is_exclusive(self) -> None:
+        """
+        Тест для проверки аренды партиции: пока прежний владелец её не освободил,
+        новый владелец не может начать чтение.
+        """
+        old_owner = PartitionCoordinator(self.redis, 4, member_id="old")
+        new_owner = PartitionCoordinator(self.redis, 4, member_id="new")
+
+        self.assertTrue(await old_owner.acquire(0))
+        self.assertFalse(await new_owner.acquire(0))
+        self.assertFalse(await new_owner.renew(0))
+
+        await new_owner.release(0)  # Чужую аренду освободить нельзя
+        self.assertFalse(await new_owner.acquire(0))
+
+        await old_owner.release(0)
+        self.assertTrue(await new_owner.acquire(0))
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import sys
+import os
+import asyncio
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import profiling
+from profiling import parameters_shape, ProfilingMiddleware, ProfilingSettings, Trace
+
+
+def busy_handler(seconds: float) -> None:
+    """Занимает поток событийного цикла, чтобы профилировщик успел снять стеки."""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+# Тесты для профилирования и замеров
+class TestProfiling(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        patcher = patch.object(profiling, "settings", ProfilingSettings(0, 0, 0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parameters_shape(self) -> None:
+        """
+        Тест для проверки формы параметров запроса: типы и длины списков без значений.
+        """
+        self.assertEqual(parameters_shape(("secret", Decimal("1.00"), ["a", "b"])), "(str, Decimal, list[2])")
+        self.assertEqual(parameters_shape({"wallet": "secret", "amount": 1}), "{wallet: str, amount: int}")
+        self.assertEqual(parameters_shape([("a", 1), ("b", 2)]), "2 x (str, int)")
+
+    async def test_settings_are_shared(self) -> None:
+        """
+        Тест для проверки изменения настроек без перезапуска: изменение объединяется с сохранёнными
+        настройками, а процесс, запущенный позже, загружает их из Redis.
+        """
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await profiling.publish_settings(redis, {"slow_query_ms": 50})
+        await profiling.publish_settings(redis, {"sample_rate": 0.5})
+
+        profiling.settings = ProfilingSettings(0, 0, 0)
+        await profiling.load_settings(redis)
+
+        self.assertEqual(profiling.settings.as_dict(),
+                         {"sample_rate": 0.5, "slow_query_ms": 50.0, "worker_slow_batch_ms": 0.0})
+
+        profiling.handle_settings_message(profiling.PROFILING_CHANNEL, '{"sample_rate": 0}')
+        self.assertEqual(profiling.settings.sample_rate, 0)
+        self.assertEqual(profiling.settings.slow_query_ms, 50)
+
+    async def test_sampled_request_is_written(self) -> None:
+        """
+        Тест для проверки профилирования запроса: стеки с корневым кадром маршрута
+        дописываются в файл в свёрнутом формате.
+        """
+        profiling.settings.sample_rate = 1
+
+        async def app(scope, receive, send):
+            busy_handler(0.05)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            await ProfilingMiddleware(app, output_dir)({"type": "http", "method": "GET"}, None, None)
+            with open(os.path.join(output_dir, f"profile-{os.getpid()}.folded")) as folded:
+                lines = folded.read().splitlines()
+
+        self.assertTrue(lines)
+        self.assertTrue(all(line.startswith("GET unmatched;") for line in lines))
+        self.assertTrue(any("test_profiling.py:busy_handler" in line for line in lines))
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+
+    async def test_request_not_sampled(self) -> None:
+        """
+        Тест для проверки, что при нулевой доле запросы не профилируются и файлы не создаются.
+        """
+        async def app(scope, receive, send):
+            await asyncio.sleep(0)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            await ProfilingMiddleware(app, output_dir)({"type": "http", "method": "GET"}, None, None)
+            self.assertEqual(os.listdir(output_dir), [])
+
+    def test_slow_batch_is_logged(self) -> None:
+        """
+        Тест для проверки замера этапов: медленная пачка пишется в лог с длительностью каждого этапа,
+        при выключенных замерах этапы не записываются.
+        """
+        self.assertEqual(Trace("batch").enabled, False)
+
+        profiling.settings.worker_slow_batch_ms = 1
+        trace = Trace("worker batch")
+        with trace.stage("apply"):
+            time.sleep(0.005)
+        with self.assertLogs("profiling", "WARNING") as logs:
+            trace.finish(operations=3)
+
+        self.assertEqual([name for name, _ in trace.stages], ["apply"])
+        self.assertIn("apply", logs.output[0])
+        self.assertIn("operations=3", logs.output[0])
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import sys
+import os
+import asyncio
+import unittest
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import queues
+from queues import ListQueue, StreamQueue
+
+
+# Тесты для очередей операций (fakeredis вместо локального Redis)
+class TestListQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.queue = ListQueue(self.redis, "test_queue")
+
+    async def test_pop_drains_batch_in_order(self) -> None:
+        """
+        Тест для проверки пакетного чтения из списка.
+        Сообщения возвращаются в порядке добавления, не больше count за раз.
+        """
+        for i in range(5):
+            await self.queue.push(f"op-{i}")
+
+        batch = await self.queue.pop(3, linger=0.01, timeout=1)
+        self.assertEqual([message.payload for message in batch], ["op-0", "op-1", "op-2"])
+        self.assertEqual(await self.queue.length(), 2)
+
+    async def test_pop_timeout_returns_empty(self) -> None:
+        """
+        Тест для проверки таймаута ожидания пустой очереди.
+        """
+        self.assertEqual(await self.queue.pop(10, linger=0.01, timeout=0.05), [])
+
+
+class TestStreamQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.queue = StreamQueue(self.redis, "test_stream", group="workers", consumer="c1")
+
+    async def test_ack_removes_pending(self) -> None:
+        """
+        Тест для проверки подтверждения сообщений.
+        После XACK сообщение больше не числится в списке ожидающих группы.
+        """
+        await self.queue.push("op-1")
+        batch = await self.queue.pop(10, linger=0.01, timeout=1)
+        self.assertEqual([message.payload for message in batch], ["op-1"])
+
+        pending = await self.redis.xpending("test_stream", "workers")
+        self.assertEqual(pending["pending"], 1)
+        await self.queue.ack(batch)
+        pending = await self.redis.xpending("test_stream", "workers")
+        self.assertEqual(pending["pending"], 0)
+
+    async def test_consumers_share_messages(self) -> None:
+        """
+        Тест для проверки распределения сообщений между потребителями одной группы.
+        Каждое сообщение доставляется ровно одному потребителю.
+        """
+        other = StreamQueue(self.redis, "test_stream", group="workers", consumer="c2")
+        for i in range(4):
+            await self.queue.push(f"op-{i}")
+
+        first = await self.queue.pop(2, linger=0, timeout=1)
+        second = await other.pop(2, linger=0, timeout=1)
+        payloads = [message.payload for message in first + second]
+        self.assertEqual(sorted(payloads), ["op-0", "op-1", "op-2", "op-3"])
+
+    async def test_reclaim_unacked_messages(self) -> None:
+        """
+        Тест для проверки забора сообщений упавшего воркера.
+        Неподтверждённое сообщение после простоя забирается другим потребителем через XAUTOCLAIM.
+        """
+        await self.queue.push("op-1")
+        await self.queue.pop(10, linger=0, timeout=1)  # "Падаем" без ack
+
+        other = StreamQueue(self.redis, "test_stream", group="workers", consumer="c2")
+        original_idle = queues.STREAM_RECLAIM_IDLE_MS
+        queues.STREAM_RECLAIM_IDLE_MS = 10
+        try:
+            await asyncio.sleep(0.02)
+            reclaimed = await other.reclaim(10)
+        finally:
+            queues.STREAM_RECLAIM_IDLE_MS = original_idle
+        self.assertEqual([message.payload for message in reclaimed], ["op-1"])
+
+    async def test_backlog_counts_unread_and_pending(self) -> None:
+        """
+        Тест для проверки лага стрима: учитываются непрочитанные и неподтверждённые сообщения,
+        но не подтверждённые, которые остаются в стриме до обрезки.
+        """
+        self.assertEqual(await self.queue.backlog(), 0)
+        for i in range(5):
+            await self.queue.push(f"op-{i}")
+        acked = await self.queue.pop(2, linger=0, timeout=1)
+        await self.queue.ack(acked)
+        await self.queue.pop(1, linger=0, timeout=1)
+
+        self.assertEqual(await self.queue.length(), 5)
+        self.assertEqual(await self.queue.backlog(), 3)
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
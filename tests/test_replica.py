@@ -0,0 +1,105 @@
+import sys
+import os
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from replica import ReadRouter
+from services import BalanceUpdate
+
+WALLET_UUID = "6f1c2a4e-8b7d-4e0a-9c1b-2d3e4f5a6b7c"
+
+
+class FakeReplicaEngine:
+    """Движок реплики, отвечающий на проверку отставания заданным значением или ошибкой."""
+
+    def __init__(self, lag):
+        self.lag = lag
+        self.checks = 0
+
+    @asynccontextmanager
+    async def connect(self):
+        self.checks += 1
+        await asyncio.sleep(0)
+        if isinstance(self.lag, Exception):
+            raise self.lag
+        connection = MagicMock()
+        connection.execute = AsyncMock(return_value=MagicMock(scalar=MagicMock(return_value=self.lag)))
+        yield connection
+
+
+# Тесты для выбора БД при чтении балансов
+class TestReadRouter(unittest.IsolatedAsyncioTestCase):
+    def _router(self, engine) -> ReadRouter:
+        @asynccontextmanager
+        async def session_factory(name):
+            yield name
+
+        router = ReadRouter(lambda: session_factory("primary"), None, max_lag=1, interval=60)
+        router.replica_engine = engine
+        router.replica_session_factory = lambda: session_factory("replica")
+        return router
+
+    async def _read_from(self, router: ReadRouter, primary: bool = False, get_balances=None) -> str:
+        """Возвращает имя сессии, через которую прочитан баланс."""
+        get_balances = get_balances or AsyncMock(return_value={WALLET_UUID: BalanceUpdate(Decimal("1.00"), 1)})
+        with patch("replica.get_balances", get_balances):
+            await router.get_balances([WALLET_UUID], primary=primary)
+        return get_balances.await_args.args[0]
+
+    async def test_without_replica(self) -> None:
+        """
+        Тест для проверки, что без DATABASE_REPLICA_URL чтения идут в основную БД.
+        """
+        self.assertEqual(await self._read_from(self._router(None)), "primary")
+
+    async def test_replica_within_lag(self) -> None:
+        """
+        Тест для проверки чтения из реплики, отстающей не больше допустимого,
+        и принудительного чтения из основной БД.
+        """
+        router = self._router(FakeReplicaEngine(0.2))
+
+        self.assertEqual(await self._read_from(router), "replica")
+        self.assertEqual(await self._read_from(router, primary=True), "primary")
+
+    async def test_lagging_or_unavailable_replica(self) -> None:
+        """
+        Тест для проверки, что при большом отставании или недоступной реплике чтения идут в основную БД.
+        """
+        self.assertEqual(await self._read_from(self._router(FakeReplicaEngine(5.0))), "primary")
+        self.assertEqual(await self._read_from(self._router(FakeReplicaEngine(OSError("down")))), "primary")
+
+    async def test_replica_read_error_falls_back(self) -> None:
+        """
+        Тест для проверки, что ошибка чтения из реплики повторяется в основной БД,
+        а реплика считается недоступной до следующей проверки.
+        """
+        router = self._router(FakeReplicaEngine(0.0))
+        get_balances = AsyncMock(side_effect=[ConnectionResetError(), {}])
+
+        self.assertEqual(await self._read_from(router, get_balances=get_balances), "primary")
+        self.assertIsNone(router.lag)
+        self.assertFalse(await router.replica_usable())
+
+    async def test_single_check_per_interval(self) -> None:
+        """
+        Тест для проверки, что одновременные чтения ждут одну общую проверку отставания.
+        """
+        engine = FakeReplicaEngine(0.0)
+        router = self._router(engine)
+
+        await asyncio.gather(*(router.replica_usable() for _ in range(10)))
+        await router.replica_usable()
+
+        self.assertEqual(engine.checks, 1)
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+import sys
+import os
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from custom_exceptions import InsufficientFundsError, WalletNotFoundError, DuplicateOperationError
+from database import TimedSessionFactory
+from repository import AsyncpgWalletRepository, SqlAlchemyWalletRepository
+from services import (
+    enable_hot_wallet, get_balance_at, get_wallet_history, process_operations_batch, BalanceUpdate, OperationType
+)
+
+# База с применёнными миграциями Liquibase; без неё тесты реализаций пропускаются
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+class RepositoryContract:
+    """
+    Общие тесты горячего пути: выполняются для каждой реализации WalletRepository.
+    Наследники создают self.repository в make_repository.
+    """
+
+    async def make_repository(self):
+        raise NotImplementedError
+
+    async def asyncSetUp(self) -> None:
+        self.engine = create_async_engine(TEST_DATABASE_URL)
+        self.session_factory = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.repository = await self.make_repository()
+        self.wallet_uuid = (await self.repository.create_wallet(Decimal("100.00")))["wallet_uuid"]
+
+    async def asyncTearDown(self) -> None:
+        await self.repository.close()
+        await self.engine.dispose()
+
+    async def test_deposit_and_withdraw(self) -> None:
+        """
+        Тест для проверки депозита и снятия: баланс и версия увеличиваются с каждой операцией.
+        """
+        deposit = await self.repository.apply_operation(self.wallet_uuid, OperationType.DEPOSIT, Decimal("50.00"))
+        withdraw = await self.repository.apply_operation(self.wallet_uuid, OperationType.WITHDRAW, Decimal("30.00"))
+
+        self.assertEqual(deposit, BalanceUpdate(Decimal("150.00"), 1))
+        self.assertEqual(withdraw, BalanceUpdate(Decimal("120.00"), 2))
+
+    async def test_insufficient_funds(self) -> None:
+        """
+        Тест для проверки снятия суммы больше баланса: ожидается InsufficientFundsError.
+        """
+        with self.assertRaises(InsufficientFundsError):
+            await self.repository.apply_operation(self.wallet_uuid, OperationType.WITHDRAW, Decimal("100.01"))
+
+    async def test_wallet_not_found(self) -> None:
+        """
+        Тест для проверки операции над несуществующим кошельком: ожидается WalletNotFoundError.
+        """
+        with self.assertRaises(WalletNotFoundError):
+            await self.repository.apply_operation(uuid4(), OperationType.DEPOSIT, Decimal("1.00"))
+
+    async def test_duplicate_operation(self) -> None:
+        """
+        Тест для проверки повторной доставки операции: второй раз она не применяется.
+        """
+        operation_id = str(uuid4())
+        await self.repository.apply_operation(self.wallet_uuid, OperationType.DEPOSIT, Decimal("1.00"), operation_id)
+        with self.assertRaises(DuplicateOperationError):
+            await self.repository.apply_operation(self.wallet_uuid, OperationType.DEPOSIT, Decimal("1.00"), operation_id)
+
+    async def test_failed_operation_is_not_marked(self) -> None:
+        """
+        Тест для проверки, что отклонённая операция не отмечается как применённая
+        и её повтор обрабатывается заново.
+        """
+        operation_id = str(uuid4())
+        with self.assertRaises(InsufficientFundsError):
+            await self.repository.apply_operation(self.wallet_uuid, OperationType.WITHDRAW, Decimal("500.00"), operation_id)
+        with self.assertRaises(InsufficientFundsError):
+            await self.repository.apply_operation(self.wallet_uuid, OperationType.WITHDRAW, Decimal("500.00"), operation_id)
+
+    async def test_hot_wallet(self) -> None:
+        """
+        Тест для проверки операции над горячим кошельком: баланс — сумма слотов.
+        """
+        async with self.session_factory() as db_session:
+            await enable_hot_wallet(db_session, self.wallet_uuid, 4)
+
+        result = await self.repository.apply_operation(self.wallet_uuid, OperationType.WITHDRAW, Decimal("60.00"))
+        self.assertEqual(result.balance, Decimal("40.00"))
+        self.assertTrue(result.hot)
+
+    async def test_ledger(self) -> None:
+        """
+        Тест для проверки журнала: начальный баланс и применённые операции записываются в журнал
+        (для горячего кошелька тоже), отклонённые — нет; баланс на текущий момент совпадает с балансом кошелька.
+        """
+        reference = str(uuid4())
+        await self.repository.apply_operation(self.wallet_uuid, OperationType.DEPOSIT, Decimal("5.00"), None, reference)
+        with self.assertRaises(InsufficientFundsError):
+            await self.repository.apply_operation(self.wallet_uuid, OperationType.WITHDRAW, Decimal("500.00"))
+        async with self.session_factory() as db_session:
+            await enable_hot_wallet(db_session, self.wallet_uuid, 2)
+        await self.repository.apply_operation(self.wallet_uuid, OperationType.WITHDRAW, Decimal("15.00"))
+
+        async with self.session_factory() as db_session:
+            history = await get_wallet_history(db_session, str(self.wallet_uuid), None, 10)
+            balance = await get_balance_at(db_session, str(self.wallet_uuid), datetime.utcnow() + timedelta(seconds=1))
+
+        self.assertEqual([(entry["entry_type"], entry["amount"]) for entry in history], [
+            ("WITHDRAW", Decimal("-15.00")), ("DEPOSIT", Decimal("5.00")), ("INITIAL", Decimal("100.00")),
+        ])
+        self.assertEqual(history[1]["operation_id"], reference)
+        self.assertEqual(balance, Decimal("90.00"))
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL is not set")
+class TestSqlAlchemyRepository(RepositoryContract, unittest.IsolatedAsyncioTestCase):
+    async def make_repository(self):
+        return SqlAlchemyWalletRepository(self.session_factory)
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL is not set")
+class TestAsyncpgRepository(RepositoryContract, unittest.IsolatedAsyncioTestCase):
+    async def make_repository(self):
+        return await AsyncpgWalletRepository.connect(TEST_DATABASE_URL, SqlAlchemyWalletRepository(self.session_factory))
+
+
+# Тесты размера пула, на котором выполняются операции (ограничение синхронных операций)
+# Тесты пакетного применения операций на реальной базе
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL is not set")
+class TestProcessOperationsBatch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine = create_async_engine(TEST_DATABASE_URL)
+        self.session_factory = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.repository = SqlAlchemyWalletRepository(self.session_factory)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+
+    async def test_failed_operation_is_retried(self) -> None:
+        """
+        Тест для проверки повтора неудачной операции пачки с тем же идентификатором:
+        после создания кошелька (или пополнения) она применяется, а не отклоняется как дубликат.
+        """
+        wallet_uuid = (await self.repository.create_wallet(Decimal("10.00")))["wallet_uuid"]
+        missing_id, withdraw_id = str(uuid4()), str(uuid4())
+        operations = [
+            (uuid4(), OperationType.DEPOSIT, Decimal("1.00")),
+            (wallet_uuid, OperationType.WITHDRAW, Decimal("15.00")),
+        ]
+        async with self.session_factory() as db_session:
+            results = await process_operations_batch(db_session, operations, [missing_id, withdraw_id])
+        self.assertIsInstance(results[0], WalletNotFoundError)
+        self.assertIsInstance(results[1], InsufficientFundsError)
+
+        await self.repository.apply_operation(wallet_uuid, OperationType.DEPOSIT, Decimal("5.00"))
+        async with self.session_factory() as db_session:
+            results = await process_operations_batch(db_session, operations[1:], [withdraw_id])
+        self.assertEqual(results, [BalanceUpdate(Decimal("0.00"), 2)])
+
+        async with self.session_factory() as db_session:
+            results = await process_operations_batch(db_session, operations[1:], [withdraw_id])
+        self.assertIsInstance(results[0], DuplicateOperationError)
+
+
+class TestPoolSize(unittest.TestCase):
+    def test_pool_size_of_implementation(self) -> None:
+        """
+        Тест для проверки размера пула: у SQLAlchemy — пул движка сессий (и для фабрики с замером
+        ожидания соединения), у asyncpg — собственный пул.
+        """
+        engine = create_async_engine("postgresql+asyncpg://user@localhost/wallets", pool_size=7)
+        sqlalchemy_repository = SqlAlchemyWalletRepository(async_sessionmaker(bind=engine))
+        pool = MagicMock()
+        pool.get_max_size.return_value = 3
+
+        self.assertEqual(sqlalchemy_repository.pool_size, 7)
+        self.assertEqual(SqlAlchemyWalletRepository(TimedSessionFactory(engine)).pool_size, 7)
+        self.assertEqual(AsyncpgWalletRepository(pool, sqlalchemy_repository).pool_size, 3)
+
+
+# Тесты разбора исхода функции wallet_apply_operation без базы данных
+class TestAsyncpgOutcomes(unittest.IsolatedAsyncioTestCase):
+    def _repository(self, outcome: tuple) -> AsyncpgWalletRepository:
+        self.connection = MagicMock()
+        self.connection.fetchrow = AsyncMock(return_value=outcome)
+        pool = MagicMock()
+        pool.acquire.return_value.__aenter__.return_value = self.connection
+        return AsyncpgWalletRepository(pool, MagicMock())
+
+    async def test_single_round_trip(self) -> None:
+        """
+        Тест для проверки, что операция выполняется одним запросом со знаковой суммой.
+        """
+        repository = self._repository(("ok", Decimal("70.00"), 3))
+
+        result = await repository.apply_operation(uuid4(), OperationType.WITHDRAW, Decimal("30.00"))
+
+        self.assertEqual(result, BalanceUpdate(Decimal("70.00"), 3))
+        self.assertEqual(self.connection.fetchrow.await_count, 1)
+        self.assertEqual(self.connection.fetchrow.await_args.args[2], Decimal("-30.00"))
+
+    async def test_failure_reasons(self) -> None:
+        """
+        Тест для проверки, что причина отказа приходит в том же ответе и превращается в исключение.
+        """
+        for outcome, error in (
+                ("insufficient_funds", InsufficientFundsError),
+                ("not_found", WalletNotFoundError),
+                ("duplicate", DuplicateOperationError),
+        ):
+            with self.subTest(outcome=outcome), self.assertRaises(error):
+                await self._repository((outcome, None, None)).apply_operation(
+                    uuid4(), OperationType.DEPOSIT, Decimal("1.00")
+                )
+
+    async def test_hot_wallet_uses_fallback(self) -> None:
+        """
+        Тест для проверки, что операция горячего кошелька передаётся в запасную реализацию.
+        """
+        repository = self._repository(("hot", Decimal("0.00"), 1))
+        repository.fallback.apply_operation = AsyncMock(return_value=BalanceUpdate(Decimal("5.00"), 1, True))
+
+        result = await repository.apply_operation(uuid4(), OperationType.DEPOSIT, Decimal("5.00"))
+
+        self.assertTrue(result.hot)
+        repository.fallback.apply_operation.assert_awaited_once()
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import sys
+import os
+import unittest
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import BalanceCache, LocalCache, cache_key
+from resources import warm_up_cache
+from services import BalanceUpdate
+
+
+# Тесты для прогрева кэша при запуске процесса
+class TestWarmUpCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.local = LocalCache(100, 60)
+        self.balances = BalanceCache(self.redis, self.local)
+
+        @asynccontextmanager
+        async def session_factory():
+            yield MagicMock()
+
+        self.session_factory = session_factory
+
+    async def test_recent_wallets_are_cached(self) -> None:
+        """
+        Тест для проверки прогрева: балансы последних активных кошельков попадают в Redis и L1.
+        """
+        recent = {"w1": BalanceUpdate(Decimal("10.00"), 3), "w2": BalanceUpdate(Decimal("20.00"), 1)}
+        with patch("resources.get_recent_balances", AsyncMock(return_value=recent)):
+            warmed = await warm_up_cache(self.session_factory, self.balances, 10)
+
+        self.assertEqual(warmed, 2)
+        self.assertEqual(await self.redis.get(cache_key("w1")), "3:10.00")
+        self.assertEqual(self.local.get(cache_key("w2")), Decimal("20.00"))
+
+    async def test_newer_cached_balance_is_kept(self) -> None:
+        """
+        Тест для проверки, что прогрев не затирает более свежий баланс, записанный воркером.
+        """
+        await self.redis.set(cache_key("w1"), "5:99.00")
+        recent = {"w1": BalanceUpdate(Decimal("10.00"), 3)}
+        with patch("resources.get_recent_balances", AsyncMock(return_value=recent)):
+            await warm_up_cache(self.session_factory, self.balances, 10)
+
+        self.assertEqual(self.local.get(cache_key("w1")), Decimal("99.00"))
+
+    async def test_disabled(self) -> None:
+        """
+        Тест для проверки, что при CACHE_WARMUP_SIZE=0 база данных не читается.
+        """
+        with patch("resources.get_recent_balances", AsyncMock()) as get_recent_balances:
+            self.assertEqual(await warm_up_cache(self.session_factory, self.balances, 0), 0)
+        get_recent_balances.assert_not_awaited()
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import sys
+import os
+import asyncio
+import json
+import unittest
+from decimal import Decimal
+from uuid import uuid4
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from custom_exceptions import InsufficientFundsError
+from results import ResultStore, ResultWaiter, completed_record, failed_record, STATUS_QUEUED
+
+
+# Тесты для хранилища результатов операций
+class TestResultStore(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.store = ResultStore(self.redis)
+        self.waiter = ResultWaiter()
+        self.operation_id = str(uuid4())
+        self.wallet_uuid = str(uuid4())
+        async with self.redis.pipeline(transaction=False) as pipe:
+            ResultStore.mark_queued(pipe, self.operation_id, self.wallet_uuid)
+            await pipe.execute()
+
+    async def test_failed_record_keeps_error_name(self) -> None:
+        """
+        Тест для проверки записи неудачной операции.
+        В результате сохраняется имя исключения, например InsufficientFundsError.
+        """
+        await self.store.save_many([failed_record(self.operation_id, self.wallet_uuid, InsufficientFundsError())])
+        record = await self.store.get(self.operation_id)
+        self.assertEqual(record["status"], "failed")
+        self.assertEqual(record["error"], "InsufficientFundsError")
+
+    async def test_wait_returns_published_result(self) -> None:
+        """
+        Тест для проверки long-poll ожидания.
+        Ожидание завершается, как только приходит опубликованный результат.
+        """
+        record = completed_record(self.operation_id, self.wallet_uuid, Decimal("15.00"))
+        waiting = asyncio.create_task(self.waiter.wait(self.store, self.operation_id, 5))
+        await asyncio.sleep(0.01)
+        await self.store.save_many([record])
+        self.waiter.handle_message("operation_results", json.dumps(record))
+
+        result = await asyncio.wait_for(waiting, 1)
+        self.assertEqual(result["balance"], "15.00")
+
+    async def test_wait_timeout_returns_queued(self) -> None:
+        """
+        Тест для проверки истечения времени ожидания: возвращается текущий статус queued.
+        """
+        result = await self.waiter.wait(self.store, self.operation_id, 0.05)
+        self.assertEqual(result["status"], STATUS_QUEUED)
+
+    async def test_unknown_operation(self) -> None:
+        """
+        Тест для проверки неизвестной операции: результат отсутствует.
+        """
+        self.assertIsNone(await self.waiter.wait(self.store, str(uuid4()), 0.05))
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
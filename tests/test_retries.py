@@ -0,0 +1,205 @@
+import sys
+import os
+import asyncio
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import asyncpg
+import fakeredis
+from sqlalchemy.exc import OperationalError
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from custom_exceptions import DuplicateOperationError, WalletNotFoundError, InsufficientFundsError
+from queues import QUEUE_NAME, QueueMessage
+from retries import failed_before_commit, is_transient, retry_delay, DeadLetterQueue, RetryScheduler, RETRY_MAX_ATTEMPTS
+from services import BalanceUpdate, OperationType
+from wire import encode_operation
+from worker import OperationHandler
+
+WALLET_UUID = "6f1c2a4e-8b7d-4e0a-9c1b-2d3e4f5a6b7c"
+
+
+class CommitLostRepository:
+    """
+    Горячий путь, отмечающий операции как processed_operation в БД; первая операция фиксируется,
+    но соединение обрывается до ответа на COMMIT.
+    """
+
+    def __init__(self):
+        self.balance = Decimal("0.00")
+        self.processed: set[str] = set()
+        self.connection_lost = True
+
+    async def apply_operation(self, wallet_uuid, operation_type, amount, operation_id=None, reference=None):
+        if operation_id is not None:
+            if operation_id in self.processed:
+                raise DuplicateOperationError("Operation already processed")
+            self.processed.add(operation_id)
+        self.balance += amount
+        if self.connection_lost:
+            self.connection_lost = False
+            raise ConnectionResetError("connection reset during COMMIT")
+        return BalanceUpdate(self.balance, 1)
+
+
+def payload(operation_id: str = "0e9d8c7b-6a5f-4e3d-8c2b-1a0f9e8d7c6b") -> str:
+    return encode_operation(operation_id, WALLET_UUID, OperationType.DEPOSIT, Decimal("10.00"))
+
+
+# Тесты для классификации ошибок воркера
+class TestIsTransient(unittest.TestCase):
+    def test_classification(self) -> None:
+        """
+        Тест для проверки классификации: потеря соединения и конфликт сериализации — временные ошибки,
+        бизнес-ошибки и ошибки в коде — постоянные.
+        """
+        self.assertTrue(is_transient(ConnectionRefusedError()))
+        self.assertTrue(is_transient(OperationalError("SELECT 1", {}, Exception("connection lost"))))
+        self.assertTrue(is_transient(asyncpg.exceptions.SerializationError()))
+        self.assertTrue(is_transient(asyncpg.exceptions.DeadlockDetectedError()))
+        self.assertFalse(is_transient(WalletNotFoundError()))
+        self.assertFalse(is_transient(ValueError()))
+
+    def test_failed_before_commit(self) -> None:
+        """
+        Тест для проверки, зафиксирована ли транзакция: отказ в соединении, таймаут пула и ошибка запроса
+        на сервере — точно нет, обрыв открытого соединения — неизвестно.
+        """
+        self.assertTrue(failed_before_commit(ConnectionRefusedError()))
+        self.assertTrue(failed_before_commit(asyncio.TimeoutError()))
+        self.assertTrue(failed_before_commit(asyncpg.exceptions.DeadlockDetectedError()))
+        self.assertTrue(failed_before_commit(asyncpg.exceptions.TooManyConnectionsError()))
+        self.assertFalse(failed_before_commit(ConnectionResetError()))
+        self.assertFalse(failed_before_commit(asyncpg.exceptions.ConnectionDoesNotExistError()))
+        self.assertFalse(failed_before_commit(asyncpg.exceptions.ConnectionFailureError()))
+
+    def test_backoff(self) -> None:
+        """
+        Тест для проверки экспоненциальной задержки с ограничением сверху.
+        """
+        self.assertEqual(retry_delay(2), retry_delay(1) * 2)
+        self.assertLessEqual(retry_delay(100), 60)
+
+
+# Тесты для отложенных повторов и dead letter
+class TestRetryScheduler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.retries = RetryScheduler(self.redis)
+
+    async def test_due_retry_is_moved_to_queue(self) -> None:
+        """
+        Тест для проверки переноса: наступивший повтор попадает в очередь и удаляется из набора,
+        ненаступивший остаётся в наборе.
+        """
+        first, second = payload(), payload("1e9d8c7b-6a5f-4e3d-8c2b-1a0f9e8d7c6b")
+        await self.retries.schedule([first, second])
+        await self.redis.zadd(self.retries.name, {first: time.time() - 1})
+
+        self.assertEqual(await self.retries.move_due(), 1)
+        self.assertEqual(await self.redis.lrange(QUEUE_NAME, 0, -1), [first])
+        self.assertEqual(await self.redis.zrange(self.retries.name, 0, -1), [second])
+
+    async def test_attempts_exhausted(self) -> None:
+        """
+        Тест для проверки ограничения попыток: после RETRY_MAX_ATTEMPTS повторов операция не откладывается.
+        """
+        for _ in range(RETRY_MAX_ATTEMPTS):
+            self.assertEqual(await self.retries.schedule([payload()]), [])
+
+        self.assertEqual(await self.retries.schedule([payload()]), [payload()])
+
+    async def test_dead_letter_replay(self) -> None:
+        """
+        Тест для проверки повтора из dead letter: операция возвращается в очередь со сброшенным
+        счётчиком попыток, запись удаляется, некорректное сообщение остаётся.
+        """
+        dead_letters = DeadLetterQueue(self.redis)
+        for _ in range(RETRY_MAX_ATTEMPTS):
+            await self.retries.schedule([payload()])
+        await dead_letters.add_many([(payload(), "retries_exhausted", "error"), ("garbage", "invalid_message", "")])
+        valid, invalid = [entry["id"] for entry in await dead_letters.entries(10)]
+
+        result = await dead_letters.replay([valid, invalid, "1-1"])
+
+        self.assertEqual(result, {"replayed": [valid], "invalid": [invalid], "missing": ["1-1"]})
+        self.assertEqual(await self.redis.lrange(QUEUE_NAME, 0, -1), [payload()])
+        self.assertEqual(await self.retries.schedule([payload()]), [])
+        self.assertEqual(await dead_letters.length(), 1)
+
+
+# Тесты для обработки сбоев в воркере
+class TestHandlerFailures(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.handler = OperationHandler(MagicMock(), self.redis, MagicMock())
+
+    async def test_transient_error_is_scheduled(self) -> None:
+        """
+        Тест для проверки временной ошибки: сообщение подтверждается, а операция откладывается для повтора.
+        """
+        self.handler.apply = AsyncMock(side_effect=ConnectionRefusedError())
+
+        self.assertTrue(await self.handler.handle([QueueMessage("", payload())]))
+        self.assertEqual(await self.redis.zrange(self.handler.retries.name, 0, -1), [payload()])
+
+    async def test_permanent_errors_go_to_dead_letter(self) -> None:
+        """
+        Тест для проверки постоянных ошибок: несуществующий кошелёк и некорректное сообщение попадают
+        в dead letter с причиной, недостаток средств — нет.
+        """
+        second = payload("1e9d8c7b-6a5f-4e3d-8c2b-1a0f9e8d7c6b")
+        self.handler.apply = AsyncMock(return_value=[WalletNotFoundError("Wallet not found"), InsufficientFundsError()])
+
+        self.assertTrue(await self.handler.handle([
+            QueueMessage("", payload()), QueueMessage("", second), QueueMessage("", "garbage"),
+        ]))
+
+        entries = await self.handler.dead_letters.entries(10)
+        self.assertEqual(
+            [(entry["payload"], entry["reason"]) for entry in entries],
+            [("garbage", "invalid_message"), (payload(), "WalletNotFoundError")],
+        )
+
+    async def test_retry_of_committed_operation_is_not_applied_twice(self) -> None:
+        """
+        Тест для проверки повтора операции без Idempotency-Key, зафиксированной до разрыва соединения:
+        операция откладывается как после временной ошибки, а повтор отклоняется по operation_id.
+        """
+        repository = CommitLostRepository()
+        handler = OperationHandler(MagicMock(), self.redis, repository)
+
+        self.assertTrue(await handler.handle([QueueMessage("", payload())]))
+        await self.redis.zadd(handler.retries.name, {payload(): time.time() - 1})
+        self.assertEqual(await handler.retries.move_due(), 1)
+        retried = await self.redis.lrange(QUEUE_NAME, 0, -1)
+        self.assertEqual(retried, [payload()])
+
+        self.assertTrue(await handler.handle([QueueMessage("", retried[0])]))
+        self.assertEqual(repository.balance, Decimal("10.00"))
+        self.assertEqual(await handler.dead_letters.length(), 0)
+
+    async def test_batch_failure_is_isolated(self) -> None:
+        """
+        Тест для проверки постоянной ошибки пачки: операции применяются по одной,
+        и в dead letter попадает только сбойная.
+        """
+        second = payload("1e9d8c7b-6a5f-4e3d-8c2b-1a0f9e8d7c6b")
+        self.handler.apply = AsyncMock(side_effect=[
+            ValueError("bad batch"), [BalanceUpdate(Decimal("10.00"), 1)], ValueError("bad operation"),
+        ])
+
+        with patch.object(self.handler, "update_cache", AsyncMock()):
+            self.assertTrue(await self.handler.handle([QueueMessage("", payload()), QueueMessage("", second)]))
+
+        entries = await self.handler.dead_letters.entries(10)
+        self.assertEqual([(entry["payload"], entry["reason"]) for entry in entries], [(second, "permanent_error")])
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -10,9 +10,10 @@ from typing import Any
 # Добавляем корневую папку проекта в sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from services import create_wallet, process_operation, OperationType
+from services import create_wallet, create_wallets, apply_hot_operations, process_operation, process_operations_batch, BalanceUpdate, OperationType, \
+    TransferResult
 from custom_exceptions import WalletCreationError, InvalidOperationTypeError, WalletNotFoundError, \
-    InsufficientFundsError
+    InsufficientFundsError, DuplicateOperationError
 
 
 # Тесты для WalletService
@@ -207,6 +208,267 @@ class TestWalletService(unittest.TestCase):
             await process_operation(mock_session, wallet_uuid, OperationType.WITHDRAW, Decimal("10.00"))
 
 
+class TestProcessOperationsBatch(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def _session(locked_rows: list) -> MagicMock:
+        """
+        Мок сессии: первый execute — SELECT ... FOR UPDATE, второй — UPDATE ... FROM (VALUES ...),
+        третий — INSERT в журнал.
+        """
+        mock_session = MagicMock(spec=AsyncSession)
+        locked = MagicMock()
+        locked.fetchall.return_value = locked_rows
+        mock_session.execute.side_effect = [locked, MagicMock(), MagicMock()]
+        return mock_session
+
+    async def test_batch_keeps_per_wallet_order(self) -> None:
+        """
+        Тест для проверки порядка операций внутри кошелька.
+        Снятие после депозита в той же пачке должно пройти, итоговая дельта — попасть в один UPDATE,
+        а обе операции — в журнал одним INSERT в порядке применения.
+        """
+        wallet_uuid = uuid4()
+        mock_session = self._session([(wallet_uuid, Decimal("0.00"), 5)])
+
+        results = await process_operations_batch(mock_session, [
+            (wallet_uuid, OperationType.DEPOSIT, Decimal("100.00")),
+            (wallet_uuid, OperationType.WITHDRAW, Decimal("30.00")),
+        ])
+
+        self.assertEqual(results, [BalanceUpdate(Decimal("100.00"), 6), BalanceUpdate(Decimal("70.00"), 7)])
+        self.assertEqual(mock_session.execute.call_count, 3)
+        update_params = mock_session.execute.call_args_list[1].args[1]
+        self.assertEqual(update_params["delta_0"], Decimal("70.00"))
+        self.assertEqual(update_params["applied_0"], 2)
+        ledger_params = mock_session.execute.call_args_list[2].args[1]
+        self.assertEqual(ledger_params["entry_types"], ["DEPOSIT", "WITHDRAW"])
+        self.assertEqual(ledger_params["amounts"], [Decimal("100.00"), Decimal("-30.00")])
+
+    async def test_batch_insufficient_funds_partway(self) -> None:
+        """
+        Тест для проверки недостатка средств в середине пачки.
+        Неудачное снятие не должно влиять на соседние операции того же кошелька.
+        """
+        wallet_uuid = uuid4()
+        mock_session = self._session([(wallet_uuid, Decimal("50.00"), 0)])
+
+        results = await process_operations_batch(mock_session, [
+            (wallet_uuid, OperationType.WITHDRAW, Decimal("40.00")),
+            (wallet_uuid, OperationType.WITHDRAW, Decimal("20.00")),
+            (wallet_uuid, OperationType.WITHDRAW, Decimal("10.00")),
+        ])
+
+        self.assertEqual(results[0], BalanceUpdate(Decimal("10.00"), 1))
+        self.assertIsInstance(results[1], InsufficientFundsError)
+        self.assertEqual(results[2], BalanceUpdate(Decimal("0.00"), 2))
+
+    async def test_batch_wallet_not_found(self) -> None:
+        """
+        Тест для проверки операции над несуществующим кошельком.
+        Ожидается WalletNotFoundError в результате, без UPDATE, если применять нечего
+        (второй запрос проверяет, не горячий ли это кошелёк).
+        """
+        mock_session = self._session([])
+
+        results = await process_operations_batch(mock_session, [
+            (uuid4(), OperationType.DEPOSIT, Decimal("10.00")),
+        ])
+
+        self.assertIsInstance(results[0], WalletNotFoundError)
+        self.assertEqual(mock_session.execute.call_count, 2)
+
+    async def test_batch_skips_already_processed(self) -> None:
+        """
+        Тест для проверки защиты от повторного применения.
+        Операция, чей идентификатор уже есть в processed_operation, возвращает DuplicateOperationError,
+        а повтор той же операции внутри пачки тоже считается дубликатом.
+        """
+        wallet_uuid = uuid4()
+        fresh_id, seen_id = str(uuid4()), str(uuid4())
+        mock_session = MagicMock(spec=AsyncSession)
+        locked = MagicMock()
+        locked.fetchall.return_value = [(wallet_uuid, Decimal("0.00"), 0)]
+        marked = MagicMock()
+        marked.fetchall.return_value = [(fresh_id,)]
+        mock_session.execute.side_effect = [locked, marked, MagicMock(), MagicMock()]
+
+        results = await process_operations_batch(
+            mock_session,
+            [
+                (wallet_uuid, OperationType.DEPOSIT, Decimal("10.00")),
+                (wallet_uuid, OperationType.DEPOSIT, Decimal("10.00")),
+                (wallet_uuid, OperationType.DEPOSIT, Decimal("10.00")),
+            ],
+            [fresh_id, seen_id, fresh_id],
+        )
+
+        self.assertEqual(results[0], BalanceUpdate(Decimal("10.00"), 1))
+        self.assertIsInstance(results[1], DuplicateOperationError)
+        self.assertIsInstance(results[2], DuplicateOperationError)
+        # В журнал попадает только применённая операция
+        self.assertEqual(mock_session.execute.call_args_list[3].args[1]["operation_ids"], [fresh_id])
+
+    async def test_batch_transfers_lock_in_wallet_order(self) -> None:
+        """
+        Тест для проверки встречных переводов в одной пачке.
+        Оба кошелька блокируются одним запросом в порядке wallet_uuid, а второй перевод
+        видит результат первого. Каждый перевод записывается в журнал двумя строками.
+        """
+        first, second = sorted([uuid4(), uuid4()], key=str)
+        mock_session = self._session([(first, Decimal("10.00"), 1), (second, Decimal("0.00"), 1)])
+
+        results = await process_operations_batch(mock_session, [
+            (first, OperationType.TRANSFER, Decimal("10.00"), second),
+            (second, OperationType.TRANSFER, Decimal("4.00"), first),
+        ], references=["op-1", "op-2"])
+
+        self.assertEqual(results, [
+            TransferResult(BalanceUpdate(Decimal("0.00"), 2), BalanceUpdate(Decimal("10.00"), 2)),
+            TransferResult(BalanceUpdate(Decimal("6.00"), 3), BalanceUpdate(Decimal("4.00"), 3)),
+        ])
+        self.assertEqual(mock_session.execute.call_args_list[0].args[1]["wallet_ids"], [str(first), str(second)])
+        ledger_params = mock_session.execute.call_args_list[2].args[1]
+        self.assertEqual(ledger_params["wallet_uuids"], [str(first), str(second), str(second), str(first)])
+        self.assertEqual(ledger_params["amounts"], [Decimal("-10.00"), Decimal("10.00"), Decimal("-4.00"), Decimal("4.00")])
+        self.assertEqual(ledger_params["counterparty_uuids"], [str(second), str(first), str(first), str(second)])
+        self.assertEqual(ledger_params["operation_ids"], ["op-1", "op-1", "op-2", "op-2"])
+
+    async def test_batch_transfer_errors(self) -> None:
+        """
+        Тест для проверки ошибок перевода: недостаточно средств, перевод на тот же кошелёк,
+        несуществующий получатель. Балансы при этом не меняются.
+        """
+        source, target = uuid4(), uuid4()
+        mock_session = self._session([(source, Decimal("10.00"), 0), (target, Decimal("0.00"), 0)])
+
+        results = await process_operations_batch(mock_session, [
+            (source, OperationType.TRANSFER, Decimal("20.00"), target),
+            (source, OperationType.TRANSFER, Decimal("1.00"), source),
+            (source, OperationType.TRANSFER, Decimal("1.00"), uuid4()),
+        ])
+
+        self.assertIsInstance(results[0], InsufficientFundsError)
+        self.assertIsInstance(results[1], InvalidOperationTypeError)
+        self.assertIsInstance(results[2], WalletNotFoundError)
+        self.assertEqual(mock_session.execute.call_count, 2)
+
+    async def test_batch_unmarks_failed_operations(self) -> None:
+        """
+        Тест для проверки отметок неудачных операций.
+        Отметка отклонённой операции снимается в той же транзакции, отметка применённой остаётся.
+        """
+        wallet_uuid = uuid4()
+        applied_id, failed_id = str(uuid4()), str(uuid4())
+        mock_session = MagicMock(spec=AsyncSession)
+        locked = MagicMock()
+        locked.fetchall.return_value = [(wallet_uuid, Decimal("10.00"), 0)]
+        marked = MagicMock()
+        marked.fetchall.return_value = [(applied_id,), (failed_id,)]
+        mock_session.execute.side_effect = [locked, marked, MagicMock(), MagicMock(), MagicMock()]
+
+        results = await process_operations_batch(
+            mock_session,
+            [
+                (wallet_uuid, OperationType.WITHDRAW, Decimal("5.00")),
+                (wallet_uuid, OperationType.WITHDRAW, Decimal("50.00")),
+            ],
+            [applied_id, failed_id],
+        )
+
+        self.assertEqual(results[0], BalanceUpdate(Decimal("5.00"), 1))
+        self.assertIsInstance(results[1], InsufficientFundsError)
+        unmark = mock_session.execute.call_args_list[3]
+        self.assertIn("DELETE FROM processed_operation", str(unmark.args[0]))
+        self.assertEqual(unmark.args[1]["operation_ids"], [failed_id])
+
+
+
+class TestCreateWallets(unittest.IsolatedAsyncioTestCase):
+    async def test_create_wallets_single_insert(self) -> None:
+        """
+        Тест для проверки пакетного создания кошельков одним INSERT.
+        """
+        mock_session = MagicMock(spec=AsyncSession)
+        inserted = MagicMock()
+        inserted.fetchall.return_value = [(uuid4(), Decimal("1.00")), (uuid4(), Decimal("2.00"))]
+        mock_session.execute.return_value = inserted
+
+        wallets = await create_wallets(mock_session, [Decimal("1.00"), Decimal("2.00")])
+
+        self.assertEqual([wallet["balance"] for wallet in wallets], [Decimal("1.00"), Decimal("2.00")])
+        self.assertEqual(mock_session.execute.call_count, 1)
+
+    async def test_create_wallets_partial_failure(self) -> None:
+        """
+        Тест для проверки ошибки, если база вернула меньше кошельков, чем запрошено.
+        """
+        mock_session = MagicMock(spec=AsyncSession)
+        inserted = MagicMock()
+        inserted.fetchall.return_value = [(uuid4(), Decimal("1.00"))]
+        mock_session.execute.return_value = inserted
+
+        with self.assertRaises(WalletCreationError):
+            await create_wallets(mock_session, [Decimal("1.00"), Decimal("2.00")])
+
+
+
+class TestHotWalletOperations(unittest.IsolatedAsyncioTestCase):
+    async def test_deposits_go_to_one_slot(self) -> None:
+        """
+        Тест для проверки депозитов горячего кошелька.
+        Все депозиты пачки добавляются в один слот одним запросом, блокировка всех слотов не нужна.
+        """
+        mock_session = MagicMock(spec=AsyncSession)
+        changed = MagicMock()
+        changed.fetchone.return_value = (Decimal("130.00"),)
+        mock_session.execute.return_value = changed
+
+        results = await apply_hot_operations(mock_session, uuid4(), 4, 7, [
+            (OperationType.DEPOSIT, Decimal("10.00")),
+            (OperationType.DEPOSIT, Decimal("20.00")),
+        ])
+
+        self.assertEqual(results, [BalanceUpdate(Decimal("110.00"), 7, True), BalanceUpdate(Decimal("130.00"), 7, True)])
+        self.assertEqual(mock_session.execute.call_count, 1)
+        self.assertEqual(mock_session.execute.call_args.args[1]["delta"], Decimal("30.00"))
+
+    async def test_withdraw_falls_back_to_all_slots(self) -> None:
+        """
+        Тест для проверки снятия, которому не хватило средств в случайном слоте.
+        Блокируются все слоты, снятие проверяется по их сумме, остаток распределяется поровну.
+        """
+        mock_session = MagicMock(spec=AsyncSession)
+        slot_update = MagicMock()
+        slot_update.fetchone.return_value = None
+        locked = MagicMock()
+        locked.fetchall.return_value = [(Decimal("5.00"),), (Decimal("3.00"),), (Decimal("2.00"),)]
+        mock_session.execute.side_effect = [slot_update, locked, MagicMock()]
+
+        results = await apply_hot_operations(mock_session, uuid4(), 3, 1, [(OperationType.WITHDRAW, Decimal("6.00"))])
+
+        self.assertEqual(results, [BalanceUpdate(Decimal("4.00"), 1, True)])
+        spread_params = mock_session.execute.call_args_list[2].args[1]
+        self.assertEqual(spread_params["share"], Decimal("1.33"))
+        self.assertEqual(spread_params["first"], Decimal("1.34"))
+
+    async def test_withdraw_insufficient_total(self) -> None:
+        """
+        Тест для проверки снятия больше суммы всех слотов: ожидается InsufficientFundsError.
+        """
+        mock_session = MagicMock(spec=AsyncSession)
+        locked = MagicMock()
+        locked.fetchall.return_value = [(Decimal("5.00"),), (Decimal("5.00"),)]
+        mock_session.execute.side_effect = [locked, MagicMock()]
+
+        results = await apply_hot_operations(mock_session, uuid4(), 2, 1, [
+            (OperationType.WITHDRAW, Decimal("4.00")),
+            (OperationType.WITHDRAW, Decimal("7.00")),
+        ])
+
+        self.assertEqual(results[0], BalanceUpdate(Decimal("6.00"), 1, True))
+        self.assertIsInstance(results[1], InsufficientFundsError)
+
+
 # Запуск тестов
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,111 @@
+import sys
+import os
+import unittest
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import idempotency
+from results import ResultStore
+from routers import execute_operation
+from services import OperationType
+from sync_mode import LatencyBudget, SYNC_LATENCY_SMOOTHING
+
+
+# Тесты для бюджета задержки синхронных операций
+class TestLatencyBudget(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 100.0
+        patcher = patch("sync_mode.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.budget = LatencyBudget(budget=0.05, max_in_flight=2, decay=1.0)
+
+    def test_in_flight_limit(self) -> None:
+        """
+        Тест для проверки ограничения числа одновременных синхронных операций:
+        сверх max_in_flight операции уходят в очередь, освобождённое место занимается снова.
+        """
+        self.assertTrue(self.budget.try_acquire())
+        self.assertTrue(self.budget.try_acquire())
+        self.assertFalse(self.budget.try_acquire())
+
+        self.budget.release()
+        self.assertTrue(self.budget.try_acquire())
+        self.assertEqual(self.budget.in_flight, 2)
+
+    def test_over_budget_falls_back_to_queue(self) -> None:
+        """
+        Тест для проверки перехода в очередь: после медленных операций сглаженная длительность
+        превышает бюджет, и место синхронной операции не выдаётся.
+        """
+        self.budget.observe(0.01)
+        self.assertAlmostEqual(self.budget.latency, 0.01 * SYNC_LATENCY_SMOOTHING)
+        self.assertTrue(self.budget.try_acquire())
+        self.budget.release()
+
+        for _ in range(5):
+            self.budget.observe(1.0)
+        self.assertGreater(self.budget.latency, self.budget.budget)
+        self.assertFalse(self.budget.try_acquire())
+        self.assertEqual(self.budget.in_flight, 0)
+
+    def test_latency_decays_without_observations(self) -> None:
+        """
+        Тест для проверки возврата к синхронному выполнению: без новых замеров оценка
+        длительности затухает, и после перегрузки операция снова выполняется сразу.
+        """
+        for _ in range(5):
+            self.budget.observe(1.0)
+        self.assertFalse(self.budget.try_acquire())
+
+        self.now += 5.0
+        self.assertLess(self.budget.latency, self.budget.budget)
+        self.assertTrue(self.budget.try_acquire())
+
+
+# Тесты для сбоев синхронного выполнения операции
+class TestExecuteOperationFailures(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        self.repository = MagicMock()
+
+    async def _execute(self, error: Exception) -> None:
+        self.repository.apply_operation = AsyncMock(side_effect=error)
+        with self.assertRaises(type(error)):
+            await execute_operation(
+                self.redis, self.repository, MagicMock(), MagicMock(), LatencyBudget(1), uuid4(),
+                OperationType.WITHDRAW, Decimal("1.00"), "key",
+            )
+
+    async def test_failure_before_commit_releases_key(self) -> None:
+        """
+        Тест для проверки сбоя до фиксации транзакции (отказ в соединении): резерв ключа идемпотентности
+        снимается, и повтор выполняется заново, а не получает processing.
+        """
+        await self._execute(ConnectionRefusedError())
+
+        self.assertIsNone(await self.redis.get(idempotency.idempotency_key("key")))
+
+    async def test_unknown_commit_outcome_is_failed(self) -> None:
+        """
+        Тест для проверки обрыва соединения посреди транзакции: повтор с тем же ключом и статус операции
+        получают failed с именем ошибки.
+        """
+        await self._execute(ConnectionResetError())
+
+        stored = await idempotency.reserve(self.redis, "key", "", {})
+        self.assertEqual(stored["response"]["status"], "failed")
+        self.assertEqual(stored["response"]["error"], "ConnectionResetError")
+        record = await ResultStore(self.redis).get(stored["response"]["operation_id"])
+        self.assertEqual(record, stored["response"])
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+import json
+import unittest
+from decimal import Decimal
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import OperationType
+from wire import decode_operation, encode_operation, QueuedOperation
+
+WALLET_UUID = "6f1c2a4e-8b7d-4e0a-9c1b-2d3e4f5a6b7c"
+TARGET_UUID = "1a2b3c4d-5e6f-4a0b-8c1d-2e3f4a5b6c7d"
+OPERATION_ID = "0e9d8c7b-6a5f-4e3d-8c2b-1a0f9e8d7c6b"
+
+
+# Тесты для формата сообщений очереди операций
+class TestWireFormat(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        """
+        Тест для проверки кодирования и разбора операции: сумма передаётся в копейках без потерь.
+        """
+        payload = encode_operation(OPERATION_ID, WALLET_UUID, OperationType.WITHDRAW, Decimal("1234.56"), "key|1")
+
+        self.assertEqual(payload, f"3|{OPERATION_ID}|{WALLET_UUID}|W|123456||key|1")
+        self.assertEqual(
+            decode_operation(payload),
+            QueuedOperation(WALLET_UUID, OperationType.WITHDRAW, Decimal("1234.56"), OPERATION_ID, "key|1"),
+        )
+
+    def test_optional_fields(self) -> None:
+        """
+        Тест для проверки пустых полей: операция без ключа идемпотентности.
+        """
+        operation = decode_operation(encode_operation(OPERATION_ID, WALLET_UUID, OperationType.DEPOSIT, Decimal("0.50")))
+
+        self.assertEqual(operation.amount, Decimal("0.50"))
+        self.assertIsNone(operation.idempotency_key)
+        self.assertEqual(operation.dedupe_id, OPERATION_ID)
+
+    def test_transfer(self) -> None:
+        """
+        Тест для проверки перевода: кошелёк-получатель передаётся отдельным полем.
+        """
+        payload = encode_operation(OPERATION_ID, WALLET_UUID, OperationType.TRANSFER, Decimal("5.00"), None, TARGET_UUID)
+
+        self.assertEqual(
+            decode_operation(payload),
+            QueuedOperation(WALLET_UUID, OperationType.TRANSFER, Decimal("5.00"), OPERATION_ID, None, TARGET_UUID),
+        )
+
+    def test_version_2_message(self) -> None:
+        """
+        Тест для проверки разбора сообщений версии 2 (без кошелька-получателя), поставленных до обновления.
+        """
+        self.assertEqual(
+            decode_operation(f"2|{OPERATION_ID}|{WALLET_UUID}|D|1000|key|1"),
+            QueuedOperation(WALLET_UUID, OperationType.DEPOSIT, Decimal("10.00"), OPERATION_ID, "key|1"),
+        )
+
+    def test_legacy_json_message(self) -> None:
+        """
+        Тест для проверки разбора JSON-сообщений, поставленных в очередь до смены формата.
+        """
+        payload = json.dumps({"wallet_uuid": WALLET_UUID, "operation_type": "DEPOSIT", "amount": "10.00"})
+
+        self.assertEqual(
+            decode_operation(payload),
+            QueuedOperation(WALLET_UUID, OperationType.DEPOSIT, Decimal("10.00")),
+        )
+
+    def test_invalid_messages(self) -> None:
+        """
+        Тест для проверки некорректных сообщений: неизвестный тип операции, версия или число полей,
+        перевод без получателя.
+        """
+        for payload in (
+                f"2|{OPERATION_ID}|{WALLET_UUID}|X|100|",
+                f"3|{OPERATION_ID}|{WALLET_UUID}|D|100|",
+                f"4|{OPERATION_ID}|{WALLET_UUID}|D|100||",
+                f"3|{OPERATION_ID}|{WALLET_UUID}|T|100||",
+                f"2|{OPERATION_ID}|{WALLET_UUID}|T|100|",
+                f"2|{OPERATION_ID}|{WALLET_UUID}|D",
+                json.dumps({"wallet_uuid": WALLET_UUID, "operation_type": "REFUND", "amount": "1.00"}),
+        ):
+            with self.subTest(payload=payload):
+                self.assertIsNone(decode_operation(payload))
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
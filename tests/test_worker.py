@@ -0,0 +1,174 @@
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis
+
+# Добавляем корневую папку проекта в sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from queues import QueueMessage
+import worker
+from worker import consume_queue, parse_args, run_until_stopped, OperationHandler, ThroughputMeter
+
+
+class FakeQueue:
+    """Очередь, отдающая одну пачку сообщений и запоминающая подтверждённые."""
+
+    def __init__(self, messages: list[QueueMessage]):
+        self.messages = messages
+        self.acked: list[QueueMessage] = []
+
+    async def pop(self, count: int, linger: float, timeout: float = 0) -> list[QueueMessage]:
+        messages, self.messages = self.messages, []
+        if not messages:
+            await asyncio.sleep(timeout)
+        return messages
+
+    async def reclaim(self, count: int) -> list[QueueMessage]:
+        return []
+
+    async def ack(self, messages: list[QueueMessage]) -> None:
+        self.acked.extend(messages)
+
+
+class SlowHandler:
+    """Обработчик, который держит пачку до сигнала release."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def handle(self, messages: list[QueueMessage], received_at: float | None = None) -> bool:
+        self.started.set()
+        await self.release.wait()
+        return True
+
+
+# Тесты для остановки воркера
+class TestGracefulDrain(unittest.IsolatedAsyncioTestCase):
+    def _consume(self, queue: FakeQueue, handler: SlowHandler, stop: asyncio.Event) -> asyncio.Task:
+        return asyncio.create_task(consume_queue(
+            queue, handler, ThroughputMeter(float("inf")), asyncio.Semaphore(1), stop
+        ))
+
+    async def test_in_flight_batch_is_finished(self) -> None:
+        """
+        Тест для проверки остановки: после stop новые сообщения не забираются,
+        а полученная пачка дообрабатывается и подтверждается.
+        """
+        queue = FakeQueue([QueueMessage("1", "payload")])
+        handler = SlowHandler()
+        stop = asyncio.Event()
+        consumers = self._consume(queue, handler, stop)
+        running = asyncio.create_task(run_until_stopped(consumers, stop, drain_timeout=5))
+
+        await asyncio.wait_for(handler.started.wait(), 1)
+        stop.set()
+        await asyncio.sleep(0.01)
+        self.assertFalse(running.done())
+        handler.release.set()
+        await asyncio.wait_for(running, 1)
+
+        self.assertEqual([message.id for message in queue.acked], ["1"])
+
+    async def test_drain_timeout_cancels(self) -> None:
+        """
+        Тест для проверки предела ожидания: пачка, не завершившаяся за drain_timeout, отменяется
+        и не подтверждается.
+        """
+        queue = FakeQueue([QueueMessage("1", "payload")])
+        handler = SlowHandler()
+        stop = asyncio.Event()
+        consumers = self._consume(queue, handler, stop)
+
+        await asyncio.wait_for(handler.started.wait(), 1)
+        stop.set()
+        await asyncio.wait_for(run_until_stopped(consumers, stop, drain_timeout=0.05), 1)
+
+        self.assertTrue(consumers.cancelled())
+        self.assertEqual(queue.acked, [])
+
+
+# Тесты для некорректных сообщений очереди
+class TestCorruptMessages(unittest.IsolatedAsyncioTestCase):
+    async def test_corrupt_payloads_go_to_dead_letter(self) -> None:
+        """
+        Тест для проверки некорректных сообщений (сумма не число, битый JSON, JSON без кошелька):
+        воркер не падает, сообщения подтверждаются и попадают в dead letter как invalid_message.
+        """
+        corrupt = [
+            "3|a|b|D|xx||",
+            "{bad",
+            '{"operation_type": "DEPOSIT", "amount": "1.00"}',
+        ]
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        handler = OperationHandler(MagicMock(), redis, MagicMock())
+        handler.apply = AsyncMock()
+        queue = FakeQueue([QueueMessage(str(i), message) for i, message in enumerate(corrupt)])
+        stop = asyncio.Event()
+        consumer = asyncio.create_task(consume_queue(
+            queue, handler, ThroughputMeter(float("inf")), asyncio.Semaphore(1), stop
+        ))
+
+        for _ in range(100):
+            if queue.acked:
+                break
+            await asyncio.sleep(0.01)
+        stop.set()
+        await asyncio.wait_for(consumer, 5)
+
+        self.assertEqual([message.id for message in queue.acked], ["0", "1", "2"])
+        handler.apply.assert_not_awaited()
+        entries = await handler.dead_letters.entries(10)
+        self.assertEqual(
+            [(entry["payload"], entry["reason"]) for entry in entries],
+            [(message, "invalid_message") for message in corrupt],
+        )
+
+
+# Тесты для флагов командной строки воркера
+class TestParseArgs(unittest.TestCase):
+    def test_processes(self) -> None:
+        """
+        Тест для проверки параметров процессов: у каждого процесса свой порт метрик,
+        без uvloop используется asyncio.
+        """
+        with patch.object(worker, "uvloop", None), patch.object(worker, "WORKER_METRICS_PORT", 9100), \
+                patch.object(worker, "QUEUE_PARTITIONS", 16):
+            settings = parse_args(["--processes", "3", "--concurrency", "4"])
+
+        self.assertEqual([process.metrics_port for process in settings], [9100, 9101, 9102])
+        self.assertEqual({(process.processes, process.concurrency, process.event_loop) for process in settings},
+                         {(3, 4, "asyncio")})
+
+    def test_invalid_flags(self) -> None:
+        """
+        Тест для проверки ошибок: неположительное число процессов и uvloop без установленного пакета.
+        """
+        with patch.object(worker, "uvloop", None), patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                parse_args(["--processes", "0"])
+            with self.assertRaises(SystemExit):
+                parse_args(["--loop", "uvloop"])
+
+    def test_single_partition(self) -> None:
+        """
+        Тест для проверки одной партиции: несколько процессов читали бы одну очередь без аренды,
+        поэтому такой запуск отклоняется, а concurrency не может превышать число партиций.
+        """
+        with patch.object(worker, "QUEUE_PARTITIONS", 1), patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                parse_args(["--processes", "2"])
+            with self.assertRaises(SystemExit):
+                parse_args(["--concurrency", "2"])
+            settings = parse_args(["--processes", "1", "--concurrency", "0"])
+
+        self.assertEqual([(process.processes, process.concurrency) for process in settings], [(1, 1)])
+
+
+# Запуск тестов
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+from services import OperationType
+
+
+logger = logging.getLogger(__name__)
+
+# Формат сообщения очереди операций (версия 3) — одна строка с полями через "|":
+#
+#     3|<operation_id>|<wallet_uuid>|<тип: D, W или T>|<сумма в копейках>|<кошелёк-получатель>|<Idempotency-Key>
+#
+# Ключ идемпотентности идёт последним, поэтому может содержать "|"; пустые поля — отсутствующие
+# значения (кошелёк-получатель задан только у перевода). Сообщения версии 2 (без получателя)
+# и версии 1 (JSON-объект), поставленные до обновления, по-прежнему разбираются.
+WIRE_VERSION = "3"
+SEPARATOR = "|"
+# Число полей сообщения для каждой поддерживаемой версии строкового формата
+FIELD_COUNTS = {"2": 6, "3": 7}
+
+OPERATION_CODES = {OperationType.DEPOSIT: "D", OperationType.WITHDRAW: "W", OperationType.TRANSFER: "T"}
+OPERATION_TYPES = {code: operation_type for operation_type, code in OPERATION_CODES.items()}
+
+
+class QueuedOperation(NamedTuple):
+    """Операция из очереди; operation_id отсутствует у сообщений, поставленных до его появления."""
+    wallet_uuid: str
+    operation_type: OperationType
+    amount: Decimal
+    operation_id: str | None = None
+    idempotency_key: str | None = None
+    # Кошелёк-получатель (только для TRANSFER)
+    target_uuid: str | None = None
+
+    @property
+    def dedupe_id(self) -> str | None:
+        """
+        Идентификатор для защиты от повторного применения. Отмечается каждая операция, а не только
+        с Idempotency-Key: после разрыва соединения итог COMMIT неизвестен, и повтор операции
+        (см. retries.RetryScheduler) не должен применить её второй раз.
+        """
+        return self.operation_id
+
+
+def to_minor_units(amount: Decimal) -> int:
+    """Сумма в копейках; суммы операций проверяются роутером на два знака после запятой."""
+    return int(amount.scaleb(2))
+
+
+def encode_operation(
+        operation_id: str,
+        wallet_uuid: str,
+        operation_type: OperationType,
+        amount: Decimal,
+        idempotency_key: str | None = None,
+        target_uuid: str | None = None,
+) -> str:
+    """Кодирует операцию в сообщение очереди текущей версии."""
+    return SEPARATOR.join((
+        WIRE_VERSION, operation_id, wallet_uuid, OPERATION_CODES[operation_type],
+        str(to_minor_units(amount)), target_uuid or "", idempotency_key or "",
+    ))
+
+
+def decode_operation(payload: str) -> QueuedOperation | None:
+    """
+    Разбирает сообщение очереди в QueuedOperation без промежуточного словаря.
+    Возвращает None, если сообщение некорректно (версия формата, тип операции, сумма, поля JSON):
+    воркер отправляет такое сообщение в dead letter, а не падает на нём.
+    """
+    try:
+        if payload.startswith("{"):
+            return _decode_json_operation(payload)
+        return _decode_string_operation(payload)
+    except (ValueError, KeyError, TypeError, json.JSONDecodeError, InvalidOperation) as e:
+        logger.error("Invalid operation message %s: %r", payload, e)
+        return None
+
+
+def _decode_string_operation(payload: str) -> QueuedOperation | None:
+    """Разбирает сообщение строкового формата (версии 2 и 3)."""
+    version = payload[:payload.find(SEPARATOR)]
+    field_count = FIELD_COUNTS.get(version)
+    fields = payload.split(SEPARATOR, field_count - 1) if field_count else ()
+    if len(fields) != field_count:
+        logger.error("Invalid operation message: %s", payload)
+        return None
+    if field_count == 6:
+        _, operation_id, wallet_uuid, code, amount, idempotency_key = fields
+        target_uuid = ""
+    else:
+        _, operation_id, wallet_uuid, code, amount, target_uuid, idempotency_key = fields
+    operation_type = OPERATION_TYPES.get(code)
+    if operation_type is None or (operation_type == OperationType.TRANSFER) != bool(target_uuid):
+        logger.error("Invalid operation message: %s", payload)
+        return None
+    return QueuedOperation(
+        wallet_uuid, operation_type, Decimal(int(amount)).scaleb(-2),
+        operation_id or None, idempotency_key or None, target_uuid or None,
+    )
+
+
+def _decode_json_operation(payload: str) -> QueuedOperation | None:
+    """Разбирает сообщение версии 1 (JSON-объект)."""
+    data = json.loads(payload)
+
+    # Преобразуем строковое представление типа операции в OperationType Enum
+    try:
+        operation_type = OperationType(data["operation_type"])
+    except ValueError:
+        logger.error("Invalid operation type: %s", data["operation_type"])
+        return None
+
+    # Преобразуем сумму в Decimal для точных расчётов
+    return QueuedOperation(
+        data["wallet_uuid"], operation_type, Decimal(data["amount"]),
+        data.get("operation_id"), data.get("idempotency_key"), data.get("target_uuid"),
+    )